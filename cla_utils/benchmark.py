@@ -0,0 +1,615 @@
+"""
+Benchmark suite for the cla_utils kernels.
+
+Each benchmark is a setup function, registered with the benchmark
+decorator, which builds the inputs for a problem of size m and returns
+the kernel to time together with its arguments. The suite sweeps over
+sizes, repeats each run after some warm-up runs, and records the
+median and interquartile range of the run times, plus a GFLOP/s rate
+where a flop count is known and a rate in items (e.g. matrices) per
+second where the number of independent problems per call is known.
+Results are plain dictionaries that can be written to JSON and compared
+between commits, e.g.::
+
+    python -m cla_utils.benchmark run -o before.json
+    python -m cla_utils.benchmark run -o after.json
+    python -m cla_utils.benchmark compare before.json after.json
+
+The compare command exits with a nonzero status if any kernel has
+slowed down by more than the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+import numpy.random as random
+import cla_utils
+
+BENCHMARKS = {}
+
+
+class Benchmark(object):
+    """
+    A registered benchmark.
+
+    :param name: the name of the benchmark
+    :param setup: a function taking the problem size m and returning \
+    a tuple (kernel, args)
+    :param sizes: the default list of problem sizes
+    :param flops: a function taking m and returning the number of \
+    floating point operations for one call, or None if unknown
+    :param items: a function taking m and returning the number of \
+    independent problems solved in one call, or None
+    """
+
+    def __init__(self, name, setup, sizes, flops=None, items=None):
+        self.name = name
+        self.setup = setup
+        self.sizes = list(sizes)
+        self.flops = flops
+        self.items = items
+
+
+def benchmark(name, sizes, flops=None, items=None):
+    """
+    Decorator registering a setup function as a benchmark, see
+    Benchmark for the meaning of the arguments.
+    """
+
+    def decorator(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, sizes, flops, items)
+        return setup
+    return decorator
+
+
+def _fresh(args):
+    """
+    Return a copy of args in which numpy arrays are copied, so that
+    in-place kernels see the same input on every run.
+    """
+
+    return tuple(a.copy() if isinstance(a, np.ndarray) else a for a in args)
+
+
+def time_kernel(kernel, args, repeat=7, warmup=1):
+    """
+    Time a kernel, excluding the time spent copying its inputs.
+
+    :param kernel: the function to time
+    :param args: tuple of arguments to pass to the kernel
+    :param repeat: integer, the number of timed runs
+    :param warmup: integer, the number of untimed runs before timing
+
+    :return times: a repeat dimensional numpy array of run times in seconds
+    """
+
+    for i in range(warmup):
+        kernel(*_fresh(args))
+    times = np.zeros(repeat)
+    for i in range(repeat):
+        a = _fresh(args)
+        t0 = time.perf_counter()
+        kernel(*a)
+        times[i] = time.perf_counter() - t0
+    return times
+
+
+def summarise(times, flops=None, items=None):
+    """
+    Summarise an array of run times.
+
+    :param times: numpy array of run times in seconds
+    :param flops: the number of floating point operations in one run, \
+    or None
+    :param items: the number of independent problems solved in one run, \
+    or None
+
+    :return summary: a dictionary with the median, interquartile range, \
+    GFLOP/s (or None), items per second (or None) and the raw times
+    """
+
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    gflops = None
+    if flops is not None and median > 0:
+        gflops = flops/median/1.0e9
+    rate = None
+    if items is not None and median > 0:
+        rate = items/median
+    return {"median": float(median), "iqr": float(q3 - q1),
+            "gflops": gflops, "rate": rate,
+            "times": [float(t) for t in times]}
+
+
+def run_benchmarks(names=None, sizes=None, repeat=7, warmup=1):
+    """
+    Run registered benchmarks.
+
+    :param names: list of benchmark names, or None to run all of them
+    :param sizes: list of problem sizes overriding the defaults, or None
+    :param repeat: integer, the number of timed runs for each size
+    :param warmup: integer, the number of untimed runs for each size
+
+    :return results: a dictionary with keys "meta" and "results". \
+    results["results"][name][str(m)] is the summary for that benchmark \
+    and size, or {"status": "not implemented"} if the kernel raises \
+    NotImplementedError.
+    """
+
+    if names is None:
+        names = sorted(BENCHMARKS)
+    results = {}
+    for name in names:
+        bench = BENCHMARKS[name]
+        results[name] = {}
+        for m in (bench.sizes if sizes is None else sizes):
+            kernel, args = bench.setup(m)
+            try:
+                times = time_kernel(kernel, args, repeat, warmup)
+            except NotImplementedError:
+                results[name][str(m)] = {"status": "not implemented"}
+                continue
+            flops = None if bench.flops is None else bench.flops(m)
+            items = None if bench.items is None else bench.items(m)
+            summary = summarise(times, flops, items)
+            summary["status"] = "ok"
+            results[name][str(m)] = summary
+    meta = {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "repeat": repeat, "warmup": warmup}
+    return {"meta": meta, "results": results}
+
+
+def write_json(results, filename):
+    """
+    Write benchmark results to a JSON file.
+    """
+
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+def read_json(filename):
+    """
+    Read benchmark results from a JSON file.
+    """
+
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compare two sets of benchmark results.
+
+    :param baseline: results dictionary from run_benchmarks
+    :param current: results dictionary from run_benchmarks
+    :param threshold: a float, the allowed relative slowdown of the \
+    median run time
+
+    :return regressions: a list of tuples (name, m, ratio) for each \
+    benchmark and size present and timed in both results, whose median \
+    time has increased by a ratio of more than 1 + threshold
+    """
+
+    regressions = []
+    for name, sizes in current["results"].items():
+        for m, summary in sizes.items():
+            base = baseline["results"].get(name, {}).get(m)
+            if base is None or "median" not in base or "median" not in summary:
+                continue
+            ratio = summary["median"]/base["median"]
+            if ratio > 1 + threshold:
+                regressions.append((name, int(m), ratio))
+    return regressions
+
+
+def format_results(results):
+    """
+    Return a human readable table of benchmark results.
+    """
+
+    lines = ["%-28s %8s %12s %12s %10s %12s" % (
+        "kernel", "m", "median (s)", "iqr (s)", "GFLOP/s", "items/s")]
+    for name, sizes in results["results"].items():
+        for m, summary in sizes.items():
+            if "median" not in summary:
+                lines.append("%-28s %8s %12s" % (name, m, summary["status"]))
+                continue
+            gflops = summary["gflops"]
+            rate = summary.get("rate")
+            lines.append("%-28s %8s %12.4e %12.4e %10s %12s" % (
+                name, m, summary["median"], summary["iqr"],
+                "-" if gflops is None else "%.3f" % gflops,
+                "-" if rate is None else "%.4g" % rate))
+    return "\n".join(lines)
+
+
+def _rand(m, n=None, seed=0):
+    random.seed(seed + m)
+    if n is None:
+        return random.randn(m)
+    return random.randn(m, n)
+
+
+def _hermitian(m):
+    A = _rand(m, m)
+    return 0.5*(A + A.T)
+
+
+@benchmark("basic_matvec", sizes=[100, 200, 500], flops=lambda m: 2*m**2)
+def _basic_matvec(m):
+    return cla_utils.basic_matvec, (_rand(m, m), _rand(m))
+
+
+@benchmark("column_matvec", sizes=[100, 200, 500], flops=lambda m: 2*m**2)
+def _column_matvec(m):
+    return cla_utils.column_matvec, (_rand(m, m), _rand(m))
+
+
+@benchmark("blocked_matvec", sizes=[100, 500, 2000], flops=lambda m: 2*m**2)
+def _blocked_matvec(m):
+    return cla_utils.blocked_matvec, (_rand(m, m), _rand(m))
+
+
+@benchmark("numpy_matvec", sizes=[100, 500, 2000], flops=lambda m: 2*m**2)
+def _numpy_matvec(m):
+    return np.dot, (_rand(m, m), _rand(m))
+
+
+def _hermitian_complex(m):
+    A = _rand(m, m) + 1j*_rand(m, m, seed=1)
+    return A + A.conj().T
+
+
+@benchmark("packed_matvec", sizes=[100, 500, 2000], flops=lambda m: 8*m**2)
+def _packed_matvec(m):
+    A = cla_utils.PackedComplex.from_dense(_hermitian_complex(m))
+    return A.matvec, (_rand(m), _rand(m, seed=1))
+
+
+@benchmark("complex_matvec", sizes=[100, 500, 2000], flops=lambda m: 8*m**2)
+def _complex_matvec(m):
+    return np.dot, (_hermitian_complex(m), _rand(m) + 1j*_rand(m, seed=1))
+
+
+@benchmark("GS_classical", sizes=[50, 100, 200], flops=lambda m: 2*m**3)
+def _GS_classical(m):
+    return cla_utils.GS_classical, (_rand(m, m),)
+
+
+@benchmark("GS_modified", sizes=[50, 100, 200], flops=lambda m: 2*m**3)
+def _GS_modified(m):
+    return cla_utils.GS_modified, (_rand(m, m),)
+
+
+@benchmark("GS_block", sizes=[50, 100, 200], flops=lambda m: 2*m**3)
+def _GS_block(m):
+    return cla_utils.GS_block, (_rand(m, m),)
+
+
+# tall-skinny problems with 50 columns
+for _name in ["GS_classical", "GS_modified", "GS_block"]:
+    def _tall(m, _name=_name):
+        return getattr(cla_utils, _name), (_rand(m, 50),)
+    benchmark(_name + "_tall", sizes=[1000, 10000, 100000],
+              flops=lambda m: 2*m*50**2)(_tall)
+
+
+@benchmark("GS_modified_R", sizes=[20, 50, 100], flops=lambda m: 2*m**3)
+def _GS_modified_R(m):
+    return cla_utils.GS_modified_R, (_rand(m, m),)
+
+
+def _triangular_R(m):
+    return np.triu(_rand(m, m)) + m*np.eye(m)
+
+
+def _triangular_updates_dense(A, R0):
+    # the original GS_modified_R path: dense R_k products and an inverse
+    n = R0.shape[0]
+    R = np.eye(n)
+    for k in range(n):
+        Rk = cla_utils.ElementaryTriangular.from_inverse_row(k, R0[k, :])
+        Rk = Rk.todense()
+        A[:, :] = np.dot(A, Rk)
+        R[:, :] = np.dot(R, Rk)
+    return A, np.linalg.inv(R)
+
+
+def _triangular_updates(A, R0):
+    n = R0.shape[0]
+    R = np.zeros((n, n))
+    for k in range(n):
+        Rk = cla_utils.ElementaryTriangular.from_inverse_row(k, R0[k, :])
+        Rk.apply_right(A)
+        R[k, :] = Rk.inverse_row()
+    return A, R
+
+
+@benchmark("triangular_updates_dense", sizes=[20, 50, 100, 200],
+           flops=lambda m: 2*m**3)
+def _bench_triangular_updates_dense(m):
+    return _triangular_updates_dense, (_rand(m, m), _triangular_R(m))
+
+
+@benchmark("triangular_updates", sizes=[20, 50, 100, 200],
+           flops=lambda m: 2*m**3)
+def _bench_triangular_updates(m):
+    return _triangular_updates, (_rand(m, m), _triangular_R(m))
+
+
+# TSQR on mx100 problems, to measure scaling with the number of workers
+for _workers in [1, 2, 4, 8]:
+    def _tsqr(m, _workers=_workers):
+        return cla_utils.tsqr, (_rand(m, 100), None, _workers)
+    benchmark("tsqr_w%d" % _workers, sizes=[10000, 100000],
+              flops=lambda m: 2*m*100**2)(_tsqr)
+
+
+@benchmark("householder", sizes=[50, 100, 200], flops=lambda m: 4*m**3/3)
+def _householder(m):
+    return cla_utils.householder, (_rand(m, m),)
+
+
+@benchmark("householder_blocked", sizes=[200, 500, 1000],
+           flops=lambda m: 4*m**3/3)
+def _householder_blocked(m):
+    return cla_utils.householder_blocked, (_rand(m, m),)
+
+
+@benchmark("householder_unblocked", sizes=[200, 500, 1000],
+           flops=lambda m: 4*m**3/3)
+def _householder_unblocked(m):
+    return cla_utils.householder_blocked, (_rand(m, m), 1)
+
+
+# triangular solves with k right-hand sides, blocked against the simple
+# substitution loop (a single diagonal block)
+for _k in [1, 100, 10000]:
+    def _solve_triangular(m, _k=_k):
+        U = np.triu(_rand(m, m)) + m*np.eye(m)
+        return cla_utils.solve_triangular, (U, _rand(m, _k))
+
+    def _solve_triangular_loop(m, _k=_k):
+        U = np.triu(_rand(m, m)) + m*np.eye(m)
+        return cla_utils.solve_triangular, (U, _rand(m, _k), False, "N",
+                                            False, m)
+    benchmark("solve_triangular_k%d" % _k, sizes=[100, 500, 1000],
+              flops=lambda m, _k=_k: m**2*_k)(_solve_triangular)
+    benchmark("solve_triangular_loop_k%d" % _k, sizes=[100, 500, 1000],
+              flops=lambda m, _k=_k: m**2*_k)(_solve_triangular_loop)
+
+
+@benchmark("householder_qr", sizes=[50, 100, 200], flops=lambda m: 8*m**3/3)
+def _householder_qr(m):
+    return cla_utils.householder_qr, (_rand(m, m),)
+
+
+@benchmark("hessenberg", sizes=[50, 100, 200], flops=lambda m: 10*m**3/3)
+def _hessenberg(m):
+    return cla_utils.hessenberg, (_rand(m, m),)
+
+
+@benchmark("hessenberg_blocked", sizes=[200, 500, 1000],
+           flops=lambda m: 10*m**3/3)
+def _hessenberg_blocked(m):
+    return cla_utils.hessenberg_blocked, (_rand(m, m),)
+
+
+@benchmark("hessenberg_unblocked", sizes=[200, 500, 1000],
+           flops=lambda m: 10*m**3/3)
+def _hessenberg_unblocked(m):
+    return cla_utils.hessenberg_blocked, (_rand(m, m), 1)
+
+
+@benchmark("pow_it", sizes=[20, 50, 100])
+def _pow_it(m):
+    return cla_utils.pow_it, (_hermitian(m), _rand(m), 1.0e-6, 1000)
+
+
+# store_iterations over 2000 iterations (tol=0): every iterate in memory
+# against a ring buffer of the last 10
+@benchmark("pow_it_store_all", sizes=[1000, 4000])
+def _pow_it_store_all(m):
+    return cla_utils.pow_it, (_hermitian(m), _rand(m), 0.0, 2000, True)
+
+
+@benchmark("pow_it_history_ring", sizes=[1000, 4000])
+def _pow_it_history_ring(m):
+    return cla_utils.pow_it, (_hermitian(m), _rand(m), 0.0, 2000,
+                              cla_utils.IterateHistory(maxlen=10))
+
+
+@benchmark("block_pow_it", sizes=[200, 500, 1000])
+def _block_pow_it(m):
+    return cla_utils.block_pow_it, (_hermitian(m), _rand(m, 8), 1.0e-6,
+                                    10000)
+
+
+@benchmark("block_pow_it_batched", sizes=[20, 50, 100])
+def _block_pow_it_batched(m):
+    A = _rand(100*m, m).reshape(100, m, m)
+    return cla_utils.block_pow_it, (A + np.swapaxes(A, 1, 2),
+                                    _rand(100*m, 2).reshape(100, m, 2),
+                                    1.0e-6, 10000, 4)
+
+
+def _stack(m, b=2000):
+    # b symmetric mxm matrices with a dominant eigenvalue (from the
+    # shift by 2m), so that power iteration converges
+    A = _rand(b*m, m).reshape(b, m, m)
+    return A + np.swapaxes(A, 1, 2) + 2*m*np.eye(m)
+
+
+def _loop(f, A, x0, tol, maxit):
+    # baseline: one call per matrix of the stack
+    return [f(a, x0, tol, maxit) for a in A]
+
+
+for _name, _f, _tol, _maxit in [("pow_it", cla_utils.pow_it, 1.0e-6, 1000),
+                                ("rq_it", cla_utils.rq_it, 1.0e-8, 100)]:
+    def _batched(m, _f=_f, _tol=_tol, _maxit=_maxit):
+        return _f, (_stack(m), _rand(m), _tol, _maxit)
+
+    def _looped(m, _f=_f, _tol=_tol, _maxit=_maxit):
+        return _loop, (_f, _stack(m), _rand(m), _tol, _maxit)
+    benchmark(_name + "_stack", sizes=[3, 10, 20],
+              items=lambda m: 2000)(_batched)
+    benchmark(_name + "_stack_loop", sizes=[3, 10, 20],
+              items=lambda m: 2000)(_looped)
+
+
+@benchmark("inverse_it", sizes=[20, 50, 100])
+def _inverse_it(m):
+    return cla_utils.inverse_it, (_hermitian(m), _rand(m), 0.5, 1.0e-8, 1000)
+
+
+def _inverse_it_dense(A, x0, mu, tol, maxit):
+    # baseline: a dense solve with A - mu I on every iteration
+    x = x0/np.linalg.norm(x0)
+    B = A - mu*np.eye(A.shape[0])
+    for it in range(maxit):
+        x = np.linalg.solve(B, x)
+        x /= np.linalg.norm(x)
+        Ax = A.dot(x)
+        l = np.vdot(x, Ax)
+        if np.linalg.norm(Ax - l*x) < tol:
+            break
+    return x, l
+
+
+@benchmark("inverse_it_factored", sizes=[500, 1000, 2000])
+def _inverse_it_factored(m):
+    return cla_utils.inverse_it, (_hermitian(m), _rand(m), 0.5, 1.0e-8, 1000)
+
+
+@benchmark("inverse_it_dense", sizes=[500, 1000, 2000])
+def _bench_inverse_it_dense(m):
+    return _inverse_it_dense, (_hermitian(m), _rand(m), 0.5, 1.0e-8, 1000)
+
+
+@benchmark("inverse_it_shifts", sizes=[500, 1000, 2000])
+def _inverse_it_shifts(m):
+    return cla_utils.inverse_it, (_hermitian(m), _rand(m),
+                                  np.linspace(-1.0, 1.0, 8), 1.0e-8, 1000)
+
+
+@benchmark("rq_it", sizes=[20, 50, 100])
+def _rq_it(m):
+    return cla_utils.rq_it, (_hermitian(m), _rand(m), 1.0e-8, 1000)
+
+
+def _rq_it_dense(A, x0, tol, maxit):
+    # baseline: a dense solve with the new shift on every iteration
+    x = x0/np.linalg.norm(x0)
+    l = np.vdot(x, A.dot(x))
+    I = np.eye(A.shape[0])
+    for it in range(maxit):
+        x = np.linalg.solve(A - l*I, x)
+        x /= np.linalg.norm(x)
+        Ax = A.dot(x)
+        l = np.vdot(x, Ax)
+        if np.linalg.norm(Ax - l*x) < tol:
+            break
+    return x, l
+
+
+# to convergence, and for a fixed 50 iterations (tol=0) to separate the
+# one-off reduction from the cost per iteration
+for _tol, _maxit, _suffix in [(1.0e-8, 1000, ""), (0.0, 50, "_50its")]:
+    def _rq_it_reduced(m, _tol=_tol, _maxit=_maxit):
+        return cla_utils.rq_it, (_hermitian(m), _rand(m), _tol, _maxit)
+
+    def _rq_it_dense_solves(m, _tol=_tol, _maxit=_maxit):
+        return _rq_it_dense, (_hermitian(m), _rand(m), _tol, _maxit)
+    benchmark("rq_it_reduced" + _suffix, sizes=[1000, 2000])(_rq_it_reduced)
+    benchmark("rq_it_dense" + _suffix, sizes=[1000, 2000])(
+        _rq_it_dense_solves)
+
+
+@benchmark("pure_QR", sizes=[10, 20, 30])
+def _pure_QR(m):
+    return cla_utils.pure_QR, (_hermitian(m), 10000, 1.0e-5)
+
+
+@benchmark("pure_QR_unshifted", sizes=[10, 20, 30])
+def _pure_QR_unshifted(m):
+    return cla_utils.pure_QR, (_hermitian(m), 10000, 1.0e-5, None, None)
+
+
+@benchmark("shifted_QR", sizes=[50, 100, 200])
+def _shifted_QR(m):
+    return cla_utils.shifted_QR, (_rand(m, m), 10000, 1.0e-8)
+
+
+@benchmark("shifted_QR_francis", sizes=[50, 100, 200])
+def _shifted_QR_francis(m):
+    return cla_utils.shifted_QR, (_rand(m, m), 10000, 1.0e-8, "francis")
+
+
+@benchmark("shifted_QR_hermitian", sizes=[100, 200, 500])
+def _shifted_QR_hermitian(m):
+    return cla_utils.shifted_QR, (_hermitian(m), 10000, 1.0e-8)
+
+
+def _clustered(m, nclusters=16):
+    # eigenvalues in tight clusters, so deflation splits off many blocks
+    lambdas = np.arange(m)*nclusters//m + 1.0e-3*_rand(m, seed=1)
+    Q, _ = np.linalg.qr(_rand(m, m))
+    return (Q*lambdas).dot(Q.T)
+
+
+for _workers in [1, 2, 4, 8]:
+    def _shifted_QR_w(m, _workers=_workers):
+        return cla_utils.shifted_QR, (_clustered(m), 10000, 1.0e-8,
+                                      "wilkinson", True, False, _workers,
+                                      "process", 32)
+    benchmark("shifted_QR_w%d" % _workers, sizes=[500, 1000, 2000])(
+        _shifted_QR_w)
+
+
+@benchmark("GMRES", sizes=[20, 50, 100])
+def _GMRES(m):
+    A = _rand(m, m) + m*np.eye(m)
+    return cla_utils.GMRES, (A, _rand(m), 1000, 1.0e-6)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run and compare cla_utils benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Run benchmarks.")
+    run.add_argument("-o", "--output", help="JSON file to write results to.")
+    run.add_argument("-k", "--kernels", nargs="+", choices=sorted(BENCHMARKS),
+                     help="Benchmarks to run (default all).")
+    run.add_argument("-s", "--sizes", nargs="+", type=int,
+                     help="Problem sizes overriding the defaults.")
+    run.add_argument("-r", "--repeat", type=int, default=7)
+    run.add_argument("-w", "--warmup", type=int, default=1)
+    cmp = sub.add_parser("compare", help="Compare two JSON result files.")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("-t", "--threshold", type=float, default=0.1,
+                     help="Allowed relative slowdown (default 0.1).")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(args.kernels, args.sizes,
+                                 args.repeat, args.warmup)
+        print(format_results(results))
+        if args.output:
+            write_json(results, args.output)
+        return 0
+
+    regressions = compare(read_json(args.baseline), read_json(args.current),
+                          args.threshold)
+    for name, m, ratio in regressions:
+        print("%s (m=%d) is %.2fx slower" % (name, m, ratio))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
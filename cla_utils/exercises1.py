@@ -1,5 +1,4 @@
 import numpy as np
-import timeit
 import numpy.random as random
 
 # pre-construct a matrix in the namespace to use in tests
@@ -7,6 +6,9 @@ random.seed(1651)
 A0 = random.randn(500, 500)
 x0 = random.randn(500)
 
+# cache budget (in bytes) for one tile of A when choosing block sizes
+L2_CACHE_BYTES = 256*1024
+
 
 def basic_matvec(A, x):
     """
@@ -43,6 +45,84 @@ def column_matvec(A, x):
     raise NotImplementedError
 
 
+def choose_block_size(A, mode="row", cache_bytes=L2_CACHE_BYTES):
+    """
+    Choose a block size for blocked_matvec and blocked_matmat so that
+    one tile of A fits in cache.
+
+    :param A: an mxn-dimensional numpy array
+    :param mode: "row" for blocks of rows of A, "column" for blocks of \
+    columns of A
+    :param cache_bytes: the number of bytes available for one tile
+
+    :return bs: integer block size, between 1 and the blocked dimension
+    """
+
+    m, n = A.shape
+    if mode == "row":
+        length, dim = n, m
+    elif mode == "column":
+        length, dim = m, n
+    else:
+        raise ValueError("Unknown blocking mode %s" % mode)
+    bs = cache_bytes//max(length*A.itemsize, 1)
+    return int(min(max(bs, 1), max(dim, 1)))
+
+
+def blocked_matmat(A, B, block_size=None, mode="row"):
+    """
+    Cache-blocked matrix-matrix multiplication.
+
+    :param A: an mxn-dimensional numpy array
+    :param B: an nxk-dimensional numpy array
+    :param block_size: integer number of rows (or columns) of A in \
+    each tile, or None to choose one with choose_block_size
+    :param mode: "row" to compute C one block of rows at a time, \
+    "column" to accumulate C over blocks of columns of A
+
+    :return C: an mxk-dimensional numpy array which is the product of A \
+    with B
+    """
+
+    m, n = A.shape
+    if B.shape[0] != n:
+        raise ValueError("Shapes %s and %s not aligned" % (A.shape, B.shape))
+    if block_size is None:
+        block_size = choose_block_size(A, mode)
+    if block_size < 1:
+        raise ValueError("block_size must be positive")
+
+    C = np.zeros((m,) + B.shape[1:], dtype=np.result_type(A, B))
+    if mode == "row":
+        for i in range(0, m, block_size):
+            np.dot(A[i:i+block_size, :], B, out=C[i:i+block_size])
+    elif mode == "column":
+        for j in range(0, n, block_size):
+            C += A[:, j:j+block_size].dot(B[j:j+block_size])
+    else:
+        raise ValueError("Unknown blocking mode %s" % mode)
+    return C
+
+
+def blocked_matvec(A, x, block_size=None, mode="row"):
+    """
+    Cache-blocked matrix-vector multiplication, with the same calling
+    convention as basic_matvec and column_matvec.
+
+    :param A: an mxn-dimensional numpy array
+    :param x: an n-dimensional numpy array, or an nxk-dimensional \
+    numpy array whose columns are k right-hand sides
+    :param block_size: integer number of rows (or columns) of A in \
+    each tile, or None to choose one with choose_block_size
+    :param mode: "row" or "column", see blocked_matmat
+
+    :return b: an m-dimensional (or mxk-dimensional) numpy array which \
+    is the product of A with x
+    """
+
+    return blocked_matmat(A, x, block_size=block_size, mode=mode)
+
+
 def timeable_basic_matvec():
     """
     Doing a matvec example with the basic_matvec that we can
@@ -61,6 +141,15 @@ def timeable_column_matvec():
     b = column_matvec(A0, x0) # noqa
 
 
+def timeable_blocked_matvec():
+    """
+    Doing a matvec example with the blocked_matvec that we can
+    pass to timeit.
+    """
+
+    b = blocked_matvec(A0, x0) # noqa
+
+
 def timeable_numpy_matvec():
     """
     Doing a matvec example with the builtin numpy matvec so that
@@ -70,20 +159,132 @@ def timeable_numpy_matvec():
     b = A0.dot(x0) # noqa
 
 
-def time_matvecs():
+def time_matvecs(repeat=7, warmup=1):
     """
-    Get some timings for matvecs.
+    Get some timings for matvecs, reporting the median and interquartile
+    range over repeated runs. See cla_utils.benchmark for the full suite.
+
+    :param repeat: integer, the number of timed runs of each matvec
+    :param warmup: integer, the number of untimed runs of each matvec
     """
 
-    print("Timing for basic_matvec")
-    print(timeit.Timer(timeable_basic_matvec).timeit(number=1))
-    print("Timing for column_matvec")
-    print(timeit.Timer(timeable_column_matvec).timeit(number=1))
-    print("Timing for numpy matvec")
-    print(timeit.Timer(timeable_numpy_matvec).timeit(number=1))
+    from cla_utils.benchmark import time_kernel, summarise
+
+    for name, timeable in [("basic_matvec", timeable_basic_matvec),
+                           ("column_matvec", timeable_column_matvec),
+                           ("blocked_matvec", timeable_blocked_matvec),
+                           ("numpy matvec", timeable_numpy_matvec)]:
+        try:
+            times = time_kernel(timeable, (), repeat, warmup)
+        except NotImplementedError:
+            print("Timing for %s: not implemented" % name)
+            continue
+        summary = summarise(times, 2*A0.size)
+        print("Timing for %s: median %.4e s, iqr %.4e s, %.3f GFLOP/s"
+              % (name, summary["median"], summary["iqr"], summary["gflops"]))
+
 
+class LowRank(object):
+    """
+    An mxn matrix A = UV^* of rank (at most) r, stored by its factors
+    U and V rather than as a dense array.
 
-def rank2(u1, u2, v1, v2):
+    :param U: an mxr-dimensional numpy array
+    :param V: an nxr-dimensional numpy array
+    """
+
+    def __init__(self, U, V):
+        if U.ndim != 2 or V.ndim != 2 or U.shape[1] != V.shape[1]:
+            raise ValueError("U and V must be 2D with equal column counts")
+        dtype = np.result_type(U, V)
+        r = U.shape[1]
+        # factors are kept in buffers with spare columns so that
+        # appending rank-1 terms costs O(m+n) amortised
+        self._U = np.zeros((U.shape[0], max(r, 1)), dtype=dtype)
+        self._V = np.zeros((V.shape[0], max(r, 1)), dtype=dtype)
+        self._U[:, :r] = U
+        self._V[:, :r] = V
+        self._r = r
+
+    @property
+    def U(self):
+        return self._U[:, :self._r]
+
+    @property
+    def V(self):
+        return self._V[:, :self._r]
+
+    @property
+    def shape(self):
+        return self._U.shape[0], self._V.shape[0]
+
+    @property
+    def rank(self):
+        return self._r
+
+    @property
+    def dtype(self):
+        return self._U.dtype
+
+    def matvec(self, x):
+        """
+        Return Ax = U(V^*x) in O((m+n)r) operations.
+
+        :param x: an n-dimensional (or nxk-dimensional) numpy array
+
+        :return b: an m-dimensional (or mxk-dimensional) numpy array
+        """
+
+        return self.U.dot(self.V.conj().T.dot(x))
+
+    def rmatvec(self, y):
+        """
+        Return A^*y = V(U^*y) in O((m+n)r) operations.
+
+        :param y: an m-dimensional (or mxk-dimensional) numpy array
+
+        :return c: an n-dimensional (or nxk-dimensional) numpy array
+        """
+
+        return self.V.dot(self.U.conj().T.dot(y))
+
+    def __matmul__(self, x):
+        return self.matvec(x)
+
+    def add_rank1(self, u, v):
+        """
+        Add the rank-1 term uv^* to A, in place.
+
+        :param u: an m-dimensional numpy array
+        :param v: an n-dimensional numpy array
+        """
+
+        if self._r == self._U.shape[1]:
+            dtype = np.result_type(self._U, u, v)
+            cap = 2*self._U.shape[1]
+            U = np.zeros((self._U.shape[0], cap), dtype=dtype)
+            V = np.zeros((self._V.shape[0], cap), dtype=dtype)
+            U[:, :self._r] = self.U
+            V[:, :self._r] = self.V
+            self._U, self._V = U, V
+        elif not np.can_cast(np.result_type(u, v), self.dtype):
+            self._U = self._U.astype(np.result_type(self._U, u, v))
+            self._V = self._V.astype(self._U.dtype)
+        self._U[:, self._r] = u
+        self._V[:, self._r] = v
+        self._r += 1
+
+    def todense(self):
+        """
+        Form the dense matrix A.
+
+        :return A: an mxn-dimensional numpy array
+        """
+
+        return self.U.dot(self.V.conj().T)
+
+
+def rank2(u1, u2, v1, v2, lowrank=False):
     """
     Return the rank2 matrix A = u1*v1^* + u2*v2^*.
 
@@ -91,8 +292,13 @@ def rank2(u1, u2, v1, v2):
     :param u2: m-dimensional numpy array
     :param v1: n-dimensional numpy array
     :param v2: n-dimensional numpy array
+    :param lowrank: if True, return A as a LowRank operator storing \
+    the factors instead of the dense matrix. Default is False.
     """
 
+    if lowrank:
+        return LowRank(np.stack((u1, u2), axis=1), np.stack((v1, v2), axis=1))
+
     raise NotImplementedError
 
     A = B.dot(C)
@@ -100,20 +306,146 @@ def rank2(u1, u2, v1, v2):
     return A
 
 
-def rank1pert_inv(u, v):
+def rank1pert_inv(u, v, operator=False):
     """
     Return the inverse of the matrix A = I + uv^*, where I
     is the mxm dimensional identity matrix, with
 
     :param u: m-dimensional numpy array
     :param v: m-dimensional numpy array
+    :param operator: if True, return a WoodburySolver for A instead \
+    of the dense inverse. Default is False.
     """
 
+    if operator:
+        return WoodburySolver.from_identity(u.shape[0], u[:, None],
+                                            v[:, None])
+
     raise NotImplementedError
 
     return Ainv
 
 
+class WoodburySolver(object):
+    """
+    Solver for (A + UV^*)x = b, for an mxm matrix A with a known
+    solver and mxk matrices U and V, using the Sherman-Morrison-Woodbury
+    formula
+
+    (A + UV^*)^{-1} = A^{-1} - A^{-1}U(I + V^*A^{-1}U)^{-1}V^*A^{-1}.
+
+    A^{-1}U and a QR factorisation of the kxk capacitance matrix
+    I + V^*A^{-1}U are computed once, so each solve costs one solve with
+    A plus O(mk + k^2) operations.
+
+    :param m: integer, the dimension of A
+    :param Asolve: a function taking an m-dimensional or \
+    mxl-dimensional numpy array b and returning A^{-1}b
+    :param U: an mxk-dimensional numpy array, or None for no update
+    :param V: an mxk-dimensional numpy array, or None for no update
+    """
+
+    def __init__(self, m, Asolve, U=None, V=None):
+        self.m = m
+        self.Asolve = Asolve
+        self.V = np.zeros((m, 0))
+        self.W = np.zeros((m, 0))  # A^{-1}U
+        self.C = np.zeros((0, 0))  # I + V^*A^{-1}U
+        self._Cfactor = None
+        if U is not None:
+            self.update(U, V)
+
+    @classmethod
+    def from_identity(cls, m, U=None, V=None):
+        """
+        Return a solver for I + UV^*, with I the mxm identity.
+        """
+
+        return cls(m, lambda b: b, U, V)
+
+    @classmethod
+    def from_qr(cls, Q, R=None, U=None, V=None):
+        """
+        Return a solver for QR + UV^*, given a QR factorisation of A,
+        either implicit, such as the HouseholderQR object computed by
+        householder_qr(A, implicit=True), or as the explicit pair Q, R.
+
+        :param Q: a factorisation object with an apply_Qh method and an \
+        upper triangular R attribute, or an mxm-dimensional unitary \
+        numpy array
+        :param R: None for a factorisation object, otherwise an \
+        mxm-dimensional upper triangular numpy array
+        """
+
+        from cla_utils.exercises3 import solve_triangular
+        if R is None:
+            F = Q
+            R = F.R
+            return cls(R.shape[0],
+                       lambda b: solve_triangular(R, F.apply_Qh(b)), U, V)
+        return cls(Q.shape[0],
+                   lambda b: solve_triangular(R, Q.conj().T.dot(b)), U, V)
+
+    @classmethod
+    def from_triangular(cls, T, U=None, V=None, lower=False):
+        """
+        Return a solver for T + UV^*, with T triangular.
+
+        :param T: an mxm-dimensional numpy array, assumed triangular
+        :param lower: if True T is lower triangular, otherwise upper
+        """
+
+        from cla_utils.exercises3 import solve_triangular
+        return cls(T.shape[0],
+                   lambda b: solve_triangular(T, b, lower=lower), U, V)
+
+    @property
+    def rank(self):
+        return self.V.shape[1]
+
+    def update(self, U, V):
+        """
+        Append the low rank update UV^*, so that the solver is for
+        A + U_0V_0^* + UV^*, without refactorising A.
+
+        :param U: an m-dimensional or mxl-dimensional numpy array
+        :param V: an m-dimensional or mxl-dimensional numpy array
+        """
+
+        if U.ndim == 1:
+            U, V = U[:, None], V[:, None]
+        W = self.Asolve(U)
+        k, l = self.rank, U.shape[1]
+        dtype = np.result_type(self.C, self.W, W, V)
+        C = np.zeros((k + l, k + l), dtype=dtype)
+        C[:k, :k] = self.C
+        C[:k, k:] = self.V.conj().T.dot(W)
+        C[k:, :k] = V.conj().T.dot(self.W)
+        C[k:, k:] = np.eye(l) + V.conj().T.dot(W)
+        self.C = C
+        self.V = np.concatenate((self.V, V), axis=1)
+        self.W = np.concatenate((self.W, W), axis=1)
+        self._Cfactor = None
+
+    def solve(self, b):
+        """
+        Solve (A + UV^*)x = b.
+
+        :param b: an m-dimensional numpy array, or an mxl-dimensional \
+        numpy array whose columns are right-hand sides
+
+        :return x: numpy array of the same shape as b
+        """
+
+        y = self.Asolve(b)
+        if self.rank == 0:
+            return y
+        if self._Cfactor is None:
+            from cla_utils.exercises3 import HouseholderQR
+            self._Cfactor = HouseholderQR(self.C)
+        return y - self.W.dot(self._Cfactor.solve(self.V.conj().T.dot(y)))
+
+
 def ABiC(Ahat, xr, xi):
     """Return the real and imaginary parts of z = A*x, where A = B + iC
     with
@@ -128,3 +460,232 @@ def ABiC(Ahat, xr, xi):
     raise NotImplementedError
 
     return zr, zi
+
+
+# the kinds of complex matrix A = B + iC understood by PackedComplex. For
+# each kind, B and C are represented by a real triangle T stored in the
+# packed array, as alpha*T + beta*T^T off the diagonal plus diag*D on the
+# diagonal, given here as (triangle, alpha, beta, diag) for B and for C.
+PACKED_KINDS = {
+    "hermitian": (("lower", 1.0, 1.0, 1.0), ("upper", 1.0, -1.0, 0.0)),
+    "symmetric": (("lower", 1.0, 1.0, 1.0), ("upper", 1.0, 1.0, 1.0)),
+    "lower": (("lower", 1.0, 0.0, 1.0), ("upper", 0.0, 1.0, 1.0)),
+    "upper": (("lower", 0.0, 1.0, 1.0), ("upper", 1.0, 0.0, 1.0)),
+}
+
+
+def pack_complex(A, kind="hermitian"):
+    """
+    Pack a complex mxm matrix A = B + iC into a single real array.
+
+    For kind "hermitian" (B symmetric, C skew-symmetric) the packed
+    array Ahat is mxm with Ahat[i,j] = B[i,j] for i>=j and Ahat[i,j] =
+    C[i,j] for i<j, as in ABiC. For the other kinds Ahat is mx(m+1),
+    with one real triangle (including the diagonal) of B stored in
+    Ahat[:, :m] and one of C stored in the upper triangle of
+    Ahat[:, 1:]. The kinds are "symmetric" (A = A^T), "lower" and
+    "upper" (A triangular).
+
+    :param A: an mxm-dimensional numpy array
+    :param kind: one of "hermitian", "symmetric", "lower", "upper"
+
+    :return Ahat: the packed real numpy array
+    """
+
+    if kind not in PACKED_KINDS:
+        raise ValueError("Unknown packed matrix kind %s" % kind)
+    m = A.shape[0]
+    B, C = np.real(A), np.imag(A)
+    if kind == "hermitian":
+        Ahat = np.zeros((m, m))
+        Ahat[np.tril_indices(m)] = B[np.tril_indices(m)]
+        Ahat[np.triu_indices(m, 1)] = C[np.triu_indices(m, 1)]
+        return Ahat
+    if kind == "lower":
+        C = C.T
+    elif kind == "upper":
+        B = B.T
+    Ahat = np.zeros((m, m+1))
+    Ahat[:, :m][np.tril_indices(m)] = B[np.tril_indices(m)]
+    Ahat[:, 1:][np.triu_indices(m)] = C[np.triu_indices(m)]
+    return Ahat
+
+
+def _packed_triangles(Ahat):
+    """
+    Return the mxm views of a packed array holding the B and C triangles.
+    """
+
+    m = Ahat.shape[0]
+    if Ahat.shape[1] == m:
+        return Ahat, Ahat
+    return Ahat[:, :m], Ahat[:, 1:]
+
+
+def unpack_complex(Ahat, kind="hermitian"):
+    """
+    Recover the complex matrix A from its packed form, see pack_complex.
+
+    :param Ahat: the packed real numpy array
+    :param kind: one of "hermitian", "symmetric", "lower", "upper"
+
+    :return A: an mxm-dimensional complex numpy array
+    """
+
+    m = Ahat.shape[0]
+    parts = []
+    for T, (side, alpha, beta, diag) in zip(_packed_triangles(Ahat),
+                                            PACKED_KINDS[kind]):
+        S = np.tril(T, -1) if side == "lower" else np.triu(T, 1)
+        parts.append(alpha*S + beta*S.T + diag*np.diag(np.diag(T)))
+    return parts[0] + 1j*parts[1]
+
+
+def _axpy(y, a, x):
+    """
+    Compute y += a*x in place, overwriting x if a is not 1 or -1.
+    """
+
+    if a == 1.0:
+        y += x
+    elif a == -1.0:
+        y -= x
+    else:
+        x *= a
+        y += x
+
+
+class PackedComplex(object):
+    """
+    A complex mxm matrix A = B + iC held in the packed real storage of
+    pack_complex, with matrix-vector products computed directly from the
+    packed array.
+
+    The product is blocked: each block row of the packed array is applied
+    with a single matrix-matrix product, the transposed parts of the
+    triangles are applied from the corresponding block column, and only
+    the small diagonal blocks are held expanded. Products work in
+    workspace arrays that are allocated once per number of right-hand
+    sides and reused.
+
+    :param Ahat: the packed real numpy array
+    :param kind: one of "hermitian", "symmetric", "lower", "upper"
+    :param block_size: integer block size, or None for a default
+    """
+
+    def __init__(self, Ahat, kind="hermitian", block_size=None):
+        if kind not in PACKED_KINDS:
+            raise ValueError("Unknown packed matrix kind %s" % kind)
+        m = Ahat.shape[0]
+        if Ahat.shape[1] != (m if kind == "hermitian" else m+1):
+            raise ValueError("Packed array has the wrong shape for %s" % kind)
+        self.Ahat = Ahat
+        self.kind = kind
+        self.m = m
+        if block_size is None:
+            block_size = 64
+        self.block_size = max(1, min(block_size, m))
+        bs = self.block_size
+        # the diagonal blocks of B and C are expanded once, which costs
+        # O(m*block_size) extra storage
+        nb = (m + bs - 1)//bs
+        self._diag = np.zeros((2, nb, bs, bs))
+        for T, (side, alpha, beta, diag), Dk in zip(
+                _packed_triangles(Ahat), PACKED_KINDS[kind], self._diag):
+            for j, i0 in enumerate(range(0, m, bs)):
+                D = T[i0:i0+bs, i0:i0+bs]
+                S = np.tril(D, -1) if side == "lower" else np.triu(D, 1)
+                b = D.shape[0]
+                Dk[j, :b, :b] = alpha*S + beta*S.T + diag*np.diag(np.diag(D))
+        self._work = {}
+
+    @classmethod
+    def from_dense(cls, A, kind="hermitian", block_size=None):
+        """
+        Pack the complex matrix A, see pack_complex.
+        """
+
+        return cls(pack_complex(A, kind), kind, block_size)
+
+    @property
+    def shape(self):
+        return self.m, self.m
+
+    def todense(self):
+        """
+        Unpack to the dense complex matrix A.
+        """
+
+        return unpack_complex(self.Ahat, self.kind)
+
+    def _workspace(self, k):
+        if k not in self._work:
+            self._work[k] = (np.zeros((self.m, 2*k)),
+                             np.zeros((self.Ahat.shape[1], 2*k)),
+                             np.zeros((self.block_size, 2*k)))
+        return self._work[k]
+
+    def matvec(self, xr, xi, out=None):
+        """
+        Return the real and imaginary parts of z = A*x, for x = xr + i*xi.
+
+        :param xr: an m-dimensional or mxk-dimensional real numpy array
+        :param xi: numpy array of the same shape as xr
+        :param out: optional tuple (zr, zi) of contiguous real numpy \
+        arrays of the same shape as xr to write the result into
+
+        :return zr: numpy array containing the real part of z
+        :return zi: numpy array containing the imaginary part of z
+        """
+
+        m, bs, Ahat = self.m, self.block_size, self.Ahat
+        o = Ahat.shape[1] - m
+        (_, a0, b0, _), (_, a1, b1, _) = PACKED_KINDS[self.kind]
+        T0, T1 = _packed_triangles(Ahat)
+        k = 1 if xr.ndim == 1 else xr.shape[1]
+        X, V, s = self._workspace(k)
+        X[:, :k] = xr.reshape(m, k)
+        X[:, k:] = xi.reshape(m, k)
+        if out is None:
+            out = np.zeros(xr.shape), np.zeros(xr.shape)
+        Zr, Zi = out[0].reshape(m, k), out[1].reshape(m, k)
+        Zr[:] = 0.0
+        Zi[:] = 0.0
+
+        for i0 in range(0, m, bs):
+            i1 = min(i0 + bs, m)
+            b = i1 - i0
+            I = slice(i0, i1)
+            sr, si = s[:b, :k], s[:b, k:]
+            # block row I of both strict triangles in one product, with
+            # V = [a0*xr, a0*xi] left of the diagonal block and
+            # [-a1*xi, a1*xr] right of it
+            np.multiply(X[:i0], a0, out=V[:i0])
+            np.multiply(X[i1:, k:], -a1, out=V[i1+o:, :k])
+            np.multiply(X[i1:, :k], a1, out=V[i1+o:, k:])
+            V[i0:i1+o] = 0.0
+            np.matmul(Ahat[I], V, out=s[:b])
+            Zr[I] += sr
+            Zi[I] += si
+            # transposed strict triangles, from block column I
+            if b0 != 0.0 and i1 < m:
+                np.matmul(T0[i1:, I].T, X[i1:], out=s[:b])
+                _axpy(Zr[I], b0, sr)
+                _axpy(Zi[I], b0, si)
+            if b1 != 0.0 and i0 > 0:
+                np.matmul(T1[:i0, I].T, X[:i0], out=s[:b])
+                _axpy(Zi[I], b1, sr)
+                _axpy(Zr[I], -b1, si)
+            # diagonal blocks of B and C
+            np.matmul(self._diag[0, i0//bs, :b, :b], X[I], out=s[:b])
+            Zr[I] += sr
+            Zi[I] += si
+            np.matmul(self._diag[1, i0//bs, :b, :b], X[I], out=s[:b])
+            Zr[I] -= si
+            Zi[I] += sr
+        return out
+
+    def __matmul__(self, x):
+        zr, zi = self.matvec(np.ascontiguousarray(np.real(x)),
+                             np.ascontiguousarray(np.imag(x)))
+        return zr + 1j*zi
@@ -36,7 +36,87 @@ def solve_Q(Q, b):
     return x
 
 
-def orthog_proj(Q):
+def orthog_cpts_batch(V, Q, stacked=False, out=None):
+    """
+    Batched version of orthog_cpts: for each vector v_i in a block,
+    compute v_i = r_i + Qu_i using one matrix-matrix product for the
+    coefficients and one for the residuals.
+
+    :param V: an mxk-dimensional numpy array whose columns are the \
+    vectors v_i, or if stacked, a kxm-dimensional numpy array whose rows \
+    are the vectors v_i
+    :param Q: an mxn-dimensional numpy array whose columns are the \
+    orthonormal vectors
+    :param stacked: if True, the vectors are the rows of V. Default is \
+    False.
+    :param out: optional tuple (R, U) of numpy arrays to write the \
+    results into
+
+    :return R: numpy array of the same shape as V containing the residuals
+    :return U: an nxk-dimensional (kxn-dimensional if stacked) numpy \
+    array containing the coefficients
+    """
+
+    dtype = np.result_type(V, Q)
+    if out is None:
+        ushape = (V.shape[0], Q.shape[1]) if stacked else \
+            (Q.shape[1], V.shape[1])
+        out = np.empty(V.shape, dtype=dtype), np.empty(ushape, dtype=dtype)
+    R, U = out
+    if np.iscomplexobj(Q):
+        # conjugate V (into R) and U rather than copying Q: Vconj(Q) is
+        # conj(conj(V)Q), and Q^*V is conj(Q^Tconj(V))
+        np.conjugate(V, out=R)
+        if stacked:
+            np.matmul(R, Q, out=U)
+        else:
+            np.matmul(Q.T, R, out=U)
+        np.conjugate(U, out=U)
+    elif stacked:
+        np.matmul(V, Q, out=U)
+    else:
+        np.matmul(Q.T, V, out=U)
+    if stacked:
+        np.matmul(U, Q.T, out=R)
+    else:
+        np.matmul(Q, U, out=R)
+    np.subtract(V, R, out=R)
+    return R, U
+
+
+def solve_Q_batch(Q, B, stacked=False, out=None):
+    """
+    Batched version of solve_Q: given a unitary mxm matrix Q, solve
+    Qx_i = b_i for all the right-hand sides at once.
+
+    :param Q: an mxm dimensional numpy array containing the unitary matrix
+    :param B: an mxk dimensional numpy array whose columns are the \
+    right-hand sides b_i, or if stacked, a kxm dimensional numpy array \
+    whose rows are the b_i
+    :param stacked: if True, the right-hand sides are the rows of B. \
+    Default is False.
+    :param out: optional numpy array of the same shape as B to write \
+    the solution into
+
+    :return X: numpy array of the same shape as B containing the solutions
+    """
+
+    if out is None:
+        out = np.empty(B.shape, dtype=np.result_type(Q, B))
+    if not np.iscomplexobj(Q):
+        if stacked:
+            return np.matmul(B, Q, out=out)
+        return np.matmul(Q.T, B, out=out)
+    # conjugate B and the result rather than copying Q, as in
+    # orthog_cpts_batch
+    if stacked:
+        np.matmul(B.conj(), Q, out=out)
+    else:
+        np.matmul(Q.T, B.conj(), out=out)
+    return np.conjugate(out, out=out)
+
+
+def orthog_proj(Q, implicit=False):
     """
     Given a vector v and an orthonormal set of vectors q_1,...q_n,
     compute the orthogonal projector P that projects vectors onto
@@ -44,15 +124,137 @@ def orthog_proj(Q):
 
     :param Q: an mxn-dimensional numpy array whose columns are the \
     orthonormal vectors
+    :param implicit: if True, return an OrthogProjector which stores \
+    only Q, instead of the dense matrix. Default is False.
 
     :return P: an mxm-dimensional numpy array containing the projector
     """
 
+    if implicit:
+        return OrthogProjector(Q)
+
     raise NotImplementedError
 
     return P
 
 
+class OrthogProjector(object):
+    """
+    The orthogonal projector P = QQ^* onto the span of the orthonormal
+    columns of Q, or its complement I - QQ^*, applied without forming
+    the mxm matrix.
+
+    :param Q: an mxn-dimensional numpy array whose columns are \
+    orthonormal
+    :param complement: if True, represent I - QQ^* instead. Default is \
+    False.
+    """
+
+    def __init__(self, Q, complement=False):
+        self.Q = Q
+        self.complement = complement
+
+    @property
+    def shape(self):
+        return self.Q.shape[0], self.Q.shape[0]
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the operator, in bytes.
+        """
+
+        return self.Q.nbytes
+
+    @property
+    def dense_nbytes(self):
+        """
+        The memory the dense mxm projector would need, in bytes.
+        """
+
+        return self.Q.shape[0]**2*self.Q.itemsize
+
+    @property
+    def C(self):
+        """
+        The complementary projector.
+        """
+
+        return OrthogProjector(self.Q, not self.complement)
+
+    def apply(self, x):
+        """
+        Apply the projector, in O(mn) operations per vector.
+
+        :param x: an m-dimensional numpy array, or an mxk-dimensional \
+        numpy array whose columns are vectors to project
+
+        :return y: numpy array of the same shape as x
+        """
+
+        y = self.Q.dot(self.Q.conj().T.dot(x))
+        if self.complement:
+            y = x - y
+        return y
+
+    def __matmul__(self, other):
+        if isinstance(other, (OrthogProjector, OperatorProduct)):
+            return OperatorProduct([self, other])
+        return self.apply(other)
+
+    def todense(self):
+        """
+        Form the dense mxm projector.
+        """
+
+        return self.apply(np.eye(self.shape[0], dtype=self.Q.dtype))
+
+
+class OperatorProduct(object):
+    """
+    The product of a sequence of operators (such as OrthogProjector),
+    applied one after the other without forming any of them.
+
+    :param factors: list of operators with an apply method, in the \
+    order they appear in the product, i.e. the last one is applied first
+    """
+
+    def __init__(self, factors):
+        self.factors = []
+        for f in factors:
+            if isinstance(f, OperatorProduct):
+                self.factors.extend(f.factors)
+            else:
+                self.factors.append(f)
+
+    @property
+    def shape(self):
+        return self.factors[0].shape[0], self.factors[-1].shape[1]
+
+    @property
+    def nbytes(self):
+        return sum(f.nbytes for f in self.factors)
+
+    def apply(self, x):
+        """
+        Apply the factors in turn, right to left.
+
+        :param x: an m-dimensional or mxk-dimensional numpy array
+        """
+
+        for f in reversed(self.factors):
+            x = f.apply(x)
+        return x
+
+    def __matmul__(self, other):
+        if isinstance(other, (OrthogProjector, OperatorProduct)):
+            return OperatorProduct([self, other])
+        return self.apply(other)
+
+    def todense(self):
+        return self.apply(np.eye(self.shape[1]))
+
+
 def orthog_space(V):
     """
     Given set of vectors u_1,u_2,..., u_n, compute the
@@ -100,6 +302,53 @@ def GS_modified(A):
     return R
 
 
+def _panel_qr(W):
+    """
+    Reduced QR factorisation of a panel, normalised so that R has a real
+    positive diagonal as produced by Gram-Schmidt.
+    """
+
+    Q, R = np.linalg.qr(W)
+    d = np.diag(R).copy()
+    d[d == 0] = 1
+    d = d/np.abs(d)
+    return Q*d, d.conj()[:, None]*R
+
+
+def GS_block(A, panel=32):
+    """
+    Given an mxn matrix A, compute the QR factorisation by block
+    classical Gram-Schmidt with reorthogonalisation (BCGS2),
+    transforming A to Q in place and returning R.
+
+    Each panel of columns is projected against the previous columns
+    twice, with matrix-matrix products, and the panel itself is
+    orthogonalised by a local QR factorisation after each projection.
+
+    :param A: mxn numpy array
+    :param panel: integer, the number of columns in each panel
+
+    :return R: nxn numpy array
+    """
+
+    m, n = A.shape
+    R = np.zeros((n, n), dtype=A.dtype)
+    for j0 in range(0, n, panel):
+        j1 = min(j0 + panel, n)
+        Q = A[:, :j0]
+        W = A[:, j0:j1]
+        S1 = Q.conj().T.dot(W)
+        W = W - Q.dot(S1)
+        W, R1 = _panel_qr(W)
+        S2 = Q.conj().T.dot(W)
+        W = W - Q.dot(S2)
+        W, R2 = _panel_qr(W)
+        A[:, j0:j1] = W
+        R[:j0, j0:j1] = S1 + S2.dot(R1)
+        R[j0:j1, j0:j1] = R2.dot(R1)
+    return R
+
+
 def GS_modified_get_R(A, k):
     """
     Given an mxn matrix A, with columns of A[:, 0:k] assumed orthonormal,
@@ -118,11 +367,77 @@ def GS_modified_get_R(A, k):
 
     return R
 
+class ElementaryTriangular(object):
+    """
+    An nxn upper triangular matrix R_k which is equal to the identity
+    except in row k, as returned by GS_modified_get_R, stored by that
+    row only.
+
+    :param k: integer, the index of the nontrivial row
+    :param row: an n-dimensional numpy array, row k of R_k
+    """
+
+    def __init__(self, k, row):
+        self.k = k
+        self.row = row
+
+    @classmethod
+    def from_dense(cls, Rk, k):
+        """
+        Extract the structured form from the dense matrix R_k.
+        """
+
+        return cls(k, Rk[k, :].copy())
+
+    @classmethod
+    def from_inverse_row(cls, k, r):
+        """
+        Return R_k given row k of its inverse, i.e. row k of the
+        triangular factor R from modified Gram-Schmidt.
+        """
+
+        row = -r/r[k]
+        row[k] = 1/r[k]
+        row[:k] = 0
+        return cls(k, row)
+
+    def todense(self):
+        R = np.eye(self.row.shape[0], dtype=self.row.dtype)
+        R[self.k, :] = self.row
+        return R
+
+    def apply_right(self, A):
+        """
+        Overwrite A with A R_k, as a rank-1 update of columns k onwards.
+
+        :param A: mxn numpy array
+        """
+
+        k = self.k
+        w = self.row[k:].copy()
+        w[0] -= 1
+        A[:, k:] += np.outer(A[:, k], w)
+
+    def inverse_row(self):
+        """
+        Return row k of R_k^{-1}, the only row in which it differs from
+        the identity.
+        """
+
+        r = -self.row/self.row[self.k]
+        r[self.k] = 1/self.row[self.k]
+        return r
+
+
 def GS_modified_R(A):
     """
     Implement the modified Gram Schmidt algorithm using the lower triangular
     formulation with Rs provided from GS_modified_get_R.
 
+    Each R_k is applied as a rank-1 update, and since row k of
+    R = (R_1R_2...R_n)^{-1} is row k of R_k^{-1}, R is accumulated row by
+    row without forming the product or its inverse.
+
     :param A: mxn numpy array
 
     :return Q: mxn numpy array
@@ -131,10 +446,9 @@ def GS_modified_R(A):
 
     m, n = A.shape
     A = 1.0*A
-    R = np.eye(n, dtype=A.dtype)
+    R = np.zeros((n, n), dtype=A.dtype)
     for i in range(n):
-        Rk = GS_modified_get_R(A, i)
-        A[:,:] = np.dot(A, Rk)
-        R[:,:] = np.dot(R, Rk)
-    R = np.linalg.inv(R)
+        Rk = ElementaryTriangular.from_dense(GS_modified_get_R(A, i), i)
+        Rk.apply_right(A)
+        R[i, :] = Rk.inverse_row()
     return A, R
@@ -1,4 +1,10 @@
 import numpy as np
+import hashlib
+import os
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cla_utils.exercises2 import GS_block
 
 
 def householder(A):
@@ -7,12 +13,490 @@ def householder(A):
     using Householder transformations. The reduction should be done "in-place",
     so that A is transformed to R.
 
+    This is householder_blocked with a single panel spanning all the
+    columns, i.e. the unblocked algorithm.
+
+    :param A: an mxn-dimensional numpy array
+    """
+
+    m, n = A.shape
+    householder_blocked(A, block_size=max(n, 1))
+
+
+def _householder_vector(x):
+    """
+    Return the Householder reflector H = I - tau*v*v^* with v[0] = 1
+    such that Hx is a multiple of e_1, as the pair (v, tau).
+    """
+
+    v = x.copy()
+    nx = np.linalg.norm(x)
+    if nx == 0:
+        v[0] = 1
+        return v, 0.0
+    s = x[0]/abs(x[0]) if x[0] != 0 else 1
+    v[0] += s*nx
+    v /= v[0]
+    return v, 2/np.real(np.vdot(v, v))
+
+
+def _panel_V(A, j0, j1):
+    """
+    Return the unit lower trapezoidal matrix V of the reflector vectors
+    for columns j0 to j1 of a compact Householder factorisation.
+    """
+
+    V = np.tril(A[j0:, j0:j1], -1)
+    V[:j1-j0] += np.eye(j1-j0, dtype=V.dtype)
+    return V
+
+
+def _wy_T(V, tau):
+    """
+    Return the upper triangular T such that the product of the
+    reflectors I - tau_k*v_k*v_k^* in the columns of V is I - VTV^*.
+    """
+
+    b = V.shape[1]
+    T = np.zeros((b, b), dtype=V.dtype)
+    for k in range(b):
+        T[:k, k] = -tau[k]*T[:k, :k].dot(V[:, :k].conj().T.dot(V[:, k]))
+        T[k, k] = tau[k]
+    return T
+
+
+def _householder_factor(A, block_size=64):
+    """
+    Overwrite the mxn matrix A with its Householder QR factorisation in
+    compact form: R on and above the diagonal, and the reflector vectors
+    v_k (with implicit unit first entry) below it, as in LAPACK's geqrf.
+
+    Reflectors are computed a panel of block_size columns at a time, and
+    each panel's product of reflectors, written in compact WY form
+    I - VTV^*, is applied to the trailing columns with matrix-matrix
+    products.
+
     :param A: an mxn-dimensional numpy array
+    :param block_size: integer, the number of columns in each panel
+
+    :return tau: a min(m,n)-dimensional numpy array of reflector scalings
     """
 
     m, n = A.shape
+    p = min(m, n)
+    tau = np.zeros(p)
+    for j0 in range(0, p, block_size):
+        j1 = min(j0 + block_size, p)
+        b = j1 - j0
+        # unblocked factorisation of the panel
+        for k in range(j0, j1):
+            v, tau[k] = _householder_vector(A[k:, k])
+            A[k:, k:j1] -= tau[k]*np.outer(v, np.dot(v.conj(), A[k:, k:j1]))
+            A[k+1:, k] = v[1:]
+        if j1 == n:
+            break
+        # apply (I - VTV^*)^* to the trailing matrix
+        V = _panel_V(A, j0, j1)
+        T = _wy_T(V, tau[j0:j1])
+        C = A[j0:, j1:]
+        C -= V.dot(T.conj().T.dot(V.conj().T.dot(C)))
+    return tau
+
+
+def householder_blocked(A, block_size=64):
+    """
+    Given a real mxn matrix A, find the reduction to upper triangular
+    matrix R using blocked Householder transformations, in place, as in
+    householder. Reflectors for each panel of block_size columns are
+    combined in compact WY form and applied to the rest of the matrix
+    with matrix-matrix products.
+
+    :param A: an mxn-dimensional numpy array
+    :param block_size: integer, the number of columns in each panel
+    """
+
+    _householder_factor(A, block_size)
+    A[np.tril_indices(A.shape[0], -1, A.shape[1])] = 0
+
+
+class HouseholderQR(object):
+    """
+    The QR factorisation A = QR of an mxn matrix by Householder
+    reflections, with Q stored implicitly by its reflector vectors and
+    scalings in the compact layout of _householder_factor, so that Q is
+    never formed unless requested.
+
+    :param A: an mxn-dimensional numpy array
+    :param block_size: integer, the panel width used for the \
+    factorisation and for applying Q
+    :param overwrite: if True, A is overwritten by the factorisation \
+    instead of being copied. Default is False.
+    """
+
+    def __init__(self, A, block_size=64, overwrite=False):
+        self.QR = A if overwrite else A.astype(np.result_type(A, 1.0))
+        self.block_size = block_size
+        self.tau = _householder_factor(self.QR, block_size)
+        self._T = {}
+
+    @property
+    def shape(self):
+        return self.QR.shape
+
+    @property
+    def R(self):
+        """
+        The min(m,n)xn upper triangular factor.
+        """
+
+        p = min(self.shape)
+        return np.triu(self.QR[:p, :])
+
+    def _panels(self):
+        p = len(self.tau)
+        for j0 in range(0, p, self.block_size):
+            j1 = min(j0 + self.block_size, p)
+            V = _panel_V(self.QR, j0, j1)
+            if j0 not in self._T:
+                self._T[j0] = _wy_T(V, self.tau[j0:j1])
+            yield j0, V, self._T[j0]
+
+    def apply_Qh(self, b):
+        """
+        Compute Q^*b.
+
+        :param b: an m-dimensional or mxk-dimensional numpy array
+
+        :return c: numpy array of the same shape as b
+        """
+
+        c = b.astype(np.result_type(b, self.QR), copy=True)
+        for j0, V, T in self._panels():
+            c[j0:] -= V.dot(T.conj().T.dot(V.conj().T.dot(c[j0:])))
+        return c
 
-    raise NotImplementedError
+    def apply_Q(self, c):
+        """
+        Compute Qc.
+
+        :param c: an m-dimensional or mxk-dimensional numpy array
+
+        :return b: numpy array of the same shape as c
+        """
+
+        b = c.astype(np.result_type(c, self.QR), copy=True)
+        for j0, V, T in reversed(list(self._panels())):
+            b[j0:] -= V.dot(T.dot(V.conj().T.dot(b[j0:])))
+        return b
+
+    def Q(self, full=False):
+        """
+        Form Q explicitly.
+
+        :param full: if True, return the full mxm matrix Q, otherwise \
+        the economy size mxmin(m,n) matrix. Default is False.
+        """
+
+        m, n = self.shape
+        return self.apply_Q(np.eye(m, m if full else min(m, n),
+                                   dtype=self.QR.dtype))
+
+    def solve(self, b):
+        """
+        Solve Ax = b, for A square.
+
+        :param b: an m-dimensional or mxk-dimensional numpy array
+
+        :return x: numpy array of the same shape as b
+        """
+
+        m, n = self.shape
+        if m != n:
+            raise ValueError("solve requires a square matrix, use lstsq")
+        return solve_triangular(self.QR, self.apply_Qh(b))
+
+    def lstsq(self, b):
+        """
+        Return the least squares solution x to Ax = b, for m >= n.
+
+        :param b: an m-dimensional or mxk-dimensional numpy array
+
+        :return x: an n-dimensional or nxk-dimensional numpy array
+        """
+
+        m, n = self.shape
+        if m < n:
+            raise ValueError("lstsq requires m >= n")
+        return solve_triangular(self.QR[:n, :n], self.apply_Qh(b)[:n])
+
+
+class FactorCache(object):
+    """
+    A least-recently-used cache of HouseholderQR factorisations, so that
+    repeated solves with the same matrix cost O(m^2) each after the
+    first O(m^3) factorisation.
+
+    Matrices are identified either by the identity of the array object
+    (key="id", the cheapest, but the caller must invalidate a matrix
+    that is modified in place), or by a hash of the contents (key="hash",
+    which costs O(m^2) per lookup).
+
+    :param max_bytes: the maximum total size of the cached \
+    factorisations. The least recently used ones are evicted beyond this, \
+    and a factorisation larger than this is not cached.
+    :param key: "id" or "hash"
+    :param block_size: integer, passed to HouseholderQR
+    """
+
+    def __init__(self, max_bytes=2**28, key="id", block_size=64):
+        if key not in ("id", "hash"):
+            raise ValueError("Unknown cache key %s" % key)
+        self.max_bytes = max_bytes
+        self.key = key
+        self.block_size = block_size
+        self._cache = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _key(self, A):
+        if self.key == "id":
+            return id(A)
+        h = hashlib.sha1(np.ascontiguousarray(A).view(np.uint8))
+        return (A.shape, A.dtype.str, h.hexdigest())
+
+    def factor(self, A):
+        """
+        Return the HouseholderQR factorisation of A, from the cache if
+        possible.
+
+        :param A: an mxn-dimensional numpy array
+
+        :return F: a HouseholderQR object
+        """
+
+        k = self._key(A)
+        entry = self._cache.get(k)
+        # with id keys, check the array is still alive and the same one
+        if entry is not None and (entry[0] is None or entry[0]() is A):
+            self._cache.move_to_end(k)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if entry is not None:
+            self._remove(k)
+        F = HouseholderQR(A, block_size=self.block_size)
+        if F.QR.nbytes > self.max_bytes:
+            # too large to cache at all
+            return F
+        ref = weakref.ref(A) if self.key == "id" else None
+        self._cache[k] = (ref, F)
+        self.nbytes += F.QR.nbytes
+        while self.nbytes > self.max_bytes:
+            self._remove(next(iter(self._cache)))
+        return F
+
+    def _remove(self, k):
+        ref, F = self._cache.pop(k)
+        self.nbytes -= F.QR.nbytes
+
+    def invalidate(self, A=None):
+        """
+        Remove the factorisation of A from the cache, or clear the whole
+        cache if A is None.
+        """
+
+        if A is None:
+            self._cache.clear()
+            self.nbytes = 0
+        elif self._key(A) in self._cache:
+            self._remove(self._key(A))
+
+    def solve(self, A, b, chunk_size=None):
+        """
+        Solve Ax_i = b_i using the cached factorisation of A.
+
+        :param A: an mxm-dimensional numpy array
+        :param b: an m-dimensional or mxk-dimensional numpy array
+        :param chunk_size: integer, if given the columns of b are solved \
+        this many at a time, to bound the working memory
+
+        :return x: numpy array of the same shape as b
+        """
+
+        F = self.factor(A)
+        if chunk_size is None or b.ndim == 1:
+            return F.solve(b)
+        x = np.empty(b.shape, dtype=np.result_type(A, b, 1.0))
+        for j in range(0, b.shape[1], chunk_size):
+            x[:, j:j+chunk_size] = F.solve(b[:, j:j+chunk_size])
+        return x
+
+    def solve_stream(self, A, bs):
+        """
+        Solve Ax = b for each right-hand side b (or block of right-hand
+        sides) from an iterable, yielding the solutions as they are
+        computed.
+
+        :param A: an mxm-dimensional numpy array
+        :param bs: an iterable of m-dimensional or mxk-dimensional numpy \
+        arrays
+        """
+
+        F = self.factor(A)
+        for b in bs:
+            yield F.solve(b)
+
+
+def _substitute(T, X, lower):
+    """
+    Overwrite the mxk array X with the solution of TX = X for T
+    triangular, one row at a time.
+    """
+
+    m = T.shape[0]
+    for i in (range(m) if lower else range(m-1, -1, -1)):
+        if lower:
+            X[i] -= T[i, :i].dot(X[:i])
+        else:
+            X[i] -= T[i, i+1:].dot(X[i+1:])
+        X[i] /= T[i, i]
+
+
+def solve_triangular(T, b, lower=False, trans="N", overwrite_b=False,
+                     block_size=64):
+    """
+    Solve the triangular systems Tx_i = b_i (or T^Tx_i = b_i, or
+    T^*x_i = b_i), i=1,2,...,k.
+
+    The diagonal is split into blocks of block_size rows. Each diagonal
+    block is solved by substitution, and the solution is eliminated from
+    the remaining right-hand sides with a single matrix-matrix product,
+    so most of the work is done at BLAS-3 speed when k is large.
+
+    :param T: an mxm-dimensional numpy array, assumed triangular
+    :param b: an m-dimensional or mxk-dimensional numpy array
+    :param lower: if True T is lower triangular, otherwise upper. \
+    Default is False.
+    :param trans: "N" to solve with T, "T" with T^T, "C" with T^*
+    :param overwrite_b: if True, b is overwritten with the solution, \
+    which requires b to have a suitable dtype. Default is False.
+    :param block_size: integer, the size of the diagonal blocks
+
+    :return x: numpy array of the same shape as b
+    """
+
+    if trans == "T":
+        T, lower = T.T, not lower
+    elif trans == "C":
+        T, lower = T.conj().T, not lower
+    elif trans != "N":
+        raise ValueError("Unknown trans mode %s" % trans)
+    if overwrite_b:
+        x = b
+    else:
+        x = b.astype(np.result_type(T, b, 1.0), copy=True)
+    X = x if x.ndim == 2 else x[:, None]
+    m = T.shape[0]
+    starts = range(0, m, block_size)
+    for i0 in (starts if lower else reversed(starts)):
+        i1 = min(i0 + block_size, m)
+        _substitute(T[i0:i1, i0:i1], X[i0:i1], lower)
+        if lower:
+            X[i1:] -= T[i1:, i0:i1].dot(X[i0:i1])
+        else:
+            X[:i0] -= T[:i0, i0:i1].dot(X[i0:i1])
+    return x
+
+
+class PivotedQR(HouseholderQR):
+    """
+    Rank-revealing Householder QR factorisation with column pivoting,
+    AP = QR, stopped once the norm of the trailing submatrix is below
+    tol times the norm of A. At each step the column of the trailing
+    matrix with the largest norm is moved to the front, and the column
+    norms are downdated in O(n) operations, so a matrix of numerical
+    rank r costs O(mnr) operations.
+
+    Q is stored implicitly as in HouseholderQR, with only r reflectors.
+
+    :param A: an mxn-dimensional numpy array
+    :param tol: the relative tolerance for the trailing norm
+    :param overwrite: if True, A is overwritten by the factorisation \
+    instead of being copied. Default is False.
+
+    :attribute perm: an n-dimensional integer array, with A[:, perm] = QR
+    :attribute rank: the numerical rank r
+    """
+
+    def __init__(self, A, tol=1.0e-12, overwrite=False):
+        self.QR = A if overwrite else A.astype(np.result_type(A, 1.0))
+        self.block_size = 64
+        self._T = {}
+        A = self.QR
+        m, n = A.shape
+        self.perm = np.arange(n)
+        norms = np.linalg.norm(A, axis=0)**2
+        exact = norms.copy()
+        total = norms.sum()
+        tau = []
+        for k in range(min(m, n)):
+            if norms[k:].sum() <= tol**2*total:
+                break
+            p = k + np.argmax(norms[k:])
+            if p != k:
+                A[:, [k, p]] = A[:, [p, k]]
+                norms[[k, p]] = norms[[p, k]]
+                exact[[k, p]] = exact[[p, k]]
+                self.perm[[k, p]] = self.perm[[p, k]]
+            v, t = _householder_vector(A[k:, k])
+            A[k:, k:] -= t*np.outer(v, np.dot(v.conj(), A[k:, k:]))
+            A[k+1:, k] = v[1:]
+            tau.append(t)
+            # downdate the norms of the remaining columns, recomputing
+            # any that have lost too much to cancellation
+            norms[k+1:] -= np.abs(A[k, k+1:])**2
+            lost = np.nonzero(norms[k+1:] <= 1.0e-8*exact[k+1:])[0] + k+1
+            for j in lost:
+                norms[j] = exact[j] = np.linalg.norm(A[k+1:, j])**2
+        self.tau = np.array(tau)
+        self.rank = len(tau)
+
+    @property
+    def R(self):
+        """
+        The rxn upper trapezoidal factor, for the permuted columns.
+        """
+
+        return np.triu(self.QR[:self.rank, :])
+
+    def solve(self, b):
+        raise ValueError("solve is not available for a pivoted "
+                         "factorisation, use lstsq")
+
+    def lstsq(self, b):
+        """
+        Return the basic least squares solution x to Ax = b, which has
+        at most r nonzero entries, in the columns chosen by the pivoting.
+
+        :param b: an m-dimensional or mxk-dimensional numpy array
+
+        :return x: an n-dimensional or nxk-dimensional numpy array
+        """
+
+        r = self.rank
+        n = self.shape[1]
+        if r == 0:
+            # A is numerically zero, so the minimum norm solution is zero
+            return np.zeros((n,) + b.shape[1:],
+                            dtype=np.result_type(self.QR, b))
+        c = self.apply_Qh(b)[:r]
+        x = np.zeros((n,) + b.shape[1:], dtype=c.dtype)
+        x[self.perm[:r]] = solve_triangular(self.QR[:r, :r], c)
+        return x
 
 
 def solve_U(U, b):
@@ -26,11 +510,11 @@ def solve_U(U, b):
        the solution x_i
 
     """
-                     
-    raise NotImplementedError
+
+    return solve_triangular(U, b)
 
 
-def householder_solve(A, b):
+def householder_solve(A, b, cache=None):
     """
     Given a real mxm matrix A, use the Householder transformation to solve
     Ax_i=b_i, i=1,2,...,k.
@@ -38,43 +522,385 @@ def householder_solve(A, b):
     :param A: an mxm-dimensional numpy array
     :param b: an mxk-dimensional numpy array whose columns are the \
     right-hand side vectors b_1,b_2,...,b_k.
+    :param cache: an optional FactorCache, so that the factorisation of \
+    A is reused between calls
 
     :return x: an mxk-dimensional numpy array whose columns are the \
     right-hand side vectors x_1,x_2,...,x_k.
     """
 
-    raise NotImplementedError
+    if cache is not None:
+        return cache.solve(A, b)
+    x = HouseholderQR(A).solve(b)
 
     return x
 
 
-def householder_qr(A):
+def householder_qr(A, implicit=False):
     """
     Given a real mxn matrix A, use the Householder transformation to find
     the full QR factorisation of A.
 
     :param A: an mxn-dimensional numpy array
+    :param implicit: if True, return a HouseholderQR object, which \
+    stores Q implicitly, instead of the pair Q, R. Default is False.
 
     :return Q: an mxm-dimensional numpy array
     :return R: an mxn-dimensional numpy array
     """
 
-    raise NotImplementedError
+    F = HouseholderQR(A)
+    if implicit:
+        return F
+    Q = F.Q(full=True)
+    R = np.triu(F.QR)
 
     return Q, R
 
 
-def householder_ls(A, b):
+def householder_ls(A, b, rank_revealing=False, tol=1.0e-12):
     """
     Given a real mxn matrix A and an m dimensional vector b, find the
     least squares solution to Ax = b.
 
     :param A: an mxn-dimensional numpy array
     :param b: an m-dimensional numpy array
+    :param rank_revealing: if True, use column pivoted QR, which stops \
+    at the numerical rank of A, and return the basic solution. This \
+    handles rank deficient A. Default is False.
+    :param tol: relative tolerance for the numerical rank, used if \
+    rank_revealing
 
     :return x: an n-dimensional numpy array
     """
 
-    raise NotImplementedError
+    if rank_revealing:
+        return PivotedQR(A, tol=tol).lstsq(b)
+    x = HouseholderQR(A).lstsq(b)
 
     return x
+
+
+def _triangular_update(R, c, A, b):
+    """
+    Compute the QR factorisation of [R; A], for R nxn upper triangular
+    and A lxn, and apply its Q^* to [c; b]. The reflector for column j
+    only involves row j of R and the l rows of A, since the rows of R
+    below j are zero in that column, so the cost is O(ln^2) and the
+    only temporaries are the size of A and b.
+
+    :param R: an nxn-dimensional upper triangular numpy array
+    :param c: an n-dimensional or nxk-dimensional numpy array
+    :param A: an lxn-dimensional numpy array, which is not modified
+    :param b: an l-dimensional or lxk-dimensional numpy array, which \
+    is not modified
+
+    :return R: the updated triangular factor
+    :return c: the updated first n entries of Q^*[c; b]
+    :return d: the remaining l entries of Q^*[c; b], the residual part
+    """
+
+    dtype = np.result_type(R, A, 1.0)
+    R = R.astype(dtype)
+    A = A.astype(dtype, copy=True)
+    c = c.astype(np.result_type(c, b, dtype))
+    d = b.astype(c.dtype, copy=True)
+    for j in range(R.shape[0]):
+        x = np.concatenate(([R[j, j]], A[:, j]))
+        v, tau = _householder_vector(x)
+        w = v[1:].conj()
+        s = R[j, j:] + w.dot(A[:, j:])
+        R[j, j:] -= tau*s
+        A[:, j:] -= tau*np.outer(v[1:], s)
+        s = c[j] + w.dot(d)
+        c[j] -= tau*s
+        d -= tau*np.multiply.outer(v[1:], s)
+    return R, c, d
+
+
+class StreamingLS(object):
+    """
+    Least squares solver for Ax = b where the rows of A and b arrive in
+    chunks. The triangular factor R of the rows seen so far and Q^*b
+    are updated by Householder QR of [R; A_chunk] which exploits R being
+    triangular (see _triangular_update), at O(ln^2) cost for a chunk of
+    l rows, so the memory used is O(n^2) (plus one chunk) however many
+    rows arrive.
+
+    :param n: integer, the number of columns of A
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.R = np.zeros((0, n))
+        self.c = None
+        self.rows = 0
+        self.residual_norm2 = 0.0
+
+    def update(self, A, b):
+        """
+        Add rows to the least squares problem.
+
+        :param A: an lxn-dimensional numpy array of new rows of A
+        :param b: an l-dimensional or lxk-dimensional numpy array of \
+        the corresponding rows of b
+        """
+
+        if A.shape[1] != self.n:
+            raise ValueError("Chunk has %d columns, expected %d"
+                             % (A.shape[1], self.n))
+        if self.c is None:
+            self.c = np.zeros((0,) + b.shape[1:])
+        if self.R.shape[0] == self.n:
+            self.R, self.c, d = _triangular_update(self.R, self.c, A, b)
+            self.residual_norm2 += np.linalg.norm(d)**2
+            self.rows += A.shape[0]
+            return
+        # fewer than n rows so far, so R is not yet square
+        S = np.concatenate((self.R, A))
+        F = HouseholderQR(S, overwrite=True)
+        c = F.apply_Qh(np.concatenate((self.c, b)))
+        p = min(S.shape)
+        self.R = F.R
+        self.c = c[:p]
+        self.residual_norm2 += np.linalg.norm(c[p:])**2
+        self.rows += A.shape[0]
+
+    def update_all(self, chunks):
+        """
+        Add rows from an iterable of (A_chunk, b_chunk) pairs.
+        """
+
+        for A, b in chunks:
+            self.update(A, b)
+        return self
+
+    @property
+    def residual_norm(self):
+        """
+        The norm of the least squares residual Ax - b for the rows so far.
+        """
+
+        return np.sqrt(self.residual_norm2)
+
+    def solution(self):
+        """
+        Return the least squares solution for the rows seen so far.
+
+        :return x: an n-dimensional or nxk-dimensional numpy array
+        """
+
+        if self.rows < self.n:
+            raise ValueError("Need at least %d rows, have %d"
+                             % (self.n, self.rows))
+        return solve_triangular(self.R, self.c)
+
+
+def npy_chunks(A_file, b_file, chunk_rows):
+    """
+    Iterate over (A_chunk, b_chunk) pairs read from .npy files, which are
+    memory-mapped so that each chunk is a view of the file rather than
+    a copy in memory.
+
+    :param A_file: filename of an mxn array saved with numpy.save
+    :param b_file: filename of an m-dimensional or mxk array
+    :param chunk_rows: integer, the number of rows in each chunk
+    """
+
+    A = np.load(A_file, mmap_mode="r")
+    b = np.load(b_file, mmap_mode="r")
+    if A.shape[0] != b.shape[0]:
+        raise ValueError("A and b have different numbers of rows")
+    for i in range(0, A.shape[0], chunk_rows):
+        yield A[i:i+chunk_rows], b[i:i+chunk_rows]
+
+
+def streaming_ls(chunks, n):
+    """
+    Given an iterable of (A_chunk, b_chunk) pairs of rows of an mxn
+    matrix A and vector b, find the least squares solution to Ax = b,
+    using O(n^2) memory.
+
+    :param chunks: an iterable of (A_chunk, b_chunk) pairs, for \
+    example from npy_chunks
+    :param n: integer, the number of columns of A
+
+    :return x: an n-dimensional numpy array
+    """
+
+    return StreamingLS(n).update_all(chunks).solution()
+
+
+def _leaf_qr(A, method):
+    """
+    Reduced QR factorisation of one row block for tsqr.
+    """
+
+    if method == "householder":
+        return np.linalg.qr(A)
+    elif method == "GS":
+        Q = A.copy()
+        R = GS_block(Q)
+        return Q, R
+    raise ValueError("Unknown QR method %s" % method)
+
+
+def _leaf_apply(Q, S):
+    return Q.dot(S)
+
+
+class TSQR(object):
+    """
+    The implicitly stored QR factorisation of a tall-skinny mxn matrix
+    A = QR computed by tsqr: the reduced Q factors of the row blocks of
+    A, together with the tree of small Q factors that combined the
+    blocks' R factors.
+
+    :param leaves: list of the mixn reduced Q factors of the row blocks
+    :param levels: list of the levels of the reduction tree, from the \
+    leaves up. Each level is a list with, for each node, either a tuple \
+    (Q, na) where Q has the stacked rows of two children, the first na \
+    from the first child, or None for a child passed up unchanged.
+    :param R: nxn numpy array, the triangular factor
+    """
+
+    def __init__(self, leaves, levels, R):
+        self.leaves = leaves
+        self.levels = levels
+        self.R = R
+
+    @property
+    def shape(self):
+        return sum(Q.shape[0] for Q in self.leaves), self.R.shape[1]
+
+    def _tree_down(self, C):
+        S = [C]
+        for nodes in reversed(self.levels):
+            T = []
+            for node, s in zip(nodes, S):
+                if node is None:
+                    T.append(s)
+                else:
+                    Q, na = node
+                    t = Q.dot(s)
+                    T.extend((t[:na], t[na:]))
+            S = T
+        return S
+
+    def apply_Q(self, C):
+        """
+        Compute QC, for the reduced mxn matrix Q.
+
+        :param C: an n-dimensional or nxk-dimensional numpy array
+
+        :return B: an m-dimensional or mxk-dimensional numpy array
+        """
+
+        S = self._tree_down(C)
+        return np.concatenate([Q.dot(s) for Q, s in zip(self.leaves, S)])
+
+    def apply_Qh(self, B):
+        """
+        Compute Q^*B, for the reduced mxn matrix Q.
+
+        :param B: an m-dimensional or mxk-dimensional numpy array
+
+        :return C: an n-dimensional or nxk-dimensional numpy array
+        """
+
+        S = []
+        i = 0
+        for Q in self.leaves:
+            S.append(Q.conj().T.dot(B[i:i+Q.shape[0]]))
+            i += Q.shape[0]
+        for nodes in self.levels:
+            T = []
+            j = 0
+            for node in nodes:
+                if node is None:
+                    T.append(S[j])
+                    j += 1
+                else:
+                    Q, na = node
+                    T.append(Q.conj().T.dot(np.concatenate(S[j:j+2])))
+                    j += 2
+            S = T
+        return S[0]
+
+    def Q(self):
+        """
+        Form the reduced mxn matrix Q explicitly.
+        """
+
+        return self.apply_Q(np.eye(self.R.shape[1], dtype=self.R.dtype))
+
+    def solve_ls(self, b):
+        """
+        Return the least squares solution x to Ax = b.
+
+        :param b: an m-dimensional or mxk-dimensional numpy array
+
+        :return x: an n-dimensional or nxk-dimensional numpy array
+        """
+
+        return solve_triangular(self.R, self.apply_Qh(b))
+
+
+def tsqr(A, nblocks=None, workers=None, method="householder",
+         executor="thread", explicit=False):
+    """
+    Compute the reduced QR factorisation of a tall-skinny mxn matrix A
+    by splitting it into row blocks, factorising the blocks in parallel,
+    and combining their R factors in a binary reduction tree.
+
+    :param A: an mxn-dimensional numpy array, with m >= n
+    :param nblocks: integer, the number of row blocks. Default is the \
+    number of workers. Each block must have at least n rows.
+    :param workers: integer, the number of parallel workers. Default \
+    is the number of CPUs.
+    :param method: "householder" (LAPACK Householder QR) or "GS" \
+    (GS_block) for the row blocks
+    :param executor: "thread" or "process". Threads suffice for the \
+    "householder" method, since LAPACK releases the GIL; the "GS" \
+    method needs processes to run in parallel.
+    :param explicit: if True, return the explicit Q and R, otherwise \
+    return a TSQR object storing Q implicitly. Default is False.
+
+    :return F: a TSQR object, or if explicit, the tuple (Q, R) of an \
+    mxn-dimensional and an nxn-dimensional numpy array
+    """
+
+    m, n = A.shape
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if nblocks is None:
+        nblocks = workers
+    nblocks = max(1, min(nblocks, m//max(n, 1)))
+    bounds = np.linspace(0, m, nblocks + 1).astype(int)
+    blocks = [A[bounds[i]:bounds[i+1]] for i in range(nblocks)]
+    pools = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+    if executor not in pools:
+        raise ValueError("Unknown executor %s" % executor)
+
+    with pools[executor](max_workers=workers) as pool:
+        leaves = list(pool.map(_leaf_qr, blocks, [method]*nblocks))
+        Rs = [R for Q, R in leaves]
+        levels = []
+        while len(Rs) > 1:
+            nodes = []
+            merged = []
+            for i in range(0, len(Rs) - 1, 2):
+                Q, R = np.linalg.qr(np.concatenate(Rs[i:i+2]))
+                nodes.append((Q, Rs[i].shape[0]))
+                merged.append(R)
+            if len(Rs) % 2:
+                nodes.append(None)
+                merged.append(Rs[-1])
+            levels.append(nodes)
+            Rs = merged
+        F = TSQR([Q for Q, R in leaves], levels, Rs[0])
+        if not explicit:
+            return F
+        S = F._tree_down(np.eye(n, dtype=F.R.dtype))
+        Q = np.concatenate(list(pool.map(_leaf_apply, F.leaves, S)))
+    return Q, F.R
@@ -1,4 +1,6 @@
 import numpy as np
+from cla_utils.exercises3 import _householder_vector, _wy_T, \
+    solve_triangular
 
 def Q1AQ1s(A):
     """
@@ -37,6 +39,400 @@ def hessenbergQ(A):
 
     raise NotImplementedError
 
+class HessenbergQ(object):
+    """
+    The unitary matrix Q from a blocked Hessenberg reduction
+    A = QHQ^*, stored implicitly as a product of compact WY panels
+    I - VTV^*, acting on rows j0+1 onwards.
+
+    :param m: integer, the dimension of Q
+    :param panels: list of tuples (j0, V, T)
+    """
+
+    def __init__(self, m, panels):
+        self.m = m
+        self.panels = panels
+
+    @property
+    def shape(self):
+        return self.m, self.m
+
+    def apply_Q(self, X):
+        """
+        Compute QX.
+
+        :param X: an m-dimensional or mxk-dimensional numpy array
+
+        :return Y: numpy array of the same shape as X
+        """
+
+        Y = X.astype(np.result_type(X, *[T for j0, V, T in self.panels]),
+                     copy=True)
+        for j0, V, T in reversed(self.panels):
+            Y[j0+1:] -= V.dot(T.dot(V.conj().T.dot(Y[j0+1:])))
+        return Y
+
+    def apply_Qh(self, X):
+        """
+        Compute Q^*X.
+
+        :param X: an m-dimensional or mxk-dimensional numpy array
+
+        :return Y: numpy array of the same shape as X
+        """
+
+        Y = X.astype(np.result_type(X, *[T for j0, V, T in self.panels]),
+                     copy=True)
+        for j0, V, T in self.panels:
+            Y[j0+1:] -= V.dot(T.conj().T.dot(V.conj().T.dot(Y[j0+1:])))
+        return Y
+
+    def todense(self):
+        """
+        Form Q explicitly.
+        """
+
+        return self.apply_Q(np.eye(self.m))
+
+
+def hessenberg_blocked(A, block_size=32):
+    """
+    For a matrix A, transform to Hessenberg form H by Householder
+    similarity transformations, in place, in the blocked style of
+    LAPACK's DGEHRD.
+
+    The reflectors for each panel of block_size columns are generated
+    with the panel's columns updated on the fly, accumulating
+    Y = AVT alongside the compact WY form I - VTV^*. The rest of the
+    matrix then receives the deferred two-sided update
+    A <- (I - VTV^*)^*(A - YV^*) with matrix-matrix products.
+
+    :param A: an mxm numpy array
+    :param block_size: integer, the number of columns in each panel
+
+    :return Q: a HessenbergQ storing Q implicitly, with QHQ^* = A
+    """
+
+    m = A.shape[0]
+    panels = []
+    for j0 in range(0, m-2, block_size):
+        j1 = min(j0 + block_size, m-2)
+        b = j1 - j0
+        V = np.zeros((m, b), dtype=A.dtype)
+        T = np.zeros((b, b), dtype=A.dtype)
+        Z = np.zeros((m, b), dtype=A.dtype)
+        Y = np.zeros((m, b), dtype=A.dtype)
+        for i in range(b):
+            k = j0 + i
+            a = A[:, k]
+            # bring column k up to date with the panel's reflectors so far
+            if i > 0:
+                a -= Y[:, :i].dot(V[k, :i].conj())
+                W = V[j0+1:, :i]
+                a[j0+1:] -= W.dot(T[:i, :i].conj().T.dot(W.conj().T.dot(
+                    a[j0+1:])))
+            v, t = _householder_vector(a[k+1:])
+            V[k+1:, i] = v
+            a[k+1:] -= t*v*np.vdot(v, a[k+1:])
+            a[k+2:] = 0
+            T[:i, i] = -t*T[:i, :i].dot(V[:, :i].conj().T.dot(V[:, i]))
+            T[i, i] = t
+            Z[:, i] = A[:, k+1:].dot(v)
+            Y[:, i] = Z[:, :i+1].dot(T[:i+1, i])
+        # deferred update of the trailing columns
+        A[:, j1:] -= Y.dot(V[j1:].conj().T)
+        W = V[j0+1:]
+        A[j0+1:, j1:] -= W.dot(T.conj().T.dot(W.conj().T.dot(A[j0+1:, j1:])))
+        panels.append((j0, W, T))
+    return HessenbergQ(m, panels)
+
+
+def tridiagonal_blocked(A, block_size=32):
+    """
+    For a Hermitian matrix A, transform to tridiagonal form by Householder
+    similarity transformations, in place, in the blocked style of
+    LAPACK's ZHETRD/ZLATRD.
+
+    Hermitian symmetry means each reflector needs one matrix-vector
+    product with the trailing matrix only (instead of with all rows, as
+    in hessenberg_blocked), and the two-sided update of a panel is the
+    rank-2b update A <- A - VW^* - WV^*, applied to the trailing matrix
+    with matrix-matrix products once per panel.
+
+    :param A: an mxm numpy array, Hermitian
+    :param block_size: integer, the number of columns in each panel
+
+    :return Q: a HessenbergQ storing Q implicitly, with QTQ^* = A
+    """
+
+    m = A.shape[0]
+    panels = []
+    for j0 in range(0, m-2, block_size):
+        j1 = min(j0 + block_size, m-2)
+        b = j1 - j0
+        # V and W act on rows j0+1 onwards
+        V = np.zeros((m-j0-1, b), dtype=A.dtype)
+        W = np.zeros((m-j0-1, b), dtype=A.dtype)
+        tau = np.zeros(b)
+        for i in range(b):
+            k = j0 + i
+            a = A[k:, k]
+            # bring column k up to date with the panel's updates so far
+            if i > 0:
+                a -= V[i-1:, :i].dot(W[i-1, :i].conj()) + \
+                    W[i-1:, :i].dot(V[i-1, :i].conj())
+            v, t = _householder_vector(a[1:])
+            a[1:] -= t*v*np.vdot(v, a[1:])
+            a[2:] = 0
+            A[k, k+1:] = a[1:].conj()
+            V[i:, i] = v
+            tau[i] = t
+            Vi, Wi = V[i:, :i], W[i:, :i]
+            p = t*(A[k+1:, k+1:].dot(v) - Vi.dot(Wi.conj().T.dot(v)) -
+                   Wi.dot(Vi.conj().T.dot(v)))
+            W[i:, i] = p - 0.5*t*np.vdot(p, v)*v
+        # deferred rank-2b update of the trailing matrix
+        Vt, Wt = V[b-1:], W[b-1:]
+        A[j1:, j1:] -= Vt.dot(Wt.conj().T) + Wt.dot(Vt.conj().T)
+        panels.append((j0, V, _wy_T(V, tau)))
+    return HessenbergQ(m, panels)
+
+
+def is_hermitian(A, tol=1.0e-12):
+    """
+    Return True if the square matrix A is Hermitian, to within a
+    relative tolerance.
+
+    :param A: an mxm numpy array
+    :param tol: the relative tolerance
+    """
+
+    return np.linalg.norm(A - A.conj().T) <= tol*np.linalg.norm(A)
+
+
+class Tridiagonal(object):
+    """
+    A real symmetric tridiagonal mxm matrix, stored by its diagonal and
+    subdiagonal only, using O(m) memory.
+
+    Complex Hermitian tridiagonal matrices are brought to this form by a
+    diagonal unitary similarity D = diag(phase), see from_hermitian.
+
+    :param d: an m-dimensional real numpy array, the diagonal
+    :param e: an (m-1)-dimensional real numpy array, the subdiagonal
+    :param phase: an m-dimensional numpy array of unit complex numbers \
+    such that the original matrix is D T D^*, or None if D = I
+    """
+
+    def __init__(self, d, e, phase=None):
+        self.d = d
+        self.e = e
+        self.phase = phase
+
+    @classmethod
+    def from_hermitian(cls, H):
+        """
+        Take the tridiagonal part of the Hermitian matrix H, making the
+        subdiagonal real and nonnegative if H is complex.
+
+        :param H: an mxm numpy array
+        """
+
+        d = np.real(np.diag(H)).copy()
+        e = np.diag(H, -1).copy()
+        if not np.iscomplexobj(e):
+            return cls(d, e)
+        ae = np.abs(e)
+        u = np.ones(e.shape, dtype=e.dtype)
+        nz = ae > 0
+        u[nz] = e[nz]/ae[nz]
+        phase = np.concatenate(([1], np.cumprod(u)))
+        return cls(d, ae, phase)
+
+    @property
+    def shape(self):
+        return self.d.shape[0], self.d.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.d.nbytes + self.e.nbytes
+
+    def todense(self):
+        """
+        Form the dense tridiagonal matrix T.
+        """
+
+        return np.diag(self.d) + np.diag(self.e, -1) + np.diag(self.e, 1)
+
+    def matvec(self, x):
+        """
+        Compute Tx in O(m) operations.
+
+        :param x: an m-dimensional or mxk-dimensional numpy array
+        """
+
+        y = (self.d*x.T).T
+        y[1:] += (self.e*x[:-1].T).T
+        y[:-1] += (self.e*x[1:].T).T
+        return y
+
+
+def _guard_pivots(d, scale):
+    """
+    Replace exactly (or nearly) zero pivots in d, in place, by a tiny
+    multiple of scale, so that a shift equal to an eigenvalue can still
+    be used for inverse iteration.
+    """
+
+    small = np.finfo(float).eps*max(scale, np.finfo(float).tiny)
+    d[np.abs(d) < small] = small
+
+
+class HessenbergLU(object):
+    """
+    The LU factorisation with partial pivoting P(H - mu I) = LU of an
+    upper Hessenberg matrix H, in O(m^2) operations. Only adjacent rows
+    are ever interchanged, so L is stored as m-1 multipliers and the
+    interchanges as m-1 flags.
+
+    :param H: an mxm numpy array, upper Hessenberg, which is not modified
+    :param mu: the shift
+    """
+
+    def __init__(self, H, mu=0.0):
+        m = H.shape[0]
+        U = H.astype(np.result_type(H, mu, 1.0), copy=True)
+        U[np.diag_indices(m)] -= mu
+        self.l = np.zeros(max(m-1, 0), dtype=U.dtype)
+        self.swap = np.zeros(max(m-1, 0), dtype=bool)
+        for k in range(m-1):
+            if abs(U[k+1, k]) > abs(U[k, k]):
+                U[[k, k+1], k:] = U[[k+1, k], k:]
+                self.swap[k] = True
+            if U[k, k] != 0:
+                self.l[k] = U[k+1, k]/U[k, k]
+                U[k+1, k+1:] -= self.l[k]*U[k, k+1:]
+            U[k+1, k] = 0
+        d = U.diagonal().copy()
+        _guard_pivots(d, np.linalg.norm(H, 1))
+        U[np.diag_indices(m)] = d
+        self.U = U
+
+    def solve(self, b):
+        """
+        Solve (H - mu I)x = b in O(m^2) operations.
+
+        :param b: an m-dimensional or mxk-dimensional numpy array
+
+        :return x: numpy array of the same shape as b
+        """
+
+        dtype = np.result_type(b, self.U)
+        y = b.astype(dtype, copy=True)
+        y = y.tolist() if y.ndim == 1 else list(y)
+        l = self.l.tolist()
+        swap = self.swap.tolist()
+        for k in range(len(l)):
+            if swap[k]:
+                y[k], y[k+1] = y[k+1], y[k]
+            y[k+1] = y[k+1] - l[k]*y[k]
+        return solve_triangular(self.U, np.array(y, dtype=dtype),
+                                overwrite_b=True)
+
+
+class TridiagonalLU(object):
+    """
+    The LU factorisation with partial pivoting P(T - mu I) = LU of a
+    Tridiagonal T, in O(m) operations and storage, as in LAPACK's
+    xGTTRF: U has two superdiagonals, L is stored as m-1 multipliers
+    and the adjacent row interchanges as m-1 flags.
+
+    :param T: a Tridiagonal (its phase, if any, is ignored)
+    :param mu: the shift
+    """
+
+    def __init__(self, T, mu=0.0):
+        dtype = np.result_type(T.d, mu)
+        m = T.d.shape[0]
+        # the recurrences run over Python scalars, which is much faster
+        # than indexing numpy arrays element by element
+        d = (T.d - mu).tolist()
+        dl = T.e.tolist()
+        du = T.e.tolist()
+        du2 = [0.0]*max(m-2, 0)
+        l = [0.0]*max(m-1, 0)
+        swap = [False]*max(m-1, 0)
+        for k in range(m-1):
+            if abs(dl[k]) > abs(d[k]):
+                # interchange rows k and k+1
+                swap[k] = True
+                l[k] = d[k]/dl[k]
+                d[k], du[k], d[k+1] = dl[k], d[k+1], du[k] - l[k]*d[k+1]
+                if k < m-2:
+                    du2[k] = du[k+1]
+                    du[k+1] = -l[k]*du[k+1]
+            elif d[k] != 0:
+                l[k] = dl[k]/d[k]
+                d[k+1] -= l[k]*du[k]
+        self.d = np.array(d, dtype=dtype)
+        _guard_pivots(self.d, np.abs(T.d).max() +
+                      2*np.abs(T.e).max(initial=0))
+        self.du = np.array(du, dtype=dtype)
+        self.du2 = np.array(du2, dtype=dtype)
+        self.l = np.array(l, dtype=dtype)
+        self.swap = np.array(swap, dtype=bool)
+
+    def solve(self, b):
+        """
+        Solve (T - mu I)x = b in O(m) operations.
+
+        :param b: an m-dimensional or mxk-dimensional numpy array
+
+        :return x: numpy array of the same shape as b
+        """
+
+        # the recurrences run over Python scalars (or rows), which is
+        # much faster than indexing numpy arrays element by element
+        d, du, du2, l, swap = (a.tolist() for a in
+                               (self.d, self.du, self.du2, self.l, self.swap))
+        m = len(d)
+        y = b.astype(np.result_type(b, self.d), copy=True)
+        y = y.tolist() if y.ndim == 1 else list(y)
+        for k in range(m-1):
+            if swap[k]:
+                y[k], y[k+1] = y[k+1], y[k]
+            y[k+1] = y[k+1] - l[k]*y[k]
+        y[m-1] = y[m-1]/d[m-1]
+        if m > 1:
+            y[m-2] = (y[m-2] - du[m-2]*y[m-1])/d[m-2]
+        for k in range(m-3, -1, -1):
+            y[k] = (y[k] - du[k]*y[k+1] - du2[k]*y[k+2])/d[k]
+        return np.array(y, dtype=np.result_type(b, self.d))
+
+
+def tridiagonalise(A, hermitian=None, block_size=32):
+    """
+    For a Hermitian matrix A, transform to tridiagonal form by Householder
+    similarity transformations, in place, and return the tridiagonal
+    matrix in O(m) storage.
+
+    :param A: an mxm numpy array
+    :param hermitian: if None, check whether A is Hermitian, otherwise \
+    the caller declares that it is
+    :param block_size: integer, passed to tridiagonal_blocked
+
+    :return T: a Tridiagonal with A = QDTD^*Q^*
+    :return Q: a HessenbergQ storing Q implicitly
+    """
+
+    if hermitian is None:
+        hermitian = is_hermitian(A)
+    if not hermitian:
+        raise ValueError("tridiagonalise requires a Hermitian matrix")
+    Q = tridiagonal_blocked(A, block_size)
+    return Tridiagonal.from_hermitian(A), Q
+
+
 def hessenberg_ev(H):
     """
     Given a Hessenberg matrix, return the eigenvectors.
@@ -1,5 +1,14 @@
 import numpy as np
 import numpy.random as random
+import heapq
+import math
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait
+from cla_utils.exercises2 import GS_block
+from cla_utils.exercises3 import HouseholderQR, solve_triangular
+from cla_utils.exercises8 import hessenberg_blocked, is_hermitian, \
+    tridiagonalise, Tridiagonal, HessenbergLU, TridiagonalLU
 
 def get_A100():
     """
@@ -77,6 +86,137 @@ def get_B3():
                      [ 0.42118629, -0.02666057,  0.23330798]])
 
 
+class IterateHistory(object):
+    """
+    A bounded-memory record of the iterates of pow_it, inverse_it or
+    rq_it, passed to them as store_iterations in place of True (which
+    keeps every iterate in memory). The iteration then returns its
+    final iterate and eigenvalue estimate as usual, and the history is
+    filled in as it runs.
+
+    Only every every-th iterate is kept. Kept iterates are passed to
+    callback if given, otherwise stored in a buffer: a memory map of the
+    file filename if given, which is opened here, or an array in
+    memory. In every mode, if maxlen is given only the most recent
+    maxlen kept iterates (and their iteration numbers and eigenvalue
+    estimates) are held, the buffer being used as a ring; otherwise the
+    buffer is doubled in size whenever it fills.
+
+    :param every: integer, keep every every-th iterate. Default is 1.
+    :param maxlen: integer, the number of most recent kept iterates to \
+    hold, or None to hold all of them. Default is None.
+    :param filename: None, or the path of a file, which is truncated, \
+    to write the kept iterates to
+    :param callback: None, or a function callback(it, x, l), called \
+    with each kept iterate
+    :param m: integer, the length of the iterates, needed with filename
+    :param dtype: the dtype of the iterates stored in the file. Default \
+    is float; use complex for complex iterates.
+    """
+
+    def __init__(self, every=1, maxlen=None, filename=None, callback=None,
+                 m=None, dtype=float):
+        self.every = every
+        self.maxlen = maxlen
+        self.filename = filename
+        self.callback = callback
+        self.n = 0
+        self._its = deque(maxlen=maxlen)
+        self._lambdas = deque(maxlen=maxlen)
+        self._buf = None
+        if filename is not None and callback is None:
+            if m is None:
+                raise ValueError("m is needed to store iterates in a file")
+            self.m, self.dtype = m, np.dtype(dtype)
+            self._buf = self._open(maxlen or 16)
+
+    def _open(self, cap):
+        # (re)size the file to cap iterates and map it
+        mode = "wb" if self._buf is None else "r+b"
+        with open(self.filename, mode) as f:
+            f.truncate(cap*self.m*self.dtype.itemsize)
+        return np.memmap(self.filename, dtype=self.dtype, mode="r+",
+                         shape=(cap, self.m))
+
+    def wants(self, it):
+        """
+        Return True if iteration it (counting from 0) is to be kept.
+        """
+
+        return it % self.every == 0
+
+    def record(self, it, x, l):
+        """
+        Keep the iterate x, with eigenvalue estimate l, from iteration it.
+        """
+
+        self._its.append(it)
+        self._lambdas.append(l)
+        if self.callback is not None:
+            self.callback(it, x, l)
+            self.n += 1
+            return
+        if self._buf is None:
+            self.m, self.dtype = x.shape[0], x.dtype
+            self._buf = np.empty((self.maxlen or 16, self.m),
+                                 dtype=self.dtype)
+        cap = self._buf.shape[0]
+        if self.maxlen is None and self.n == cap:
+            if self.filename is not None:
+                self._buf.flush()
+                self._buf = self._open(2*cap)
+            else:
+                self._buf = np.concatenate((self._buf,
+                                            np.empty_like(self._buf)))
+        self._buf[self.n % self._buf.shape[0]] = x
+        self.n += 1
+
+    @property
+    def iterations(self):
+        """
+        The iteration numbers of the kept iterates, oldest first.
+        """
+
+        return np.array(self._its, dtype=int)
+
+    @property
+    def lambdas(self):
+        """
+        The eigenvalue estimates of the kept iterates, oldest first.
+        """
+
+        return np.array(self._lambdas)
+
+    @property
+    def X(self):
+        """
+        The kept iterates as the columns of an m-row numpy array, oldest
+        first; with filename, a view of the memory map unless the ring
+        has wrapped around.
+        """
+
+        if self.callback is not None:
+            raise ValueError("Iterates were passed to the callback")
+        if self.n == 0:
+            return None
+        if self.filename is not None:
+            self._buf.flush()
+        if self.maxlen is not None and self.n > self.maxlen:
+            return self._buf[(self.n + np.arange(self.maxlen)) %
+                             self.maxlen].T
+        return self._buf[:self.n].T
+
+
+def _history(store_iterations):
+    """
+    Return store_iterations if it is an IterateHistory, otherwise None.
+    """
+
+    if isinstance(store_iterations, IterateHistory):
+        return store_iterations
+    return None
+
+
 def pow_it(A, x0, tol, maxit, store_iterations = False):
     """
     For a matrix A, apply the power iteration algorithm with initial
@@ -88,48 +228,440 @@ def pow_it(A, x0, tol, maxit, store_iterations = False):
 
     or the number of iterations exceeds maxit.
 
-    :param A: an mxm numpy array
+    A may also be a bxmxm stack of matrices, with x0 an m dimensional
+    array or a bxm stack of starting vectors, in which case all b
+    problems are iterated at once, each until its own residual is below
+    tol (see _pow_it_batched).
+
+    :param A: an mxm numpy array, or a bxmxm stack
     :param x0: the starting vector for the power iteration
     :param tol: a positive float, the tolerance
     :param maxit: integer, max number of iterations
     :param store_iterations: if True, then return the entire sequence \
     of power iterates, instead of just the final iteration. Default is \
-    False.
+    False. An IterateHistory records the iterates within bounded memory \
+    instead, and the final iterate is returned.
 
     :return x: an m dimensional numpy array containing the final iterate, or \
-    if store_iterations, an mxmaxit dimensional numpy array containing all \
-    the iterates.
-    :return lambda0: the final eigenvalue.
+    if store_iterations, an mxnits dimensional numpy array containing all \
+    the iterates (or for a stack, a bxm array of final iterates).
+    :return lambda0: the final eigenvalue (or for a stack, a b \
+    dimensional array of them).
     """
 
-    raise NotImplementedError
+    if A.ndim == 3:
+        _no_batch_history(store_iterations)
+        return _pow_it_batched(A, x0, tol, maxit)
+    history = _history(store_iterations)
+    keep_all = bool(store_iterations) and history is None
+    xs = []
+    x = x0/np.linalg.norm(x0)
+    Ax = A.dot(x)
+    lambda0 = np.vdot(x, Ax)
+    for it in range(maxit):
+        x = Ax/np.linalg.norm(Ax)
+        Ax = A.dot(x)
+        lambda0 = np.vdot(x, Ax)
+        if keep_all:
+            xs.append(x)
+        elif history is not None and history.wants(it):
+            history.record(it, x, lambda0)
+        if np.linalg.norm(Ax - lambda0*x) < tol:
+            break
+    if keep_all:
+        return np.reshape(xs, (len(xs), x.shape[0])).T, lambda0
     return x, lambda0
 
 
-def inverse_it(A, x0, mu, tol, maxit, store_iterations = False):
+def _no_batch_history(store_iterations):
+    if store_iterations:
+        raise ValueError("store_iterations is not supported for a stack")
+
+
+def _batch_start(A, x0):
+    """
+    Return the normalised bxm stack of starting vectors for the bxmxm
+    stack A, broadcasting x0 if it is a single vector.
+    """
+
+    b, m, _ = A.shape
+    x = np.empty((b, m), dtype=np.result_type(A, x0, 1.0))
+    x[:] = x0
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def _pow_it_batched(A, x0, tol, maxit):
+    """
+    Power iteration on a bxmxm stack A, see pow_it.
+
+    Each iteration is one batched matrix-vector product over the
+    problems that have not yet converged; a converged problem keeps
+    its final iterate and is dropped from the stack.
+    """
+
+    x = _batch_start(A, x0)
+    active = np.arange(x.shape[0])
+    Aa = A
+    Ax = np.matmul(A, x[:, :, None])[:, :, 0]
+    lambda0 = np.einsum("ij,ij->i", x.conj(), Ax)
+    for it in range(maxit):
+        xa = Ax/np.linalg.norm(Ax, axis=1, keepdims=True)
+        Ax = np.matmul(Aa, xa[:, :, None])[:, :, 0]
+        la = np.einsum("ij,ij->i", xa.conj(), Ax)
+        x[active] = xa
+        lambda0[active] = la
+        done = np.linalg.norm(Ax - la[:, None]*xa, axis=1) < tol
+        if done.any():
+            active = active[~done]
+            if len(active) == 0:
+                break
+            Aa = Aa[~done]
+            Ax = Ax[~done]
+    return x, lambda0
+
+
+def _orthonormalise(Y, method):
+    """
+    Return an orthonormal basis for the columns of the mxk array Y, by
+    Householder QR or by block Gram-Schmidt.
+    """
+
+    if method == "householder":
+        return HouseholderQR(Y).Q()
+    if method == "GS":
+        Q = Y.astype(np.result_type(Y, 1.0), copy=True)
+        GS_block(Q)
+        return Q
+    raise ValueError("Unknown method %s" % method)
+
+
+def _rayleigh_ritz(X, W, hermitian):
+    """
+    Given orthonormal X and W = AX (or stacks of them), return the Ritz
+    values of A in the span of X, ordered by decreasing modulus, and the
+    kxk matrices S such that XS are the Ritz vectors.
+    """
+
+    M = np.matmul(np.swapaxes(X.conj(), -1, -2), W)
+    if hermitian:
+        lambdas, S = np.linalg.eigh(0.5*(M + np.swapaxes(M.conj(), -1, -2)))
+    else:
+        lambdas, S = np.linalg.eig(M)
+    order = np.argsort(-np.abs(lambdas), axis=-1)
+    lambdas = np.take_along_axis(lambdas, order, -1)
+    S = np.take_along_axis(S, order[..., None, :], -1)
+    return lambdas, S
+
+
+def block_pow_it(A, X0, tol, maxit, reorth=1, method="householder",
+                 hermitian=None):
+    """
+    For a matrix A, apply block power (subspace) iteration with initial
+    guess the k columns of X0 to find the k eigenvalues of largest
+    modulus, until either ||r|| < tol for each of them, where
+
+    r = Ax - lambda*x,
+
+    or the number of iterations exceeds maxit.
+
+    Each iteration costs one matrix-matrix product with A. Every reorth
+    iterations (and always on the last) the block is orthonormalised,
+    by HouseholderQR or GS_block, and Ritz values and vectors are
+    extracted by Rayleigh-Ritz; the leading converged Ritz vectors are
+    then locked, so that they are no longer multiplied by A, and the
+    remaining columns are kept orthogonal to them. In between, the
+    columns are only normalised.
+
+    A may also be a stack of independent matrices, of shape bxmxm, with
+    X0 of shape bxmxk, in which case each iteration uses one batched
+    matrix-matrix product over the problems that have not yet
+    converged, and each problem stops as soon as all of its k
+    eigenpairs have converged (there is no locking of single columns).
+
+    :param A: an mxm numpy array, or a bxmxm stack
+    :param X0: an mxk numpy array, or a bxmxk stack, the starting block
+    :param tol: a positive float, the tolerance
+    :param maxit: integer, max number of iterations, at least 1
+    :param reorth: integer, the number of iterations between \
+    orthonormalisations
+    :param method: "householder" or "GS", the QR factorisation used to \
+    orthonormalise
+    :param hermitian: if None, check whether A is Hermitian (in which \
+    case the Ritz values are real), otherwise the caller declares it
+
+    :return X: an mxk (or bxmxk) numpy array of Ritz vectors
+    :return lambdas: a k (or bxk) dimensional numpy array of Ritz values, \
+    in order of decreasing modulus
+    :return its: a k dimensional integer array, the iteration at which \
+    each eigenpair converged and was locked, or for a stack a b \
+    dimensional array, the iteration at which each problem converged; \
+    -1 if it did not
+    """
+
+    if maxit < 1:
+        raise ValueError("maxit must be at least 1")
+    if hermitian is None:
+        hermitian = all(is_hermitian(a)
+                        for a in A.reshape((-1,) + A.shape[-2:]))
+    dtype = np.result_type(A, X0, 1.0 if hermitian else 1j)
+    if A.ndim == 3:
+        return _block_pow_it_batched(A, X0, tol, maxit, reorth, method,
+                                     hermitian, dtype)
+
+    m, k = X0.shape
+    X = X0.astype(dtype)
+    W = np.zeros((m, k), dtype=dtype)  # W[:, :nlock] = AX[:, :nlock]
+    its = -np.ones(k, dtype=int)
+    nlock = 0
+    for it in range(maxit):
+        check = it % reorth == 0 or it == maxit - 1
+        Xa = X[:, nlock:]
+        if check:
+            # orthogonalise twice against the locked vectors, then QR
+            L = X[:, :nlock]
+            for _ in range(2):
+                Xa = Xa - L.dot(L.conj().T.dot(Xa))
+            Xa = X[:, nlock:] = _orthonormalise(Xa, method)
+        W[:, nlock:] = A.dot(Xa)
+        if not check:
+            Wa = W[:, nlock:]
+            X[:, nlock:] = Wa/np.linalg.norm(Wa, axis=0)
+            continue
+        # Rayleigh-Ritz over the whole block, reusing AX for locked columns
+        lambdas, S = _rayleigh_ritz(X, W, hermitian)
+        V = X.dot(S)
+        AV = W.dot(S)
+        converged = np.linalg.norm(AV - V*lambdas, axis=0) < tol
+        nconv = np.argmin(converged) if not np.all(converged) else k
+        its[nlock:nconv] = it + 1
+        nlock = max(nlock, nconv)
+        if nlock == k:
+            break
+        if hermitian:
+            X, W = V.copy(), AV.copy()
+        else:
+            # an orthonormal basis ordered as the Ritz vectors, AV = WR
+            X = _orthonormalise(V, method)
+            R = X.conj().T.dot(V)
+            W = solve_triangular(R, AV.T, trans="T").T
+        X[:, nlock:] = W[:, nlock:]/np.linalg.norm(W[:, nlock:], axis=0)
+    return V, lambdas, its
+
+
+def _block_pow_it_batched(A, X0, tol, maxit, reorth, method, hermitian,
+                          dtype):
+    """
+    Block power iteration on a bxmxm stack A, see block_pow_it.
+    """
+
+    b, m, k = X0.shape
+    X = X0.astype(dtype)
+    V = np.zeros((b, m, k), dtype=dtype)
+    lambdas = np.zeros((b, k), dtype=dtype)
+    its = -np.ones(b, dtype=int)
+    active = np.arange(b)
+    for it in range(maxit):
+        check = it % reorth == 0 or it == maxit - 1
+        Aa = A if len(active) == b else A[active]
+        Xa = X[active]
+        if check:
+            Xa = np.stack([_orthonormalise(x, method) for x in Xa])
+        W = np.matmul(Aa, Xa)
+        if not check:
+            X[active] = W/np.linalg.norm(W, axis=1, keepdims=True)
+            continue
+        lam, S = _rayleigh_ritz(Xa, W, hermitian)
+        Xa = np.matmul(Xa, S)
+        W = np.matmul(W, S)
+        r = np.linalg.norm(W - Xa*lam[:, None, :], axis=1)
+        V[active] = Xa
+        lambdas[active] = lam
+        done = np.all(r < tol, axis=1)
+        its[active[done]] = it + 1
+        active = active[~done]
+        if len(active) == 0:
+            break
+        W = W[~done]
+        X[active] = W/np.linalg.norm(W, axis=1, keepdims=True)
+    return V, lambdas, its
+
+
+def _reduce(A):
+    """
+    Reduce A by a unitary similarity to a Tridiagonal, if A is
+    Hermitian, or to upper Hessenberg form otherwise, returning the
+    reduced matrix M, the HessenbergQ Q and the phase of the
+    Tridiagonal (or None), so that A = Q D M D^* Q^* with D = diag(phase).
+    """
+
+    if is_hermitian(A):
+        M, Q = tridiagonalise(A.copy(), hermitian=True)
+        return M, Q, M.phase
+    M = A.astype(np.result_type(A, 1.0), copy=True)
+    return M, hessenberg_blocked(M), None
+
+
+def _to_reduced(Q, phase, x):
+    """
+    Map x to the coordinates of the reduced matrix, D^*Q^*x.
+    """
+
+    y = Q.apply_Qh(x)
+    return y if phase is None else (phase.conj()*y.T).T
+
+
+def _from_reduced(Q, phase, y):
+    """
+    Map y from the coordinates of the reduced matrix, QDy.
+    """
+
+    return Q.apply_Q(y if phase is None else (phase*y.T).T)
+
+
+def _factorise(M, mu):
+    """
+    Return the LU factorisation of M - mu I for the reduced matrix M,
+    in O(m) (or O(m^2)) operations.
+    """
+
+    if isinstance(M, Tridiagonal):
+        return TridiagonalLU(M, mu)
+    return HessenbergLU(M, mu)
+
+
+def _matvec(M):
+    """
+    Return a function computing Mx for the reduced matrix M.
+    """
+
+    return M.matvec if isinstance(M, Tridiagonal) else M.dot
+
+
+def _rayleigh_quotient(M, y, w):
+    """
+    Return y^*w, with w = My, which is real if M is a Tridiagonal.
+    """
+
+    l = np.vdot(y, w)
+    return l.real if isinstance(M, Tridiagonal) else l
+
+
+def _recorder(history, Q, phase):
+    """
+    Return a function record(it, y, l) which maps the iterate y back
+    from the reduced coordinates into history, if it is to be kept.
+    """
+
+    def record(it, y, l):
+        if history.wants(it):
+            history.record(it, _from_reduced(Q, phase, y), l)
+    return record
+
+
+def _inverse_it_task(M, y0, mu, tol, maxit, store_iterations, record=None):
+    """
+    Run inverse iteration with shift mu on the reduced matrix M, either
+    an upper Hessenberg numpy array or a Tridiagonal, factorising
+    M - mu I once. Return the final iterate (or all of them) and the
+    eigenvalue estimate(s), passing each iterate to record if given.
+    """
+
+    F = _factorise(M, mu)
+    matvec = _matvec(M)
+    y = y0/np.linalg.norm(y0)
+    ys = []
+    ls = []
+    for it in range(maxit):
+        y = F.solve(y)
+        y /= np.linalg.norm(y)
+        w = matvec(y)
+        l = _rayleigh_quotient(M, y, w)
+        if store_iterations:
+            ys.append(y)
+            ls.append(l)
+        elif record is not None:
+            record(it, y, l)
+        if np.linalg.norm(w - l*y) < tol:
+            break
+    if store_iterations:
+        return np.array(ys).T, np.array(ls)
+    return y, l
+
+
+def inverse_it(A, x0, mu, tol, maxit, store_iterations = False,
+               workers=1, executor="process"):
     """
     For a Hermitian matrix A, apply the inverse iteration algorithm
     with initial guess x0, using the same termination criteria as
     for pow_it.
 
+    A is first reduced to tridiagonal form A = QTQ^* (or, if it is not
+    Hermitian, to Hessenberg form), and T - mu I is factorised once by
+    LU with partial pivoting, so that each iteration costs O(m) (or
+    O(m^2)) operations instead of O(m^3). The iterates stay in the
+    reduced coordinates and are mapped back through Q at the end.
+
+    mu may also be a sequence of shifts, which share the reduction and
+    are run independently, in parallel if workers > 1.
+
     :param A: an mxm numpy array
-    :param mu: a floating point number, the shift parameter
+    :param mu: a floating point number, the shift parameter, or a \
+    sequence of them
     :param x0: the starting vector for the power iteration
     :param tol: a positive float, the tolerance
     :param maxit: integer, max number of iterations
     :param store_iterations: if True, then return the entire sequence \
     of inverse iterates, instead of just the final iteration. Default is \
-    False.
+    False. An IterateHistory (or for a sequence of shifts, a list of \
+    them) records the iterates within bounded memory instead, and the \
+    final iterate is returned; this needs workers=1 or threads.
+    :param workers: integer, the number of parallel workers for a \
+    sequence of shifts. Default is 1, which runs in serial.
+    :param executor: "process" or "thread"
 
     :return x: an m dimensional numpy array containing the final iterate, or \
-    if store_iterations, an mxmaxit dimensional numpy array containing \
-    all the iterates.
+    if store_iterations, an mxnits dimensional numpy array containing \
+    all the iterates, or for a sequence of shifts, a list of these
     :return l: a floating point number containing the final eigenvalue \
-    estimate, or if store_iterations, a maxit dimensional numpy array containing \
-    all the iterates.
+    estimate, or if store_iterations, a nits dimensional numpy array \
+    containing all the estimates, or for a sequence of shifts, a list \
+    of these
     """
 
-    raise NotImplementedError
+    M, Q, phase = _reduce(A)
+    y0 = _to_reduced(Q, phase, x0)
+
+    shifts = np.atleast_1d(mu)
+    histories = store_iterations
+    if not isinstance(store_iterations, (list, tuple)):
+        histories = [store_iterations]*len(shifts)
+    histories = [_history(h) for h in histories]
+    records = [None if h is None else _recorder(h, Q, phase)
+               for h in histories]
+    keep_all = bool(store_iterations) and histories[0] is None
+    if histories[0] is not None and workers > 1 and executor != "thread":
+        raise ValueError("An IterateHistory needs workers=1 or threads")
+    args = [(M, y0, s, tol, maxit, keep_all, r)
+            for s, r in zip(shifts, records)]
+    if workers == 1:
+        results = [_inverse_it_task(*a) for a in args]
+    else:
+        pools = {"thread": ThreadPoolExecutor,
+                 "process": ProcessPoolExecutor}
+        if executor not in pools:
+            raise ValueError("Unknown executor %s" % executor)
+        with pools[executor](max_workers=workers) as pool:
+            results = list(pool.map(_inverse_it_task, *zip(*args)))
+
+    xs = []
+    ls = []
+    for y, l in results:
+        xs.append(_from_reduced(Q, phase, y))
+        ls.append(l)
+    if np.ndim(mu) == 0:
+        return xs[0], ls[0]
+    return xs, ls
 
 
 def rq_it(A, x0, tol, maxit, store_iterations = False):
@@ -138,36 +670,820 @@ def rq_it(A, x0, tol, maxit, store_iterations = False):
     with initial guess x0, using the same termination criteria as
     for pow_it.
 
-    :param A: an mxm numpy array
+    A is reduced once to tridiagonal form A = QTQ^* (or, if it is not
+    Hermitian, to Hessenberg form), so that the shifted system solved on
+    each iteration costs O(m) (or O(m^2)) operations instead of O(m^3),
+    even though the shift changes. The iterates are mapped back through
+    Q only at the end.
+
+    A may also be a bxmxm stack of small matrices, with x0 an m
+    dimensional array or a bxm stack of starting vectors, in which case
+    all b problems are iterated at once with batched dense solves, each
+    until its own residual is below tol (see _rq_it_batched).
+
+    :param A: an mxm numpy array, or a bxmxm stack
     :param x0: the starting vector for the power iteration
     :param tol: a positive float, the tolerance
     :param maxit: integer, max number of iterations
     :param store_iterations: if True, then return the entire sequence \
     of inverse iterates, instead of just the final iteration. Default is \
-    False.
+    False. An IterateHistory records the iterates within bounded memory \
+    instead, and the final iterate is returned.
 
     :return x: an m dimensional numpy array containing the final iterate, or \
-    if store_iterations, an mxmaxit dimensional numpy array containing \
-    all the iterates.
+    if store_iterations, an mxnits dimensional numpy array containing \
+    all the iterates (or for a stack, a bxm array of final iterates).
     :return l: a floating point number containing the final eigenvalue \
-    estimate, or if store_iterations, an m dimensional numpy array containing \
-    all the iterates.
+    estimate, or if store_iterations, an nits dimensional numpy array \
+    containing all the iterates (or for a stack, a b dimensional array \
+    of final estimates).
+    """
+
+    if A.ndim == 3:
+        _no_batch_history(store_iterations)
+        return _rq_it_batched(A, x0, tol, maxit)
+    history = _history(store_iterations)
+    keep_all = bool(store_iterations) and history is None
+    M, Q, phase = _reduce(A)
+    record = None if history is None else _recorder(history, Q, phase)
+    y = _to_reduced(Q, phase, x0)
+    y /= np.linalg.norm(y)
+    matvec = _matvec(M)
+    l = _rayleigh_quotient(M, y, matvec(y))
+    ys = []
+    ls = []
+    for it in range(maxit):
+        y = _factorise(M, l).solve(y)
+        y /= np.linalg.norm(y)
+        w = matvec(y)
+        l = _rayleigh_quotient(M, y, w)
+        if keep_all:
+            ys.append(y)
+            ls.append(l)
+        elif record is not None:
+            record(it, y, l)
+        if np.linalg.norm(w - l*y) < tol:
+            break
+    if keep_all:
+        return _from_reduced(Q, phase, np.array(ys).T), np.array(ls)
+    return _from_reduced(Q, phase, y), l
+
+
+def _shifted_solve(A, l, x):
+    """
+    Solve (A[i] - l[i] I)y[i] = x[i] for each matrix of the bxmxm stack
+    A, nudging any shift which is an eigenvalue to working precision.
+    """
+
+    I = np.eye(A.shape[1])
+    try:
+        return np.linalg.solve(A - l[:, None, None]*I, x[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        y = np.empty_like(x)
+        for i in range(A.shape[0]):
+            try:
+                y[i] = np.linalg.solve(A[i] - l[i]*I, x[i])
+            except np.linalg.LinAlgError:
+                e = np.finfo(float).eps*(1 + np.linalg.norm(A[i]))
+                y[i] = np.linalg.solve(A[i] - (l[i] + e)*I, x[i])
+        return y
+
+
+def _rq_it_batched(A, x0, tol, maxit):
+    """
+    Rayleigh quotient iteration on a bxmxm stack A, see rq_it.
+
+    The matrices are assumed small, so each iteration is one batched
+    dense solve over the problems that have not yet converged rather
+    than a reduction of each; a converged problem keeps its final
+    iterate and is dropped from the stack.
     """
 
-    raise NotImplementedError
+    x = _batch_start(A, x0)
+    active = np.arange(x.shape[0])
+    Aa = A
+    xa = x
+    l = np.einsum("ij,ij->i", x.conj(), np.matmul(A, x[:, :, None])[:, :, 0])
+    la = l.copy()
+    for it in range(maxit):
+        xa = _shifted_solve(Aa, la, xa)
+        xa /= np.linalg.norm(xa, axis=1, keepdims=True)
+        w = np.matmul(Aa, xa[:, :, None])[:, :, 0]
+        la = np.einsum("ij,ij->i", xa.conj(), w)
+        x[active] = xa
+        l[active] = la
+        done = np.linalg.norm(w - la[:, None]*xa, axis=1) < tol
+        if done.any():
+            active = active[~done]
+            if len(active) == 0:
+                break
+            Aa = Aa[~done]
+            xa = xa[~done]
+            la = la[~done]
+    return x, l
 
 
-def pure_QR(A, maxit, tol):
+def pure_QR(A, maxit, tol, hermitian=None, shift="auto"):
     """
     For matrix A, apply the QR algorithm and return the result.
 
-    :param A: an mxm numpy array
-    :param maxit: the maximum number of iterations
-    :param tol: termination tolerance
+    By default this is the shifted QR algorithm with deflation of
+    shifted_QR, which reduces A once to Hessenberg (or tridiagonal)
+    form at O(m^3) cost, after which each sweep costs O(m^2) (or O(m))
+    flops. For a non-Hermitian A each sweep is also a Python loop over
+    O(m) rotations (or reflectors), whose overhead, rather than the
+    flops, dominates the time at moderate m.
+    Hermitian matrices (detected, or declared with hermitian=True) are
+    iterated on the diagonal and subdiagonal of their tridiagonal form
+    only, at O(m) cost per iteration. With shift=None the unshifted
+    iteration is used instead, which is only implemented for Hermitian
+    matrices, see pure_QR_tridiagonal.
+
+    :param A: an mxm numpy array, which is not modified
+    :param maxit: the maximum number of iterations (sweeps), in total \
+    over the blocks that deflation splits A into
+    :param tol: termination tolerance, for each subdiagonal entry of \
+    the shifted iteration and for the norm of the subdiagonal of the \
+    unshifted one
+    :param hermitian: if None, check whether A is Hermitian, otherwise \
+    use the tridiagonal path if True and the dense path if False
+    :param shift: "wilkinson", "francis" (for real A), "auto" for \
+    Francis double shifts if A is real and Wilkinson shifts otherwise, \
+    so that a real A gives a real (quasi-triangular) result, or None \
+    for the unshifted algorithm
 
     :return Ak: the result
     """
 
-    raise NotImplementedError
+    if hermitian is None:
+        hermitian = is_hermitian(A)
+    if shift is None:
+        if not hermitian:
+            raise ValueError("Unshifted QR needs a Hermitian matrix")
+        T, _ = tridiagonalise(A.copy(), hermitian=True)
+        return pure_QR_tridiagonal(T, maxit, tol).todense()
+    if shift == "auto":
+        shift = "wilkinson" if np.iscomplexobj(A) else "francis"
+    if hermitian:
+        T, _, _, _ = _shifted_QR_tridiagonal(A, maxit, tol, False, 1,
+                                             "process", 64)
+        return T.todense()
+    _, _, Ak, _ = shifted_QR(A, maxit, tol, shift, hermitian, schur=True)
+    return Ak
+
+
+def tridiagonal_qr_step(T, mu=0.0, Z=None):
+    """
+    Apply one step of the QR algorithm with shift mu, T - mu I = QR,
+    T <- RQ + mu I, to a real symmetric Tridiagonal, in place, in O(m)
+    operations. The Givens rotations are computed in a single pass, after
+    which the new diagonal and subdiagonal follow from the band of R
+    with vectorised operations.
+
+    :param T: a Tridiagonal with real d and e
+    :param mu: a float, the shift
+    :param Z: None, or a numpy array with m columns which is replaced \
+    by ZQ, in place, to accumulate the Schur vectors
+    """
+
+    d, e = T.d, T.e
+    m = d.shape[0]
+    if m < 2:
+        return
+    x = d - mu
+    c = np.ones(m)  # c[k+1], s[k+1] hold the rotation for rows k, k+1
+    sn = np.zeros(m)
+    r0 = np.zeros(m)  # diagonal of R
+    r1 = np.zeros(m-1)  # first superdiagonal of R
+    p, q = x[0], e[0]
+    for k in range(m-1):
+        r = np.hypot(p, e[k])
+        ck, sk = (p/r, e[k]/r) if r > 0 else (1.0, 0.0)
+        r0[k] = r
+        r1[k] = ck*q + sk*x[k+1]
+        p = ck*x[k+1] - sk*q
+        q = ck*e[k+1] if k < m-2 else 0.0
+        c[k+1], sn[k+1] = ck, sk
+    r0[m-1] = p
+    # RQ, with Q the product of the transposed rotations
+    e[:] = sn[1:]*r0[1:]
+    d[:m-1] = c[1:]*c[:-1]*r0[:-1] + sn[1:]*r1
+    d[m-1] = c[m-1]*r0[m-1]
+    d += mu
+    if Z is not None:
+        for k in range(m-1):
+            zk = Z[:, k].copy()
+            Z[:, k] *= c[k+1]
+            Z[:, k] += sn[k+1]*Z[:, k+1]
+            Z[:, k+1] *= c[k+1]
+            Z[:, k+1] -= sn[k+1]*zk
+
+
+def pure_QR_tridiagonal(T, maxit, tol):
+    """
+    Apply the (unshifted) QR algorithm to a real symmetric Tridiagonal,
+    in place, using O(m) memory and O(m) operations per iteration.
+
+    :param T: a Tridiagonal, as returned by tridiagonalise
+    :param maxit: the maximum number of iterations
+    :param tol: termination tolerance on the norm of the subdiagonal
+
+    :return T: the Tridiagonal result
+    """
+
+    for it in range(maxit):
+        if np.linalg.norm(T.e) < tol:
+            break
+        tridiagonal_qr_step(T)
+    return T
+
+
+def _negligible(h, a, b, tol):
+    """
+    Return True where the subdiagonal entry h, between the diagonal
+    entries a and b, can be set to zero: below tol, or below working
+    precision relative to its neighbours.
+    """
+
+    eps = np.finfo(float).eps
+    return np.abs(h) <= np.maximum(tol, eps*(np.abs(a) + np.abs(b)))
+
+
+def _active_start(sub, diag, hi, tol):
+    """
+    Return the start l of the unreduced block ending at row hi, given
+    the subdiagonal and diagonal of a Hessenberg matrix.
+    """
+
+    small = np.flatnonzero(_negligible(sub[:hi], diag[:hi], diag[1:hi+1],
+                                       tol))
+    return small[-1] + 1 if len(small) else 0
+
+
+def _unreduced_blocks(small):
+    """
+    Return the (lo, hi) index ranges of the diagonal blocks separated
+    by the negligible subdiagonal entries flagged in small.
+    """
+
+    cuts = np.concatenate(([0], np.flatnonzero(small) + 1, [len(small)+1]))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _givens(x, y):
+    """
+    Return c (real) and s such that G = [[c, s], [-conj(s), c]] is
+    unitary and G[x, y]^T = [r, 0]^T.
+    """
+
+    x, y = complex(x), complex(y)
+    ax, ay = abs(x), abs(y)
+    if ay == 0:
+        return 1.0, 0.0
+    if ax == 0:
+        return 0.0, y.conjugate()/ay
+    nrm = math.hypot(ax, ay)
+    return ax/nrm, (x/ax)*y.conjugate()/nrm
+
+
+def _apply_window(H, a, r, w0, w1, i0, j1, U, Z):
+    """
+    Apply the unitary U, accumulated over one block of a bulge chase
+    that transformed rows and columns a:r of H within the diagonal
+    window w0:w1, to the rest of those rows (up to column j1), to the
+    rest of those columns (from row i0), and to columns a:r of Z.
+    """
+
+    H[a:r, w1:j1] = np.dot(U.conj().T, H[a:r, w1:j1])
+    H[i0:w0, a:r] = np.dot(H[i0:w0, a:r], U)
+    if Z is not None:
+        Z[:, a:r] = np.dot(Z[:, a:r], U)
+
+
+def _wilkinson_shift(a, b, c, d):
+    """
+    Return the eigenvalue of [[a, b], [c, d]] closest to d.
+    """
+
+    h = 0.5*(a - d)
+    disc = np.sqrt(h*h + b*c + 0j)
+    if abs(h + disc) < abs(h - disc):
+        disc = -disc
+    if h + disc == 0:
+        return d
+    return d - b*c/(h + disc)
+
+
+def _chase_window(H, l, a, b, w1):
+    """
+    Return a copy of the diagonal window w0:w1 of H, w0 = max(l, a-1),
+    for chasing the bulge from column a to column b, stacked on an
+    identity whose columns line up with columns a:b of the window, in
+    which the transformations of the chase are accumulated as U.
+    """
+
+    w0 = max(l, a-1)
+    n = w1 - w0
+    M = np.zeros((n + b - a, n), dtype=H.dtype)
+    M[:n] = H[w0:w1, w0:w1]
+    M[n:, a-w0:b-w0] = np.eye(b - a)
+    return M, w0, n
+
+
+def _single_shift_sweep(H, l, hi, mu, i0, j1, Z, block_size=16):
+    """
+    Chase the bulge for one implicit QR step with shift mu through the
+    unreduced Hessenberg window l:hi+1 of H, with Givens rotations.
+
+    The rotations are applied block_size at a time to a copy of the
+    small diagonal window that they touch, and accumulated in U, which
+    then updates the rest of H (and Z) with matrix-matrix products, so
+    that the Python loop only ever works on short rows and columns.
+    Below the bulge the window is zero, so each rotation acts on whole
+    rows and columns of it (and of U, stacked below it).
+    """
+
+    G = np.empty((2, 2), dtype=complex)
+    Gh = np.empty((2, 2), dtype=complex)
+    x, y = H[l, l] - mu, H[l+1, l]
+    for a in range(l, hi, block_size):
+        b = min(a + block_size, hi)
+        w1 = min(b+2, hi+1)
+        M, w0, n = _chase_window(H, l, a, b+1, w1)
+        for k in range(a, b):
+            c, s = _givens(x, y)
+            G[0, 0] = G[1, 1] = Gh[0, 0] = Gh[1, 1] = c
+            G[0, 1], G[1, 0] = s, -s.conjugate()
+            Gh[0, 1], Gh[1, 0] = -s, s.conjugate()
+            r = k - w0
+            M[r:r+2, :n] = np.dot(G, M[r:r+2, :n])
+            M[:, r:r+2] = np.dot(M[:, r:r+2], Gh)
+            if k > l:
+                M[r+1, r-1] = 0
+            if k < hi-1:
+                x, y = M[r+1, r], M[r+2, r]
+        H[w0:w1, w0:w1] = M[:n]
+        _apply_window(H, a, b+1, w0, w1, i0, j1, M[n:, a-w0:b+1-w0], Z)
+
+
+def _reflector(x, y, z=None):
+    """
+    Return the pair (v, tau) of _householder_vector for the real vector
+    [x, y, z] (or [x, y] if z is None), computed with scalar arithmetic.
+    """
+
+    nrm = math.hypot(x, y) if z is None else math.hypot(x, y, z)
+    if nrm == 0:
+        return np.array([1.0, 0.0, 0.0][:2 if z is None else 3]), 0.0
+    alpha = x + nrm if x >= 0 else x - nrm
+    if z is None:
+        v1 = y/alpha
+        return np.array([1.0, v1]), 2/(1 + v1*v1)
+    v1, v2 = y/alpha, z/alpha
+    return np.array([1.0, v1, v2]), 2/(1 + v1*v1 + v2*v2)
+
+
+def _francis_sweep(H, l, hi, s, t, i0, j1, Z, block_size=16):
+    """
+    Chase the bulge for one implicit Francis double shift step, with
+    shifts the roots of z^2 - sz + t, through the unreduced real
+    Hessenberg window l:hi+1 of H, with 3x3 Householder reflectors,
+    applied block_size at a time as in _single_shift_sweep.
+    """
+
+    x = H[l, l]*H[l, l] + H[l, l+1]*H[l+1, l] - s*H[l, l] + t
+    y = H[l+1, l]*(H[l, l] + H[l+1, l+1] - s)
+    z = H[l+1, l]*H[l+2, l+1]
+    for a in range(l, hi, block_size):
+        b = min(a + block_size, hi)
+        e, w1 = min(b+2, hi+1), min(b+3, hi+1)
+        M, w0, n = _chase_window(H, l, a, e, w1)
+        for k in range(a, b):
+            p = min(k+3, hi+1)
+            v, tau = _reflector(float(x), float(y),
+                                float(z) if p-k == 3 else None)
+            tv = tau*v
+            r, q = k - w0, p - w0
+            R = M[r:q, :n]
+            R -= tv[:, None]*v.dot(R)
+            C = M[:, r:q]
+            C -= C.dot(v)[:, None]*tv
+            if k > l:
+                M[r+1:q, r-1] = 0
+            if k < hi-1:
+                x, y = M[r+1, r], M[r+2, r]
+                if k < hi-2:
+                    z = M[r+3, r]
+        H[w0:w1, w0:w1] = M[:n]
+        _apply_window(H, a, e, w0, w1, i0, j1, M[n:, a-w0:e-w0], Z)
+
+
+def _split_real_pair(H, k, i0, j1, Z):
+    """
+    If the real 2x2 diagonal block of H at k, k+1 has real eigenvalues,
+    triangularise it with a rotation and return True.
+    """
+
+    a, b, c, d = H[k, k], H[k, k+1], H[k+1, k], H[k+1, k+1]
+    h = 0.5*(a - d)
+    disc = h*h + b*c
+    if disc < 0:
+        return False
+    lam = 0.5*(a + d) + np.copysign(np.sqrt(disc), h)
+    # eigenvector for lam, taking the better conditioned formula
+    if abs(b) + abs(lam - a) > abs(lam - d) + abs(c):
+        x, y = b, lam - a
+    else:
+        x, y = lam - d, c
+    cs, sn = _givens(x, y)
+    G = np.array([[cs, sn.real], [-sn.real, cs]])
+    H[k:k+2, k:j1] = G.dot(H[k:k+2, k:j1])
+    H[i0:k+2, k:k+2] = H[i0:k+2, k:k+2].dot(G.T)
+    if Z is not None:
+        Z[:, k:k+2] = Z[:, k:k+2].dot(G.T)
+    H[k+1, k] = 0
+    return True
+
+
+def hessenberg_qr_block(H, maxit, tol, shift="wilkinson", Z=None,
+                        min_block=None):
+    """
+    Apply the shifted QR algorithm to the unreduced upper Hessenberg
+    matrix H, in place, deflating each eigenvalue (or, for Francis
+    shifts, each 2x2 block of complex conjugate eigenvalues) as soon as
+    the subdiagonal entry above it is negligible, and then working on
+    the remaining window only. Each sweep chases a bulge down the active
+    window with one rotation (or reflector) per column, O(m^2) flops in
+    all, but it is the Python-level work per rotation that dominates
+    the time, so the sweeps apply the rotations a block at a time to a
+    small copy of the diagonal window and update the rest of H (and Z)
+    with matrix-matrix products, see _single_shift_sweep.
+
+    With shift="wilkinson" H must be complex, and each sweep uses the
+    eigenvalue of the trailing 2x2 block closest to the corner. With
+    shift="francis" H must be real, and each sweep uses both eigenvalues
+    of the trailing 2x2 block as a double shift, in real arithmetic,
+    leaving complex conjugate pairs in 2x2 blocks on the diagonal.
+    Exceptional shifts are used after 10 and 20 sweeps without
+    deflation.
+
+    If Z is None only the active window is updated, which is enough to
+    find the eigenvalues; otherwise the whole of H is updated to the
+    Schur form and the transformations are accumulated in Z.
+
+    :param H: an mxm numpy array, upper Hessenberg
+    :param maxit: integer, the maximum number of sweeps
+    :param tol: the tolerance for a negligible subdiagonal entry
+    :param shift: "wilkinson" or "francis"
+    :param Z: None, or an nxm numpy array which is replaced by ZQ
+    :param min_block: if not None, return as soon as the unreduced \
+    part splits into two blocks of at least min_block rows each, \
+    leaving them to the caller
+
+    :return its: an m dimensional integer array, the number of sweeps \
+    done (by this call) when each eigenvalue deflated, or -1 if it did not
+    :return total: integer, the number of sweeps done, at most maxit
+    """
+
+    m = H.shape[0]
+    its = -np.ones(m, dtype=int)
+    francis = shift == "francis"
+    sub = H[1:, :-1].diagonal()
+    diag = H.diagonal()
+    hi = m - 1
+    count = 0
+    total = 0
+    while hi >= 0:
+        l = _active_start(sub, diag, hi, tol)
+        if l > 0:
+            H[l, l-1] = 0
+        i0, j1 = (0, m) if Z is not None else (l, hi+1)
+        if l == hi:
+            its[hi] = total
+            hi -= 1
+            count = 0
+            continue
+        if francis and l == hi-1:
+            its[hi-1:hi+1] = total
+            if Z is not None:
+                _split_real_pair(H, hi-1, i0, j1, Z)
+            hi -= 2
+            count = 0
+            continue
+        if min_block is not None and min(l, hi+1-l) >= min_block:
+            break
+        if total >= maxit:
+            break
+        a, b = H[hi-1, hi-1], H[hi-1, hi]
+        c, d = H[hi, hi-1], H[hi, hi]
+        if count in (10, 20):
+            w = abs(H[hi, hi-1]) + abs(H[hi-1, hi-2] if hi-1 > l else 0)
+            a = d = d + 0.75*w
+            b, c = -0.4375*w, w
+        if francis:
+            _francis_sweep(H, l, hi, a + d, a*d - b*c, i0, j1, Z)
+        else:
+            _single_shift_sweep(H, l, hi, _wilkinson_shift(a, b, c, d),
+                                i0, j1, Z)
+        count += 1
+        total += 1
+    return its, total
+
+
+def tridiagonal_qr_block(T, maxit, tol, Z=None, min_block=None):
+    """
+    Apply the QR algorithm with Wilkinson shifts to an unreduced real
+    symmetric Tridiagonal, in place, deflating each eigenvalue once
+    the subdiagonal entry above it is negligible, at O(m) cost per
+    sweep (plus O(nm) if accumulating Z).
+
+    :param T: a Tridiagonal with real d and e
+    :param maxit: integer, the maximum number of sweeps
+    :param tol: the tolerance for a negligible subdiagonal entry
+    :param Z: None, or an nxm numpy array which is replaced by ZQ
+    :param min_block: if not None, return as soon as the unreduced \
+    part splits into two blocks of at least min_block rows each, \
+    leaving them to the caller
+
+    :return its: an m dimensional integer array, the number of sweeps \
+    done (by this call) when each eigenvalue deflated, or -1 if it did not
+    :return total: integer, the number of sweeps done, at most maxit
+    """
+
+    d, e = T.d, T.e
+    m = d.shape[0]
+    its = -np.ones(m, dtype=int)
+    hi = m - 1
+    count = 0
+    total = 0
+    while hi >= 0:
+        l = _active_start(e, d, hi, tol)
+        if l > 0:
+            e[l-1] = 0
+        if l == hi:
+            its[hi] = total
+            hi -= 1
+            count = 0
+            continue
+        if min_block is not None and min(l, hi+1-l) >= min_block:
+            break
+        if total >= maxit:
+            break
+        mu = np.real(_wilkinson_shift(d[hi-1], e[hi-1], e[hi-1], d[hi]))
+        if count in (10, 20):
+            mu = d[hi] + 0.75*abs(e[hi-1])
+        W = Tridiagonal(d[l:hi+1], e[l:hi])
+        tridiagonal_qr_step(W, mu, None if Z is None else Z[:, l:hi+1])
+        count += 1
+        total += 1
+    return its, total
+
+
+def schur_eigenvalues(T):
+    """
+    Return the eigenvalues of the upper (quasi-)triangular matrix T,
+    reading complex conjugate pairs from its 2x2 diagonal blocks.
+
+    :param T: an mxm numpy array
+
+    :return lambdas: an m dimensional numpy array
+    """
+
+    m = T.shape[0]
+    lambdas = np.diag(T).copy()
+    if np.iscomplexobj(T):
+        return lambdas
+    lambdas = lambdas.astype(complex)
+    k = 0
+    while k < m-1:
+        if T[k+1, k] != 0:
+            a, b, c, d = T[k, k], T[k, k+1], T[k+1, k], T[k+1, k+1]
+            h = 0.5*(a - d)
+            disc = np.sqrt(h*h + b*c + 0j)
+            lambdas[k:k+2] = 0.5*(a + d) + disc, 0.5*(a + d) - disc
+            k += 2
+        else:
+            k += 1
+    if np.all(lambdas.imag == 0):
+        lambdas = lambdas.real
+    return lambdas
+
+
+def _qr_task(B, maxit, tol, shift, schur, min_block):
+    """
+    Run the shifted QR algorithm on one unreduced block B, which is
+    either a Hessenberg matrix or a (d, e) tuple for a tridiagonal, with
+    at most maxit sweeps, and return the result as (B, Z, its, total),
+    Z being None unless schur.
+    """
+
+    if isinstance(B, tuple):
+        n = B[0].shape[0]
+        Z = np.eye(n) if schur else None
+        its, total = tridiagonal_qr_block(Tridiagonal(*B), maxit, tol, Z,
+                                          min_block)
+    else:
+        n = B.shape[0]
+        Z = np.eye(n, dtype=B.dtype) if schur else None
+        its, total = hessenberg_qr_block(B, maxit, tol, shift, Z, min_block)
+    return B, Z, its, total
+
+
+def _schedule_blocks(blocks, args, finish, workers, executor, maxit):
+    """
+    Run _qr_task on each of the (lo, hi) blocks, largest first, on a
+    pool of workers, and pass each result to finish(lo, hi, result,
+    start), which returns any new blocks that the result was split into;
+    these join the queue.
+
+    The blocks share one budget of maxit sweeps. args(lo, hi, budget)
+    returns the task arguments for a block allowed budget sweeps, and
+    start is the number of sweeps charged to the budget before the task
+    started. In serial each task may use all of the remaining budget;
+    with a pool, each is allotted a share of what is not reserved by the
+    running tasks, and any unused part is returned when it finishes.
+    """
+
+    queue = [(lo - hi, lo, hi) for lo, hi in blocks]
+    heapq.heapify(queue)
+    spent = 0
+    if workers == 1:
+        while queue:
+            _, lo, hi = heapq.heappop(queue)
+            result = _qr_task(*args(lo, hi, maxit - spent))
+            start, spent = spent, spent + result[3]
+            for b in finish(lo, hi, result, start):
+                heapq.heappush(queue, (b[0] - b[1],) + b)
+        return
+    pools = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+    if executor not in pools:
+        raise ValueError("Unknown executor %s" % executor)
+    with pools[executor](max_workers=workers) as pool:
+        running = {}
+        reserved = 0
+        while queue or running:
+            # wait for budget to be returned rather than start a block
+            # with none, unless nothing is running
+            while queue and len(running) < workers:
+                free = maxit - spent - reserved
+                if free == 0 and running:
+                    break
+                budget = -(-free//workers)
+                _, lo, hi = heapq.heappop(queue)
+                future = pool.submit(_qr_task, *args(lo, hi, budget))
+                running[future] = lo, hi, budget, spent
+                reserved += budget
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                lo, hi, budget, start = running.pop(future)
+                result = future.result()
+                reserved -= budget
+                spent += result[3]
+                for b in finish(lo, hi, result, start):
+                    heapq.heappush(queue, (b[0] - b[1],) + b)
+
+
+def _pieces(lo, hi, sub, its_b):
+    """
+    Return the unreduced blocks, as (start, end) pairs, of the unfinished
+    top of the block lo:hi with subdiagonal sub, or none if it ran out
+    of sweeps without splitting.
+    """
+
+    n = np.sum(its_b < 0)
+    blocks = _unreduced_blocks(sub[:max(n-1, 0)] == 0)
+    if n == 0 or len(blocks) == 1:
+        return []
+    return [(lo + a, lo + b) for a, b in blocks]
+
+
+def _shifted_QR_tridiagonal(A, maxit, tol, schur, workers, executor,
+                            min_block):
+    """
+    Reduce the Hermitian matrix A (which is not modified) to tridiagonal
+    form and iterate it to diagonal form with at most maxit sweeps in
+    total, see shifted_QR. Return the Tridiagonal,
+    the HessenbergQ of the reduction, the Schur vectors of the
+    tridiagonal form (if schur, otherwise None) and the numbers of
+    sweeps.
+    """
+
+    m = A.shape[0]
+    its = -np.ones(m, dtype=int)
+    Tr, Qh = tridiagonalise(A.copy(), hermitian=True)
+    d, e = Tr.d, Tr.e
+    Z = np.eye(m) if schur else None
+    small = _negligible(e, d[:-1], d[1:], tol)
+    e[small] = 0
+
+    def args(lo, hi, budget):
+        return (d[lo:hi].copy(), e[lo:hi-1].copy()), budget, tol, \
+            "wilkinson", schur, min_block
+
+    def finish(lo, hi, result, start):
+        (d[lo:hi], e[lo:hi-1]), Zb, its_b, _ = result
+        its[lo:hi] = np.where(its_b >= 0, start + its_b, -1)
+        if schur:
+            Z[:, lo:hi] = Z[:, lo:hi].dot(Zb)
+        return _pieces(lo, hi, e[lo:hi-1], its_b)
+
+    _schedule_blocks(_unreduced_blocks(small), args, finish, workers,
+                     executor, maxit)
+    return Tr, Qh, Z, its
+
+
+def shifted_QR(A, maxit, tol, shift="wilkinson", hermitian=None,
+               schur=False, workers=1, executor="process", min_block=64):
+    """
+    For a matrix A, compute the eigenvalues (and optionally the Schur
+    form A = QTQ^*) with the shifted QR algorithm. A is reduced once to
+    Hessenberg form (tridiagonal if A is Hermitian), split at any
+    negligible subdiagonal entries into independent unreduced blocks,
+    and each block is then iterated with implicit shifted QR sweeps and
+    deflation, see hessenberg_qr_block and tridiagonal_qr_block.
+
+    The blocks are queued largest first, and with workers > 1 they are
+    processed in parallel. A block is handed back by its worker as soon
+    as it splits into two blocks of at least min_block rows, and both
+    parts rejoin the queue, so that matrices with many clustered
+    eigenvalues spread over all the workers. The results are written
+    back, and the coupling to the rest of T and Q updated, in the main
+    process; since each block is iterated independently of the others,
+    T, Q and the eigenvalues do not depend on the number of workers.
+
+    As for pure_QR, maxit bounds the total number of sweeps, over all
+    the blocks together, and a subdiagonal entry is negligible once it
+    is below tol (or below working precision relative to its diagonal
+    neighbours).
+
+    :param A: an mxm numpy array, which is not modified
+    :param maxit: integer, the maximum total number of sweeps
+    :param tol: termination tolerance for the subdiagonal entries
+    :param shift: "wilkinson", or "francis" for real A (a Hermitian A \
+    always uses Wilkinson shifts on the real tridiagonal form)
+    :param hermitian: if None, check whether A is Hermitian
+    :param schur: if True, also return T and Q
+    :param workers: integer, the number of parallel workers. Default \
+    is 1, which runs in serial without a pool.
+    :param executor: "process" or "thread". The sweeps are dominated by \
+    Python overhead on small arrays, which holds the GIL, so processes \
+    are needed to run in parallel.
+    :param min_block: integer, the smallest block size worth sending \
+    to another worker
+
+    :return lambdas: an m dimensional numpy array, the eigenvalues in \
+    the order they appear on the diagonal of T
+    :return its: an m dimensional integer array, the total number of \
+    sweeps charged to the budget when each eigenvalue deflated, at most \
+    maxit, or -1 if it did not
+    :return T: if schur, the mxm upper (quasi-)triangular Schur form
+    :return Q: if schur, the mxm unitary matrix of Schur vectors
+    """
+
+    if shift not in ("wilkinson", "francis"):
+        raise ValueError("shift must be 'wilkinson' or 'francis'")
+    m = A.shape[0]
+    if hermitian is None:
+        hermitian = is_hermitian(A)
+
+    if hermitian:
+        Tr, Qh, Z, its = _shifted_QR_tridiagonal(A, maxit, tol, schur,
+                                                 workers, executor,
+                                                 min_block)
+        if not schur:
+            return Tr.d.copy(), its
+        if Tr.phase is not None:
+            Z = Tr.phase[:, None]*Z
+        return Tr.d.copy(), its, Tr.todense(), Qh.apply_Q(Z)
+
+    its = -np.ones(m, dtype=int)
+    if shift == "francis":
+        if np.iscomplexobj(A):
+            raise ValueError("Francis double shifts require a real matrix")
+        H = A.astype(float, copy=True)
+    else:
+        H = A.astype(complex, copy=True)
+    Qh = hessenberg_blocked(H)
+    Q = Qh.apply_Q(np.eye(m, dtype=H.dtype)) if schur else None
+    k = np.arange(m-1)
+    small = _negligible(H[k+1, k], H[k, k], H[k+1, k+1], tol)
+    H[k[small]+1, k[small]] = 0
+
+    def args(lo, hi, budget):
+        return H[lo:hi, lo:hi].copy(), budget, tol, shift, schur, min_block
 
+    def finish(lo, hi, result, start):
+        H[lo:hi, lo:hi], Zb, its_b, _ = result
+        its[lo:hi] = np.where(its_b >= 0, start + its_b, -1)
+        if schur:
+            H[:lo, lo:hi] = H[:lo, lo:hi].dot(Zb)
+            H[lo:hi, hi:] = Zb.conj().T.dot(H[lo:hi, hi:])
+            Q[:, lo:hi] = Q[:, lo:hi].dot(Zb)
+        return _pieces(lo, hi, H[lo+1:hi, lo:hi-1].diagonal(), its_b)
 
+    _schedule_blocks(_unreduced_blocks(small), args, finish, workers,
+                     executor, maxit)
+    lambdas = schur_eigenvalues(H)
+    if not schur:
+        return lambdas, its
+    return lambdas, its, H, Q
@@ -0,0 +1,79 @@
+'''Tests for the benchmark suite.'''
+import pytest
+import cla_utils
+from cla_utils import benchmark
+import numpy as np
+
+
+def test_time_kernel():
+    A = np.ones(10)
+
+    def kernel(A):
+        assert(np.all(A == 1.0))
+        A[:] = 0.0
+
+    # the kernel modifies its input, so each run needs a fresh copy
+    times = benchmark.time_kernel(kernel, (A,), repeat=5, warmup=2)
+    assert(times.shape == (5,))
+    assert(np.all(times >= 0))
+    assert(np.all(A == 1.0))
+
+
+def test_run_benchmarks(tmp_path):
+    results = benchmark.run_benchmarks(["numpy_matvec", "blocked_matvec"],
+                                       sizes=[10, 20], repeat=3, warmup=1)
+    for name in ["numpy_matvec", "blocked_matvec"]:
+        for m in ["10", "20"]:
+            summary = results["results"][name][m]
+            assert(summary["status"] == "ok")
+            assert(len(summary["times"]) == 3)
+            assert(summary["iqr"] >= 0)
+            assert(summary["gflops"] > 0)
+            assert(summary["rate"] is None)
+
+    filename = str(tmp_path / "results.json")
+    benchmark.write_json(results, filename)
+    assert(benchmark.read_json(filename) == results)
+
+
+def test_rate():
+    results = benchmark.run_benchmarks(["rq_it_stack"], sizes=[3],
+                                       repeat=1, warmup=0)
+    summary = results["results"]["rq_it_stack"]["3"]
+    assert(summary["rate"] == 2000/summary["median"])
+    assert("items/s" in benchmark.format_results(results))
+
+
+def test_not_implemented():
+    benchmark.BENCHMARKS["_missing"] = benchmark.Benchmark(
+        "_missing", lambda m: (cla_utils.exercises1.rank2, (None,)*4), [3])
+    try:
+        results = benchmark.run_benchmarks(["_missing"], repeat=1)
+    finally:
+        del benchmark.BENCHMARKS["_missing"]
+    assert(results["results"]["_missing"]["3"]["status"] == "not implemented")
+
+
+@pytest.mark.parametrize('threshold, nregressions', [(0.1, 1), (1.5, 0)])
+def test_compare(tmp_path, threshold, nregressions):
+    baseline = {"results": {"a": {"10": {"median": 1.0}},
+                            "b": {"10": {"median": 1.0}}}}
+    current = {"results": {"a": {"10": {"median": 2.0}},
+                           "b": {"10": {"median": 0.5},
+                                 "20": {"median": 5.0}}}}
+    regressions = benchmark.compare(baseline, current, threshold)
+    assert(len(regressions) == nregressions)
+    if nregressions:
+        assert(regressions[0][:2] == ("a", 10))
+
+    f0 = str(tmp_path / "baseline.json")
+    f1 = str(tmp_path / "current.json")
+    benchmark.write_json(baseline, f0)
+    benchmark.write_json(current, f1)
+    status = benchmark.main(["compare", f0, f1, "-t", str(threshold)])
+    assert(status == (1 if nregressions else 0))
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
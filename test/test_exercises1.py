@@ -31,6 +31,44 @@ def test_column_matvec(m, n):
     assert(cla_utils.norm(b-b0) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n', [(20, 20), (40, 20), (20, 45)])
+@pytest.mark.parametrize('mode', ['row', 'column'])
+@pytest.mark.parametrize('block_size', [None, 1, 7, 100])
+def test_blocked_matvec(m, n, mode, block_size):
+    random.seed(1878*m + 1950*n)
+    A = random.randn(m, n)
+    x = random.randn(n)
+
+    b0 = A@x
+    b = cla_utils.blocked_matvec(A, x, block_size=block_size, mode=mode)
+
+    assert(b.shape == b0.shape)
+    assert(cla_utils.norm(b-b0) < 1.0e-6)
+
+
+@pytest.mark.parametrize('m, n, k', [(20, 20, 1), (40, 20, 13), (20, 45, 60)])
+@pytest.mark.parametrize('mode', ['row', 'column'])
+def test_blocked_matmat(m, n, k, mode):
+    random.seed(1878*m + 1950*n + 1066*k)
+    A = random.randn(m, n) + 1j*random.randn(m, n)
+    B = random.randn(n, k)
+
+    C0 = A@B
+    C = cla_utils.blocked_matmat(A, B, block_size=6, mode=mode)
+
+    assert(cla_utils.norm(C-C0) < 1.0e-6)
+
+
+def test_choose_block_size():
+    A = np.zeros((500, 400))
+    bs = cla_utils.choose_block_size(A, "row", cache_bytes=400*8*10)
+    assert(bs == 10)
+    bs = cla_utils.choose_block_size(A, "column", cache_bytes=1)
+    assert(bs == 1)
+    bs = cla_utils.choose_block_size(A, "column", cache_bytes=10**9)
+    assert(bs == 400)
+
+
 @pytest.mark.parametrize('m, n', [(20, 20), (40, 20), (20, 45)])
 def test_rank2_matrix(m, n):
     random.seed(1451*m + 1901*n)
@@ -50,6 +88,36 @@ def test_rank2_matrix(m, n):
     assert(np.abs(n1-n2) < 1.0e-7)
 
 
+@pytest.mark.parametrize('m, n', [(20, 20), (40, 20), (20, 45)])
+def test_rank2_lowrank(m, n):
+    random.seed(1451*m + 1901*n)
+    u1 = 1/np.sqrt(2)*(random.randn(m) + 1j*random.randn(m))
+    u2 = 1/np.sqrt(2)*(random.randn(m) + 1j*random.randn(m))
+    v1 = 1/np.sqrt(2)*(random.randn(n) + 1j*random.randn(n))
+    v2 = 1/np.sqrt(2)*(random.randn(n) + 1j*random.randn(n))
+
+    A = cla_utils.rank2(u1, u2, v1, v2, lowrank=True)
+    A0 = np.outer(u1, v1.conj()) + np.outer(u2, v2.conj())
+    assert(A.shape == (m, n))
+    assert(A.rank == 2)
+    assert(cla_utils.norm(A.todense() - A0) < 1.0e-7)
+
+    x = random.randn(n, 3)
+    y = random.randn(m)
+    assert(cla_utils.norm(A@x - A0@x) < 1.0e-7)
+    assert(cla_utils.norm(A.rmatvec(y) - A0.conj().T@y) < 1.0e-7)
+
+    # appending terms beyond the initial storage
+    for i in range(5):
+        u = random.randn(m)
+        v = random.randn(n)
+        A.add_rank1(u, v)
+        A0 += np.outer(u, v)
+    assert(A.rank == 7)
+    assert(cla_utils.norm(A@x - A0@x) < 1.0e-7)
+    assert(cla_utils.norm(A.todense() - A0) < 1.0e-7)
+
+
 @pytest.mark.parametrize('m', [10, 20, 200])
 def test_rank1pert_inv(m):
     random.seed(1001*m)
@@ -67,6 +135,56 @@ def test_rank1pert_inv(m):
     assert(cla_utils.norm(err)<1.0e-7)
 
 
+@pytest.mark.parametrize('m', [10, 20, 200])
+def test_rank1pert_operator(m):
+    random.seed(1001*m)
+    u = 1/np.sqrt(2)*(random.randn(m) + 1j*random.randn(m))
+    v = 1/np.sqrt(2)*(random.randn(m) + 1j*random.randn(m))
+
+    A = np.eye(m) + np.outer(u, v.conj())
+    solver = cla_utils.rank1pert_inv(u, v, operator=True)
+
+    x = 1/np.sqrt(2)*(random.randn(m) + 1j*random.randn(m))
+    assert(cla_utils.norm(x - solver.solve(A@x)) < 1.0e-7)
+
+
+@pytest.mark.parametrize('base', ['identity', 'qr', 'householder', 'upper',
+                                  'lower'])
+@pytest.mark.parametrize('m, k', [(10, 1), (30, 4), (100, 7)])
+def test_woodbury_solver(base, m, k):
+    random.seed(1101*m + 31*k)
+    A = random.randn(m, m) + 1j*random.randn(m, m)
+    if base == 'identity':
+        A = np.eye(m)
+        solver = cla_utils.WoodburySolver.from_identity(m)
+    elif base == 'qr':
+        Q, R = np.linalg.qr(A)
+        solver = cla_utils.WoodburySolver.from_qr(Q, R)
+    elif base == 'householder':
+        # the implicit factorisation, without forming Q
+        F = cla_utils.householder_qr(A, implicit=True)
+        solver = cla_utils.WoodburySolver.from_qr(F)
+    else:
+        lower = base == 'lower'
+        A = np.tril(A) if lower else np.triu(A)
+        A += 4*np.sqrt(m)*np.eye(m)
+        solver = cla_utils.WoodburySolver.from_triangular(A, lower=lower)
+
+    # apply the low rank update in two stages
+    for i in range(2):
+        U = random.randn(m, k)
+        V = random.randn(m, k) + 1j*random.randn(m, k)
+        solver.update(U, V)
+        A = A + U@V.conj().T
+        assert(solver.rank == (i+1)*k)
+
+        x0 = random.randn(m, 5)
+        x = solver.solve(A@x0)
+        assert(cla_utils.norm(x - x0) < 1.0e-6)
+        x = solver.solve(A@x0[:, 0])
+        assert(cla_utils.norm(x - x0[:, 0]) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m', [3, 7, 20, 43])
 def test_ABiC(m):
     random.seed(1348*m)
@@ -89,6 +207,51 @@ def test_ABiC(m):
     assert(cla_utils.norm(err) < 1.0e-7)
 
 
+def _get_packable(m, kind):
+    A = random.randn(m, m) + 1j*random.randn(m, m)
+    if kind == 'hermitian':
+        return A + A.conj().T
+    elif kind == 'symmetric':
+        return A + A.T
+    elif kind == 'lower':
+        return np.tril(A)
+    return np.triu(A)
+
+
+@pytest.mark.parametrize('m', [3, 7, 20, 43])
+@pytest.mark.parametrize('kind', ['hermitian', 'symmetric', 'lower', 'upper'])
+def test_pack_complex(m, kind):
+    random.seed(1348*m)
+    A = _get_packable(m, kind)
+    Ahat = cla_utils.pack_complex(A, kind)
+    assert(Ahat.dtype == np.float64)
+    assert(Ahat.size <= m*(m+1))
+    assert(cla_utils.norm(cla_utils.unpack_complex(Ahat, kind) - A) < 1.0e-7)
+
+
+@pytest.mark.parametrize('m, block_size', [(1, None), (7, 3), (43, 8),
+                                           (100, None)])
+@pytest.mark.parametrize('kind', ['hermitian', 'symmetric', 'lower', 'upper'])
+def test_packed_complex_matvec(m, block_size, kind):
+    random.seed(1348*m)
+    A = _get_packable(m, kind)
+    P = cla_utils.PackedComplex.from_dense(A, kind, block_size=block_size)
+    x = random.randn(m) + 1j*random.randn(m)
+
+    zr, zi = P.matvec(x.real.copy(), x.imag.copy())
+    assert(cla_utils.norm(zr + 1j*zi - A@x) < 1.0e-7)
+
+    # batched, writing into preallocated output
+    X = random.randn(m, 5) + 1j*random.randn(m, 5)
+    out = np.zeros((m, 5)), np.zeros((m, 5))
+    zr, zi = P.matvec(X.real.copy(), X.imag.copy(), out=out)
+    assert(zr is out[0] and zi is out[1])
+    assert(cla_utils.norm(zr + 1j*zi - A@X) < 1.0e-7)
+    # the packed array itself matches the ABiC layout for Hermitian A
+    if kind == 'hermitian':
+        assert(np.all(np.tril(P.Ahat) == np.tril(A.real)))
+
+
 if __name__ == '__main__':
     import sys
     pytest.main(sys.argv)
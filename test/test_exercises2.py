@@ -33,6 +33,58 @@ def test_solve_Q(m):
     assert(cla_utils.norm(err) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n, k', [(20, 17, 1), (40, 3, 50), (20, 12, 7)])
+@pytest.mark.parametrize('stacked', [False, True])
+@pytest.mark.parametrize('kind', [float, complex])
+def test_orthog_cpts_batch(m, n, k, stacked, kind):
+    random.seed(1878*m + 1950*n + 13*k)
+    A = random.randn(m, m) + 1j*random.randn(m, m)
+    V = random.randn(m, k) + 1j*random.randn(m, k)
+    Q, R = np.linalg.qr(A if kind is complex else A.real)
+    Q = Q[:, 0:n]
+
+    if stacked:
+        out = np.zeros((k, m), dtype=complex), np.zeros((k, n), dtype=complex)
+        R, U = cla_utils.orthog_cpts_batch(V.T.copy(), Q, stacked=True,
+                                           out=out)
+        assert(R is out[0] and U is out[1])
+        R, U = R.T, U.T
+    else:
+        out = np.zeros((m, k), dtype=complex), np.zeros((n, k), dtype=complex)
+        R, U = cla_utils.orthog_cpts_batch(V, Q, out=out)
+        assert(R is out[0] and U is out[1])
+
+    assert(cla_utils.norm(V - R - Q.dot(U)) < 1.0e-6)
+    assert(cla_utils.norm(Q.conj().T.dot(R)) < 1.0e-6)
+    # the default allocates the results
+    R1, U1 = cla_utils.orthog_cpts_batch(V, Q)
+    assert(cla_utils.norm(U1 - Q.conj().T.dot(V)) < 1.0e-6)
+
+
+@pytest.mark.parametrize('m, k', [(17, 1), (35, 8), (100, 300)])
+@pytest.mark.parametrize('stacked', [False, True])
+@pytest.mark.parametrize('kind', [float, complex])
+def test_solve_Q_batch(m, k, stacked, kind):
+    random.seed(1431*m + 7*k)
+    A = random.randn(m, m) + 1j*random.randn(m, m)
+    B = random.randn(m, k) + 1j*random.randn(m, k)
+    Q, R = np.linalg.qr(A if kind is complex else A.real)
+    B0 = B.copy()
+
+    if stacked:
+        out = np.zeros((k, m), dtype=complex)
+        X = cla_utils.solve_Q_batch(Q, B.T.copy(), stacked=True, out=out)
+        assert(X is out)
+        X = X.T
+    else:
+        out = np.zeros((m, k), dtype=complex)
+        X = cla_utils.solve_Q_batch(Q, B, out=out)
+        assert(X is out)
+
+    assert(cla_utils.norm(B - B0) == 0)
+    assert(cla_utils.norm(X - np.linalg.solve(Q, B)) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m, n', [(20, 17), (40, 3), (20, 12)])
 def test_orthog_proj(m, n):
     random.seed(1878*m + 1950*n)
@@ -51,6 +103,35 @@ def test_orthog_proj(m, n):
             assert(cla_utils.norm(q2) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n', [(20, 17), (40, 3), (20, 12)])
+def test_orthog_proj_implicit(m, n):
+    random.seed(1878*m + 1950*n)
+    A = random.randn(m, m) + 1j*random.randn(m, m)
+    Q, R = np.linalg.qr(A)
+    Q1, Q2 = Q[:, 0:n], Q[:, n:]
+
+    P = cla_utils.orthog_proj(Q1, implicit=True)
+    assert(P.shape == (m, m))
+    assert(P.nbytes == Q1.nbytes < P.dense_nbytes)
+    P0 = Q1@Q1.conj().T
+    assert(cla_utils.norm(P.todense() - P0) < 1.0e-6)
+
+    # batched application, to the space and its complement
+    assert(cla_utils.norm(P@Q1 - Q1) < 1.0e-6)
+    assert(cla_utils.norm(P@Q2) < 1.0e-6)
+    assert(cla_utils.norm(P.C@Q1) < 1.0e-6)
+    assert(cla_utils.norm(P.C@Q2 - Q2) < 1.0e-6)
+    x = random.randn(m)
+    assert(cla_utils.norm(P@x + P.C@x - x) < 1.0e-6)
+
+    # composition
+    P2 = cla_utils.OrthogProjector(Q[:, 0:(n+1)//2])
+    PP = P.C@P2@P
+    assert(cla_utils.norm(PP.todense() - (np.eye(m) - P0)@P2.todense()@P0)
+           < 1.0e-6)
+    assert(cla_utils.norm(PP@x) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m, n', [(211, 17), (40, 3)])
 def test_orthog_space(m, n):
     random.seed(1321*m + 1765*n)
@@ -100,6 +181,23 @@ def test_GS_modified(m, n):
     assert(cla_utils.norm(err) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n', [(20, 17), (40, 3), (300, 70)])
+@pytest.mark.parametrize('panel', [1, 8, 32, 100])
+def test_GS_block(m, n, panel):
+    random.seed(1312*m + 2020*n)
+
+    A = random.randn(m, m) + 1j*random.randn(m, m)
+    A = A[:, 0:n]
+    A0 = 1.0*A
+
+    R = cla_utils.GS_block(A, panel=panel)
+
+    assert(np.allclose(R, np.triu(R)))
+    assert(np.allclose(np.diag(R).imag, 0) and np.all(np.diag(R).real > 0))
+    assert(cla_utils.norm(A.conj().T@A - np.eye(n)) < 1.0e-10)
+    assert(cla_utils.norm(A0 - np.dot(A, R)) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m, n', [(4, 3), (5, 3), (6, 3)])
 def test_GS_modified_R(m, n):
     random.seed(1312*m + 2020*n)
@@ -115,6 +213,34 @@ def test_GS_modified_R(m, n):
     assert(cla_utils.norm(err) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n', [(4, 3), (20, 7), (40, 40)])
+def test_ElementaryTriangular(m, n):
+    random.seed(1312*m + 2020*n)
+    A = random.randn(m, n) + 1j*random.randn(m, n)
+    R0 = np.triu(random.randn(n, n) + 1j*random.randn(n, n)) \
+        + n*np.eye(n)
+
+    # reproduce the dense path: A R_1...R_n and its inverse
+    A1 = 1.0*A
+    Racc = np.eye(n)
+    R = np.zeros((n, n), dtype=complex)
+    for k in range(n):
+        Rk = cla_utils.ElementaryTriangular.from_inverse_row(k, R0[k, :])
+        Rkd = Rk.todense()
+        assert(np.allclose(Rkd, np.triu(Rkd)))
+        A0 = A1@Rkd
+        Racc = Racc@Rkd
+        Rk.apply_right(A1)
+        assert(cla_utils.norm(A1 - A0) < 1.0e-6)
+        R[k, :] = Rk.inverse_row()
+        Rk2 = cla_utils.ElementaryTriangular.from_dense(Rkd, k)
+        assert(np.allclose(Rk2.row, Rk.row))
+
+    assert(cla_utils.norm(R - R0) < 1.0e-6)
+    assert(cla_utils.norm(R - np.linalg.inv(Racc)) < 1.0e-6)
+    assert(cla_utils.norm(A1@R - A) < 1.0e-6)
+
+
 if __name__ == '__main__':
     import sys
     pytest.main(sys.argv)
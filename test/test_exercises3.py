@@ -17,6 +17,19 @@ def test_householder(m):
     assert(cla_utils.norm(np.dot(R.T, R) - np.dot(A.T, A)) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n', [(20, 20), (40, 13), (13, 40), (150, 150)])
+@pytest.mark.parametrize('block_size', [1, 8, 64])
+def test_householder_blocked(m, n, block_size):
+    random.seed(1878*m + 7*n)
+    A = random.randn(m, n)
+    A0 = 1.0*A  # make a deep copy
+    status = cla_utils.householder_blocked(A0, block_size=block_size)
+    R = A0
+    assert(status == None)
+    assert(np.allclose(R, np.triu(R)))  # check R is upper triangular
+    assert(cla_utils.norm(np.dot(R.T, R) - np.dot(A.T, A)) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m, k', [(20, 4), (204, 100), (18, 7)])
 def test_solve_U(m, k):
     random.seed(1002*m + 2987*k)
@@ -31,6 +44,34 @@ def test_solve_U(m, k):
     err2 = b - np.dot(A, x)
     assert(cla_utils.norm(err2) > 1.0e-6)
 
+
+
+@pytest.mark.parametrize('m, k', [(20, 1), (204, 100), (18, 7), (130, 0),
+                                  (0, 3)])
+@pytest.mark.parametrize('lower', [False, True])
+@pytest.mark.parametrize('trans', ['N', 'T', 'C'])
+@pytest.mark.parametrize('block_size', [1, 16, 500])
+def test_solve_triangular(m, k, lower, trans, block_size):
+    random.seed(1002*m + 2987*k)
+    T = random.randn(m, m) + 1j*random.randn(m, m) + 2*np.sqrt(m)*np.eye(m)
+    # entries outside the triangle must be ignored
+    T0 = np.tril(T) if lower else np.triu(T)
+    T0 = {'N': T0, 'T': T0.T, 'C': T0.conj().T}[trans]
+    b = random.randn(m, k) + 1j*random.randn(m, k)
+
+    x = cla_utils.solve_triangular(T, b, lower=lower, trans=trans,
+                                   block_size=block_size)
+    assert(x.shape == b.shape)
+    assert(cla_utils.norm(b - np.dot(T0, x)) < 1.0e-6)
+
+    # in place, with a single right-hand side
+    b1 = b[:, 0].copy() if k else np.ones(m, dtype=complex)
+    x1 = cla_utils.solve_triangular(T, b1, lower=lower, trans=trans,
+                                    overwrite_b=True, block_size=block_size)
+    assert(x1 is b1)
+    rhs = b[:, 0] if k else np.ones(m)
+    assert(cla_utils.norm(rhs - np.dot(T0, x1)) < 1.0e-6)
+
     
 @pytest.mark.parametrize('m, n', [(20, 7), (40, 13), (87, 9)])
 def test_householder_solve(m, n):
@@ -42,6 +83,51 @@ def test_householder_solve(m, n):
     assert(cla_utils.norm(x - x0) < 1.0e-6)
 
 
+@pytest.mark.parametrize('key', ['id', 'hash'])
+def test_factor_cache(key):
+    random.seed(2432)
+    m = 30
+    cache = cla_utils.FactorCache(max_bytes=2*m*m*8, key=key)
+    A = random.randn(m, m)
+    x0 = random.randn(m, 7)
+    b = np.dot(A, x0)
+
+    for i in range(3):
+        x = cla_utils.householder_solve(A, b, cache=cache)
+        assert(cla_utils.norm(x - x0) < 1.0e-6)
+    assert(cache.misses == 1 and cache.hits == 2)
+
+    x = cache.solve(A, b, chunk_size=3)
+    assert(cla_utils.norm(x - x0) < 1.0e-6)
+    xs = list(cache.solve_stream(A, (b[:, j] for j in range(7))))
+    assert(cla_utils.norm(np.array(xs).T - x0) < 1.0e-6)
+
+    # modifying A requires invalidation
+    A[0, 0] += 1.0
+    cache.invalidate(A)
+    x = cache.solve(A, np.dot(A, x0))
+    assert(cla_utils.norm(x - x0) < 1.0e-6)
+    assert(cache.misses == 2)
+
+    # memory stays bounded by evicting the least recently used
+    As = [random.randn(m, m) for i in range(4)]
+    for B in As:
+        cache.factor(B)
+    assert(len(cache) == 2)
+    assert(cache.nbytes <= cache.max_bytes)
+    cache.factor(As[-1])
+    assert(cache.misses == 6)
+    cache.invalidate()
+    assert(len(cache) == 0 and cache.nbytes == 0)
+
+    # a factorisation larger than max_bytes is not cached
+    B = random.randn(3*m, 3*m)
+    x0 = random.randn(3*m)
+    x = cache.solve(B, np.dot(B, x0))
+    assert(cla_utils.norm(x - x0) < 1.0e-6)
+    assert(len(cache) == 0 and cache.nbytes == 0)
+
+
 @pytest.mark.parametrize('m, n', [(20, 7), (40, 13), (87, 9)])
 def test_householder_qr(m, n):
     random.seed(4732*m + 1238*n)
@@ -57,6 +143,38 @@ def test_householder_qr(m, n):
     assert(cla_utils.norm(np.dot(Q, R) - A) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n', [(20, 7), (40, 40), (300, 90), (13, 20)])
+@pytest.mark.parametrize('block_size', [1, 16, 64])
+def test_householder_qr_implicit(m, n, block_size):
+    random.seed(4732*m + 1238*n)
+    A = random.randn(m, n) + 1j*random.randn(m, n)
+    F = cla_utils.HouseholderQR(A, block_size=block_size)
+    p = min(m, n)
+
+    Q, R = F.Q(), F.R
+    assert(Q.shape == (m, p) and R.shape == (p, n))
+    assert(cla_utils.norm(np.dot(Q.conj().T, Q) - np.eye(p)) < 1.0e-6)
+    assert(cla_utils.norm(np.dot(Q, R) - A) < 1.0e-6)
+    Qf = F.Q(full=True)
+    assert(cla_utils.norm(np.dot(Qf.conj().T, Qf) - np.eye(m)) < 1.0e-6)
+
+    b = random.randn(m, 3)
+    assert(cla_utils.norm(F.apply_Qh(b) - Qf.conj().T@b) < 1.0e-6)
+    assert(cla_utils.norm(F.apply_Q(F.apply_Qh(b[:, 0])) - b[:, 0]) < 1.0e-6)
+    if m >= n:
+        x = F.lstsq(b)
+        assert(cla_utils.norm(np.dot(A.conj().T, np.dot(A, x) - b)) < 1.0e-6)
+
+
+@pytest.mark.parametrize('m', [20, 87])
+def test_householder_qr_implicit_solve(m):
+    random.seed(2432*m)
+    A = random.randn(m, m)
+    x0 = random.randn(m, 4)
+    F = cla_utils.householder_qr(A, implicit=True)
+    assert(cla_utils.norm(F.solve(np.dot(A, x0)) - x0) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m, n', [(3, 2), (20, 7), (40, 13), (87, 9)])
 def test_householder_ls(m, n):
     random.seed(8473*m + 9283*n)
@@ -71,6 +189,127 @@ def test_householder_ls(m, n):
     assert(cla_utils.norm(np.dot(A0.T, np.dot(A0, x) - b)) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m, n, r', [(20, 7, 7), (40, 13, 4), (87, 90, 30),
+                                     (100, 50, 1)])
+def test_pivoted_qr(m, n, r):
+    random.seed(8473*m + 9283*n + r)
+    A = random.randn(m, r).dot(random.randn(r, n))
+    b = random.randn(m)
+
+    F = cla_utils.PivotedQR(A, tol=1.0e-10)
+    assert(F.rank == r)
+    assert(sorted(F.perm) == list(range(n)))
+    R = F.R
+    assert(np.allclose(R, np.triu(R)))
+    # pivoting makes the diagonal of R non-increasing in size
+    d = np.abs(np.diag(R))
+    assert(np.all(d[1:] <= d[:-1]*(1 + 1.0e-10)))
+    Q = F.Q()[:, :r]
+    assert(cla_utils.norm(np.dot(Q, R) - A[:, F.perm]) < 1.0e-6)
+
+    x = cla_utils.householder_ls(A, b, rank_revealing=True, tol=1.0e-10)
+    assert(np.count_nonzero(x) <= r)
+    assert(cla_utils.norm(np.dot(A.T, np.dot(A, x) - b)) < 1.0e-6)
+
+
+@pytest.mark.parametrize('m, n, k', [(20, 7, None), (20, 7, 3), (0, 4, None)])
+def test_householder_ls_zero(m, n, k):
+    # numerical rank 0, so the minimum norm solution is zero
+    A = np.zeros((m, n))
+    b = np.ones(m) if k is None else np.ones((m, k))
+    x = cla_utils.householder_ls(A, b, rank_revealing=True)
+    assert(x.shape == (n,) + b.shape[1:])
+    assert(cla_utils.norm(x) == 0)
+
+
+@pytest.mark.parametrize('m, n, chunk', [(20, 7, 3), (400, 13, 50),
+                                         (87, 9, 100)])
+def test_streaming_ls(m, n, chunk):
+    random.seed(8473*m + 9283*n)
+    A = random.randn(m, n)
+    b = random.randn(m)
+
+    S = cla_utils.StreamingLS(n)
+    for i in range(0, m, chunk):
+        S.update(A[i:i+chunk], b[i:i+chunk])
+        assert(S.R.shape[0] <= n)
+        # the solution is available at any point with enough rows
+        if S.rows >= n:
+            A1, b1 = A[:S.rows], b[:S.rows]
+            x = S.solution()
+            assert(cla_utils.norm(np.dot(A1.T, np.dot(A1, x) - b1)) < 1.0e-6)
+            assert(np.abs(S.residual_norm - cla_utils.norm(A1@x - b1))
+                   < 1.0e-6)
+
+
+def test_streaming_ls_complex():
+    random.seed(8474)
+    m, n = 300, 20
+    A = random.randn(m, n) + 1j*random.randn(m, n)
+    b = random.randn(m, 3) + 1j*random.randn(m, 3)
+    A0, b0 = A.copy(), b.copy()
+
+    S = cla_utils.StreamingLS(n)
+    for i in range(0, m, 17):
+        S.update(A[i:i+17], b[i:i+17])
+    # the chunks are not modified, and R stays upper triangular
+    assert(cla_utils.norm(A - A0) == 0 and cla_utils.norm(b - b0) == 0)
+    assert(cla_utils.norm(np.tril(S.R, -1)) == 0)
+    x = S.solution()
+    assert(cla_utils.norm(np.dot(A.conj().T, np.dot(A, x) - b)) < 1.0e-6)
+    assert(np.abs(S.residual_norm - cla_utils.norm(A@x - b)) < 1.0e-6)
+
+
+def test_streaming_ls_npy(tmp_path):
+    random.seed(8473)
+    m, n = 1000, 11
+    A = random.randn(m, n)
+    b = random.randn(m, 2)
+    np.save(str(tmp_path / "A.npy"), A)
+    np.save(str(tmp_path / "b.npy"), b)
+
+    chunks = cla_utils.npy_chunks(str(tmp_path / "A.npy"),
+                                  str(tmp_path / "b.npy"), 128)
+    A0, b0 = next(chunks)
+    assert(isinstance(A0, np.memmap) and A0.shape == (128, n))
+    x = cla_utils.streaming_ls(chunks, n)
+    # the first chunk was consumed above
+    assert(cla_utils.norm(np.dot(A[128:].T, np.dot(A[128:], x) - b[128:]))
+           < 1.0e-6)
+
+
+@pytest.mark.parametrize('m, n, nblocks', [(20, 7, 1), (100, 13, 3),
+                                           (1000, 9, 16), (50, 10, 7)])
+@pytest.mark.parametrize('method', ['householder', 'GS'])
+def test_tsqr(m, n, nblocks, method):
+    random.seed(4732*m + 1238*n)
+    A = random.randn(m, n)
+    b = random.randn(m, 2)
+
+    F = cla_utils.tsqr(A, nblocks=nblocks, workers=2, method=method)
+    Q, R = F.Q(), F.R
+    assert(F.shape == (m, n))
+    assert(np.allclose(R, np.triu(R)))
+    assert(cla_utils.norm(np.dot(Q.T, Q) - np.eye(n)) < 1.0e-6)
+    assert(cla_utils.norm(np.dot(Q, R) - A) < 1.0e-6)
+    assert(cla_utils.norm(F.apply_Qh(b) - Q.T@b) < 1.0e-6)
+    assert(cla_utils.norm(F.apply_Q(b[:n]) - Q@b[:n]) < 1.0e-6)
+
+    x = F.solve_ls(b)
+    assert(cla_utils.norm(np.dot(A.T, np.dot(A, x) - b)) < 1.0e-6)
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_tsqr_explicit(executor):
+    random.seed(4732)
+    A = random.randn(400, 10)
+    Q, R = cla_utils.tsqr(A, nblocks=5, workers=2, executor=executor,
+                          explicit=True)
+    assert(Q.shape == (400, 10))
+    assert(cla_utils.norm(np.dot(Q.T, Q) - np.eye(10)) < 1.0e-6)
+    assert(cla_utils.norm(np.dot(Q, R) - A) < 1.0e-6)
+
+
 if __name__ == '__main__':
     import sys
     pytest.main(sys.argv)
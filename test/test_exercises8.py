@@ -66,6 +66,88 @@ def test_ev(m):
         assert(norm(Av - v) < 1.0e-6)
 
 
+@pytest.mark.parametrize('m', [3, 20, 204, 18])
+@pytest.mark.parametrize('block_size', [1, 8, 32])
+def test_hessenberg_blocked(m, block_size):
+    random.seed(4373*m)
+    A = random.randn(m, m) + 1j*random.randn(m, m)
+    A0 = 1.0*A
+    Q = cla_utils.hessenberg_blocked(A, block_size=block_size)
+    # check Hessenberg structure
+    assert(cla_utils.norm(A[np.tril_indices(m, -2)]) < 1.0e-6)
+    # check Q is unitary and QHQ^* = A
+    Qd = Q.todense()
+    assert(cla_utils.norm(np.dot(Qd.conj().T, Qd) - np.eye(m)) < 1.0e-6)
+    assert(cla_utils.norm(np.dot(Qd, np.dot(A, Qd.conj().T)) - A0) < 1.0e-6)
+    x = random.randn(m, 2)
+    assert(cla_utils.norm(Q.apply_Qh(Q.apply_Q(x)) - x) < 1.0e-6)
+    assert(cla_utils.norm(Q.apply_Qh(x) - Qd.conj().T@x) < 1.0e-6)
+
+
+@pytest.mark.parametrize('m', [2, 3, 20, 101])
+@pytest.mark.parametrize('dtype', [float, complex])
+def test_tridiagonal_blocked(m, dtype):
+    random.seed(4373*m)
+    A = random.randn(m, m) + (1j*random.randn(m, m) if dtype is complex else 0)
+    A = A + A.conj().T
+    A0 = 1.0*A
+    Q = cla_utils.tridiagonal_blocked(A, block_size=8)
+    Qd = Q.todense()
+    assert(cla_utils.norm(A[np.tril_indices(m, -2)]) < 1.0e-12)
+    assert(cla_utils.norm(A - A.conj().T) < 1.0e-12)
+    assert(cla_utils.norm(Qd.conj().T@Qd - np.eye(m)) < 1.0e-6)
+    assert(cla_utils.norm(Qd@A@Qd.conj().T - A0) < 1.0e-6)
+
+
+@pytest.mark.parametrize('m', [3, 20, 101])
+@pytest.mark.parametrize('dtype', [float, complex])
+def test_tridiagonalise(m, dtype):
+    random.seed(4373*m)
+    A = random.randn(m, m) + (1j*random.randn(m, m) if dtype is complex else 0)
+    A = A + A.conj().T
+    A0 = 1.0*A
+    T, Q = cla_utils.tridiagonalise(A)
+    assert(T.d.dtype == np.float64 and T.e.dtype == np.float64)
+    assert(T.nbytes == 8*(2*m - 1))
+    # check similarity: A = QDTD^*Q^*
+    Td = T.todense()
+    if T.phase is not None:
+        Td = (T.phase[:, None]*Td)*T.phase.conj()
+    Qd = Q.todense()
+    assert(cla_utils.norm(Qd@Td@Qd.conj().T - A0) < 1.0e-6)
+    x = random.randn(m, 2)
+    assert(cla_utils.norm(T.matvec(x) - T.todense()@x) < 1.0e-6)
+    assert(cla_utils.norm(T.matvec(x[:, 0]) - T.todense()@x[:, 0]) < 1.0e-6)
+
+    B = random.randn(m, m)
+    assert(not cla_utils.is_hermitian(B))
+    with pytest.raises(ValueError):
+        cla_utils.tridiagonalise(B)
+
+
+@pytest.mark.parametrize('m', [1, 2, 20, 101])
+@pytest.mark.parametrize('mu', [0.3, 0.3 + 0.2j])
+def test_hessenberg_lu(m, mu):
+    random.seed(2399*m)
+    H = np.triu(random.randn(m, m), -1)
+    b = random.randn(m, 3)
+    F = cla_utils.HessenbergLU(H, mu)
+    x = F.solve(b)
+    x0 = np.linalg.solve(H - mu*np.eye(m), b)
+    assert(cla_utils.norm(x - x0) < 1.0e-6*cla_utils.norm(x0))
+
+    T = cla_utils.Tridiagonal(random.randn(m), random.randn(m-1))
+    F = cla_utils.TridiagonalLU(T, mu)
+    x = F.solve(b[:, 0])
+    x0 = np.linalg.solve(T.todense() - mu*np.eye(m), b[:, 0])
+    assert(cla_utils.norm(x - x0) < 1.0e-6*cla_utils.norm(x0))
+    # a shift equal to an eigenvalue still gives an eigenvector direction
+    lam = np.linalg.eigvalsh(T.todense())[0]
+    x = cla_utils.TridiagonalLU(T, lam).solve(b[:, 0])
+    x /= cla_utils.norm(x)
+    assert(cla_utils.norm(T.matvec(x) - lam*x) < 1.0e-6)
+
+
 if __name__ == '__main__':
     import sys
     pytest.main(sys.argv)
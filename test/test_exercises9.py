@@ -13,6 +13,79 @@ def test_pow_it(m):
     x0 = random.randn(m)
     xi, lambda0 = cla_utils.pow_it(A, x0, tol=1.0e-6, maxit=10000)
     assert(cla_utils.norm(A@xi-lambda0*xi) < 1.0e-3)
+    # with no iterations, the normalised start and its Rayleigh quotient
+    xi, lambda0 = cla_utils.pow_it(A, x0, tol=1.0e-6, maxit=0)
+    assert(cla_utils.norm(xi - x0/cla_utils.norm(x0)) < 1.0e-12)
+    assert(abs(lambda0 - xi@A@xi) < 1.0e-12)
+    X, lambda0 = cla_utils.pow_it(A, x0, tol=1.0e-6, maxit=0,
+                                  store_iterations=True)
+    assert(X.shape == (m, 0))
+
+
+@pytest.mark.parametrize('m', [20, 204, 18])
+@pytest.mark.parametrize('method', ['householder', 'GS'])
+@pytest.mark.parametrize('reorth', [1, 4])
+def test_block_pow_it(m, method, reorth):
+    random.seed(1302*m)
+    A = random.randn(m, m)
+    A = 0.5*(A + A.T)
+    k = 4
+    X0 = random.randn(m, k)
+    X, lambdas, its = cla_utils.block_pow_it(A, X0, 1.0e-6, 20000, reorth,
+                                            method)
+    assert(np.all(its > 0) and np.all(np.diff(its) >= 0))
+    assert(cla_utils.norm(A@X - X*lambdas) < 1.0e-5)
+    lambdas0 = np.linalg.eigvalsh(A)
+    lambdas0 = lambdas0[np.argsort(-np.abs(lambdas0))][:k]
+    assert(cla_utils.norm(lambdas - lambdas0) < 1.0e-6)
+
+
+def test_block_pow_it_nonhermitian():
+    random.seed(1302)
+    m = 50
+    U = random.randn(m, m)
+    D = np.concatenate(([10.0, 8.0, 6.0, 5.0], random.rand(m-4)))
+    A = (U*D)@np.linalg.inv(U)
+    X, lambdas, its = cla_utils.block_pow_it(A, random.randn(m, 4), 1.0e-8,
+                                            1000)
+    assert(np.all(its > 0))
+    assert(cla_utils.norm(A@X - X*lambdas) < 1.0e-7)
+    assert(cla_utils.norm(lambdas - D[:4]) < 1.0e-6)
+
+
+@pytest.mark.parametrize('method', ['householder', 'GS'])
+def test_block_pow_it_maxit(method):
+    random.seed(1302)
+    m, k = 60, 4
+    A = random.randn(m, m)
+    A = 0.5*(A + A.T)
+    # maxit runs out before the eigenpairs lock, but the returned
+    # vectors are still the orthonormal Ritz vectors for lambdas
+    X, lambdas, its = cla_utils.block_pow_it(A, random.randn(m, k),
+                                            1.0e-10, 3, 1, method)
+    assert(np.any(its == -1))
+    assert(cla_utils.norm(X.T@X - np.eye(k)) < 1.0e-12)
+    assert(cla_utils.norm(X.T@A@X - np.diag(lambdas)) < 1.0e-12)
+    with pytest.raises(ValueError):
+        cla_utils.block_pow_it(A, random.randn(m, k), 1.0e-10, 0)
+
+
+@pytest.mark.parametrize('method', ['householder', 'GS'])
+def test_block_pow_it_batched(method):
+    random.seed(1302)
+    b, m, k = 10, 30, 3
+    A = random.randn(b, m, m)
+    A = A + np.swapaxes(A, 1, 2)
+    X0 = random.randn(b, m, k)
+    X, lambdas, its = cla_utils.block_pow_it(A, X0, 1.0e-6, 20000, 2,
+                                            method)
+    assert(X.shape == (b, m, k) and lambdas.shape == (b, k))
+    assert(np.all(its > 0))
+    for i in range(b):
+        assert(cla_utils.norm(A[i]@X[i] - X[i]*lambdas[i]) < 1.0e-5)
+        lambdas0 = np.linalg.eigvalsh(A[i])
+        lambdas0 = lambdas0[np.argsort(-np.abs(lambdas0))][:k]
+        assert(cla_utils.norm(lambdas[i] - lambdas0) < 1.0e-6)
 
 
 @pytest.mark.parametrize('m', [20, 204, 18])
@@ -32,6 +105,38 @@ def test_inverse_it(m):
     assert(cla_utils.norm(r - li*xi) < 1.0e-4)
 
 
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_inverse_it_shifts(executor):
+    m = 100
+    random.seed(1302*m)
+    A = random.randn(m, m)
+    A = 0.5*(A + np.conj(A).T)
+    e = np.linalg.eigvalsh(A)
+    x0 = random.randn(m)
+    mus = e[::20] + 1.0e-2
+    xs, ls = cla_utils.inverse_it(A, x0, mus, tol=1.0e-8, maxit=1000,
+                                  workers=2, executor=executor)
+    assert(len(xs) == len(mus) and len(ls) == len(mus))
+    for x, l, ll in zip(xs, ls, e[::20]):
+        assert(np.abs(ll - l) < 1.0e-6)
+        assert(cla_utils.norm(A@x - l*x) < 1.0e-6)
+    X, L = cla_utils.inverse_it(A, x0, mus[0], tol=1.0e-8, maxit=1000,
+                                store_iterations=True)
+    assert(X.shape == (m, len(L)))
+    assert(cla_utils.norm(X[:, -1] - xs[0]) < 1.0e-12)
+
+
+def test_inverse_it_nonhermitian():
+    m = 50
+    random.seed(1302*m)
+    A = random.randn(m, m)
+    e = np.linalg.eigvals(A)
+    x, l = cla_utils.inverse_it(A, random.randn(m), e[3] + 1.0e-2, 1.0e-8,
+                                1000)
+    assert(np.abs(l - e[3]) < 1.0e-6)
+    assert(cla_utils.norm(A@x - l*x) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m', [20, 204, 18])
 def test_rq_it(m):
     random.seed(1302*m)
@@ -45,6 +150,110 @@ def test_rq_it(m):
     assert(cla_utils.norm(r - li*xi) < 1.0e-4)
 
 
+@pytest.mark.parametrize('m', [20, 100])
+def test_iterate_history(m, tmp_path):
+    random.seed(1303*m)
+    A = random.randn(m, m)
+    A = 0.5*(A + A.T)
+    x0 = random.randn(m)
+    X, L = cla_utils.inverse_it(A, x0, mu=0.1, tol=1.0e-10, maxit=100,
+                                store_iterations=True)
+    nits = len(L)
+    # ring buffer of the most recent iterates
+    h = cla_utils.IterateHistory(maxlen=2)
+    xi, li = cla_utils.inverse_it(A, x0, mu=0.1, tol=1.0e-10, maxit=100,
+                                  store_iterations=h)
+    assert(h.X.shape == (m, min(2, nits)))
+    assert(cla_utils.norm(h.X[:, -1] - xi) < 1.0e-12 and li == L[-1])
+    assert(cla_utils.norm(h.X - X[:, -2:]) < 1.0e-12)
+    # every k-th iterate
+    h = cla_utils.IterateHistory(every=2)
+    cla_utils.inverse_it(A, x0, mu=0.1, tol=1.0e-10, maxit=100,
+                         store_iterations=h)
+    assert(np.all(h.iterations == np.arange(0, nits, 2)))
+    assert(cla_utils.norm(h.X - X[:, ::2]) < 1.0e-12)
+    assert(cla_utils.norm(h.lambdas - L[::2]) < 1.0e-12)
+    # spilled to a memory mapped file
+    h = cla_utils.IterateHistory(filename=str(tmp_path/"its.dat"), m=m)
+    xi, li = cla_utils.rq_it(A, x0, tol=1.0e-10, maxit=100,
+                             store_iterations=h)
+    X, L = cla_utils.rq_it(A, x0, tol=1.0e-10, maxit=100,
+                           store_iterations=True)
+    assert(isinstance(h.X, np.memmap))
+    assert(cla_utils.norm(h.X - X) < 1.0e-12)
+    # 40 power iterates (tol=0), overflowing the initial file size, and
+    # wrapping around a file ring of 5
+    X, _ = cla_utils.pow_it(A, x0, tol=0.0, maxit=40, store_iterations=True)
+    h = cla_utils.IterateHistory(filename=str(tmp_path/"all.dat"), m=m)
+    cla_utils.pow_it(A, x0, tol=0.0, maxit=40, store_iterations=h)
+    assert(cla_utils.norm(h.X - X) < 1.0e-12)
+    h = cla_utils.IterateHistory(maxlen=5, filename=str(tmp_path/"ring.dat"),
+                                 m=m)
+    cla_utils.pow_it(A, x0, tol=0.0, maxit=40, store_iterations=h)
+    assert((tmp_path/"ring.dat").stat().st_size == 5*m*8)
+    assert(np.all(h.iterations == np.arange(35, 40)))
+    assert(cla_utils.norm(h.X - X[:, -5:]) < 1.0e-12)
+    with pytest.raises(ValueError):
+        cla_utils.IterateHistory(filename=str(tmp_path/"its.dat"))
+    # streamed to a callback
+    seen = []
+    h = cla_utils.IterateHistory(
+        callback=lambda it, x, l: seen.append((it, np.linalg.norm(x))))
+    xi, li = cla_utils.pow_it(A, x0, tol=1.0e-10, maxit=50,
+                              store_iterations=h)
+    assert([it for it, _ in seen] == list(range(len(seen))))
+    assert(np.allclose([n for _, n in seen], 1.0))
+
+
+@pytest.mark.parametrize('m', [3, 10, 20])
+def test_batched_it(m):
+    random.seed(1304*m)
+    b = 50
+    A = random.randn(b, m, m)
+    A = A + np.swapaxes(A, 1, 2)
+    # the fixtures, and matrices with a dominant eigenvalue
+    A[0] = cla_utils.get_A3()[:m, :m] if m == 3 else A[0]
+    A[1] = cla_utils.get_B3()[:m, :m] if m == 3 else A[1]
+    B = A + 2*m*np.eye(m)
+    x0 = random.randn(m)
+    X, L = cla_utils.pow_it(B, x0, tol=1.0e-6, maxit=10000)
+    assert(X.shape == (b, m) and L.shape == (b,))
+    for i in range(b):
+        xi, li = cla_utils.pow_it(B[i], x0, tol=1.0e-6, maxit=10000)
+        assert(cla_utils.norm(X[i] - xi) < 1.0e-10)
+        assert(abs(L[i] - li) < 1.0e-10)
+    X0 = random.randn(b, m)
+    X, L = cla_utils.rq_it(A, X0, tol=1.0e-8, maxit=100)
+    for i in range(b):
+        assert(cla_utils.norm(A[i]@X[i] - L[i]*X[i]) < 1.0e-8)
+    with pytest.raises(ValueError):
+        cla_utils.rq_it(A, X0, tol=1.0e-8, maxit=100, store_iterations=True)
+    # with no iterations, both agree with the single entry points
+    for f in [cla_utils.pow_it, cla_utils.rq_it]:
+        X, L = f(A, X0, tol=1.0e-8, maxit=0)
+        for i in range(b):
+            xi, li = f(A[i], X0[i], tol=1.0e-8, maxit=0)
+            assert(cla_utils.norm(X[i] - xi) < 1.0e-12)
+            assert(abs(L[i] - li) < 1.0e-12)
+
+
+def test_rq_it_store_iterations():
+    m = 100
+    random.seed(1302*m)
+    A = random.randn(m, m)
+    x0 = random.randn(m)
+    X, L = cla_utils.rq_it(0.5*(A + A.T), x0, tol=1.0e-8, maxit=1000,
+                           store_iterations=True)
+    assert(X.shape == (m, len(L)))
+    xi, li = cla_utils.rq_it(0.5*(A + A.T), x0, tol=1.0e-8, maxit=1000)
+    assert(cla_utils.norm(X[:, -1] - xi) < 1.0e-12 and L[-1] == li)
+    # non-Hermitian A is reduced to Hessenberg form instead (with a
+    # complex start, as the eigenvalues may be complex)
+    xi, li = cla_utils.rq_it(A, x0 + 1j*random.randn(m), tol=1.0e-8,
+                             maxit=1000)
+    assert(cla_utils.norm(A@xi - li*xi) < 1.0e-6)
+
+
 @pytest.mark.parametrize('m', [20, 30, 18])
 def test_pure_QR(m):
     random.seed(1302*m)
@@ -59,6 +268,183 @@ def test_pure_QR(m):
     #check for conservation of trace
     assert(np.abs(np.trace(A) - np.trace(A2)) < 1.0e-6)
 
+
+@pytest.mark.parametrize('m', [2, 5, 40])
+@pytest.mark.parametrize('mu', [0.0, 0.7])
+def test_tridiagonal_qr_step(m, mu):
+    random.seed(1302*m)
+    T = cla_utils.Tridiagonal(random.randn(m), random.randn(m-1))
+    A = T.todense()
+    cla_utils.tridiagonal_qr_step(T, mu)
+    Q, R = np.linalg.qr(A - mu*np.eye(m))
+    A1 = R@Q + mu*np.eye(m)
+    # the QR factorisation is unique up to signs
+    assert(cla_utils.norm(np.abs(T.todense()) - np.abs(A1)) < 1.0e-8)
+
+
+@pytest.mark.parametrize('m', [20, 30, 18])
+def test_pure_QR_tridiagonal(m):
+    random.seed(1302*m)
+    # well separated eigenvalues so that unshifted QR converges quickly
+    e = np.arange(1, m+1) + 0.1*random.rand(m)
+    U, _ = np.linalg.qr(random.randn(m, m) + 1j*random.randn(m, m))
+    A = (U*e)@U.conj().T
+    T, _ = cla_utils.tridiagonalise(1.0*A)
+    T = cla_utils.pure_QR_tridiagonal(T, maxit=5000, tol=1.0e-8)
+    assert(cla_utils.norm(T.e) < 1.0e-8)
+    assert(cla_utils.norm(np.sort(T.d) - np.sort(e)) < 1.0e-6)
+
+    A0 = 1.0*A
+    A2 = cla_utils.pure_QR(A0, maxit=5000, tol=1.0e-8, shift=None)
+    assert(cla_utils.norm(A0 - A) == 0)
+    assert(cla_utils.norm(A2 - np.conj(A2).T) < 1.0e-4)
+    assert(cla_utils.norm(A2[np.tril_indices(m, -1)]) < 1.0e-8)
+    assert(np.abs(np.trace(A) - np.trace(A2)) < 1.0e-6)
+
+
+@pytest.mark.parametrize('m', [20, 101])
+def test_pure_QR_nonhermitian(m):
+    random.seed(1302*m)
+    A = random.randn(m, m)
+    A0 = 1.0*A
+    A2 = cla_utils.pure_QR(A0, maxit=1000, tol=1.0e-10)
+    assert(cla_utils.norm(A0 - A) == 0)
+    # a real matrix stays real, in quasi-triangular form
+    assert(not np.iscomplexobj(A2))
+    assert(cla_utils.norm(np.tril(A2, -2)) < 1.0e-10)
+    assert(np.abs(np.trace(A) - np.trace(A2)) < 1.0e-8)
+    with pytest.raises(ValueError):
+        cla_utils.pure_QR(A, maxit=1000, tol=1.0e-10, shift=None)
+
+
+@pytest.mark.parametrize('kind', ['real', 'complex'])
+@pytest.mark.parametrize('block_size', [1, 5, 16])
+def test_qr_sweep_blocks(kind, block_size):
+    from cla_utils.exercises9 import _francis_sweep, _single_shift_sweep
+    random.seed(4417)
+    m, l, hi = 45, 3, 40
+    H0 = np.triu(random.randn(m, m), -1)
+    if kind == 'complex':
+        H0 = H0 + 1j*np.triu(random.randn(m, m), -1)
+    H0[l, l-1] = H0[hi+1, hi] = 0
+    # one sweep over the window l:hi+1, as one block and in blocks
+    Hs = []
+    for nb in [m, block_size]:
+        H = 1.0*H0
+        Z = np.eye(m, dtype=H.dtype)
+        if kind == 'real':
+            _francis_sweep(H, l, hi, 0.3, 1.2, 0, m, Z, nb)
+        else:
+            _single_shift_sweep(H, l, hi, 0.3+0.1j, 0, m, Z, nb)
+        assert(cla_utils.norm(np.dot(Z.conj().T, Z) - np.eye(m)) < 1.0e-12)
+        assert(cla_utils.norm(np.dot(Z.conj().T, H0).dot(Z) - H) < 1.0e-12)
+        assert(cla_utils.norm(np.tril(H, -2)) < 1.0e-12)
+        Hs.append(H)
+    assert(cla_utils.norm(Hs[0] - Hs[1]) < 1.0e-12)
+
+
+@pytest.mark.parametrize('m', [1, 2, 3, 20, 101])
+@pytest.mark.parametrize('kind', ['real', 'complex', 'hermitian'])
+@pytest.mark.parametrize('shift', ['wilkinson', 'francis'])
+def test_shifted_QR(m, kind, shift):
+    random.seed(8821*m)
+    A = random.randn(m, m)
+    if kind == 'complex':
+        A = A + 1j*random.randn(m, m)
+    if kind == 'hermitian':
+        A = A + A.T
+    if shift == 'francis' and kind == 'complex':
+        with pytest.raises(ValueError):
+            cla_utils.shifted_QR(A, 1000, 1.0e-10, shift)
+        return
+    A0 = 1.0*A
+    lambdas, its = cla_utils.shifted_QR(A, 1000, 1.0e-10, shift)
+    assert(cla_utils.norm(A - A0) == 0)
+    # its counts the sweeps over all blocks, so the last is the total
+    assert(np.all(its >= 0) and its.max() < 10*m)
+    lambdas0 = np.linalg.eigvals(A)
+    dist = np.abs(lambdas[:, None] - lambdas0[None, :])
+    assert(np.max(np.min(dist, axis=0)) < 1.0e-6)
+    assert(np.max(np.min(dist, axis=1)) < 1.0e-6)
+
+    lambdas1, its1, T, Q = cla_utils.shifted_QR(A, 1000, 1.0e-10, shift,
+                                                schur=True)
+    assert(np.all(its1 == its))
+    assert(cla_utils.norm(Q.conj().T@Q - np.eye(m)) < 1.0e-6)
+    assert(cla_utils.norm(Q@T@Q.conj().T - A) < 1.0e-6)
+    k = -2 if shift == 'francis' and kind == 'real' else -1
+    assert(cla_utils.norm(T[np.tril_indices(m, k)]) < 1.0e-10)
+    assert(cla_utils.norm(cla_utils.schur_eigenvalues(T) - lambdas1) <
+           1.0e-10)
+
+
+def test_shifted_QR_maxit():
+    random.seed(8821)
+    A = random.randn(50, 50)
+    _, its = cla_utils.shifted_QR(A, 5, 1.0e-10)
+    assert(np.sum(its >= 0) < 50 and np.any(its == -1))
+
+
+@pytest.mark.parametrize('kind', ['real', 'complex', 'hermitian'])
+@pytest.mark.parametrize('maxit', [0, 1, 7, 100])
+@pytest.mark.parametrize('workers', [1, 3])
+def test_shifted_QR_budget(kind, maxit, workers, monkeypatch):
+    random.seed(2031)
+    m = 96
+    # clustered eigenvalues, so that deflation splits off many blocks
+    lambdas0 = np.repeat(np.arange(8.0), m//8) + 1.0e-3*random.randn(m)
+    U, _ = np.linalg.qr(random.randn(m, m))
+    D = np.diag(lambdas0)
+    if kind == 'real':
+        D += 0.1*np.triu(random.randn(m, m), 1)
+    if kind == 'complex':
+        D = D + 0.1*np.triu(random.randn(m, m) + 1j*random.randn(m, m), 1)
+    A = U@D@U.T
+    # count every sweep, on whichever block it is done
+    sweeps = []
+    for name in ['_francis_sweep', '_single_shift_sweep',
+                 'tridiagonal_qr_step']:
+        f = getattr(cla_utils.exercises9, name)
+        monkeypatch.setattr(cla_utils.exercises9, name,
+                            lambda *a, _f=f: sweeps.append(1) or _f(*a))
+    # each block split off must share the one budget
+    _, its = cla_utils.shifted_QR(A, maxit, 1.0e-10, min_block=8,
+                                  workers=workers, executor="thread")
+    assert(len(sweeps) <= maxit and np.all(its <= maxit))
+    assert(np.max(its) <= len(sweeps))
+    sweeps.clear()
+    Ak = cla_utils.pure_QR(A, maxit, 1.0e-10)
+    assert(len(sweeps) <= maxit)
+
+
+@pytest.mark.parametrize('hermitian', [True, False])
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_shifted_QR_workers(hermitian, executor):
+    random.seed(2031)
+    m = 96
+    # eight clusters of nearby eigenvalues, which split into many blocks
+    lambdas0 = np.repeat(np.arange(8.0), m//8) + 1.0e-3*random.randn(m)
+    U, _ = np.linalg.qr(random.randn(m, m))
+    D = np.diag(lambdas0)
+    if not hermitian:
+        D += 0.1*np.triu(random.randn(m, m), 1)
+    A = U@D@U.T
+    lambdas1, its1, T1, Q1 = cla_utils.shifted_QR(A, 1000, 1.0e-10,
+                                                  schur=True, min_block=8)
+    lambdas2, its2, T2, Q2 = cla_utils.shifted_QR(A, 1000, 1.0e-10,
+                                                  schur=True, workers=3,
+                                                  executor=executor,
+                                                  min_block=8)
+    assert(np.all(its1 >= 0))
+    assert(cla_utils.norm(lambdas1 - lambdas2) < 1.0e-12)
+    assert(cla_utils.norm(T1 - T2) < 1.0e-12)
+    assert(cla_utils.norm(Q1 - Q2) < 1.0e-12)
+    assert(cla_utils.norm(Q2@T2@Q2.conj().T - A) < 1.0e-6)
+    if hermitian:
+        assert(cla_utils.norm(np.sort(lambdas2) - np.sort(lambdas0)) <
+               1.0e-6)
+
+
 if __name__ == '__main__':
     import sys
     pytest.main(sys.argv)